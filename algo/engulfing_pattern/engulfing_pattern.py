@@ -12,6 +12,7 @@ df.isna().sum()
 
 # Engulfing pattern signals
 import random
+import numpy as np
 def Revsignal(df1):
   length = len(df1)
   high = list(df1['high'])
@@ -38,7 +39,73 @@ def Revsignal(df1):
       signal[row] = 0
   return signal
 
-df['signal1'] = Revsignal(df)
+def engulfing_codes(open_, close, bodydiffmin=0.003, starts=None):
+  """
+  Vectorized core of Revsignal: shifted-array comparisons instead of a row loop.
+  open_/close are 1-D arrays (oldest bar first, as Revsignal reads them).
+  bodydiffmin is a scalar or a per-bar array (see scaled_bodydiffmin).
+  starts lists the first row of each symbol when several symbols are
+  concatenated; those rows (and the row after, whose previous body is
+  treated as 0 just like bodydiff[0] in Revsignal) never signal.
+  Returns an int8 array with the Revsignal codes: 1 bearish, 2 bullish, 0 none.
+  """
+  open_ = np.asarray(open_, dtype=np.float64)
+  close = np.asarray(close, dtype=np.float64)
+  length = len(open_)
+  signal = np.zeros(length, dtype=np.int8)
+  if length < 2:
+    return signal
+
+  bodydiff = np.abs(open_ - close)
+  if starts is None:
+    starts = [0]
+  bodydiff[np.asarray(starts)] = 0  # Revsignal never computes bodydiff[0]
+  bodydiffmin = np.broadcast_to(np.asarray(bodydiffmin, dtype=np.float64), (length,))[1:]
+
+  o, c, bd = open_[1:], close[1:], bodydiff[1:]
+  o_prev, c_prev, bd_prev = open_[:-1], close[:-1], bodydiff[:-1]
+  big_bodies = (bd > bodydiffmin) & (bd_prev > bodydiffmin)
+
+  bearish = (big_bodies & (o_prev < c_prev) & (o > c)
+             & ((o - c_prev) >= +0e-5) & (c < o_prev))
+  bullish = (big_bodies & (o_prev > c_prev) & (o < c)
+             & ((o - c_prev) <= -0e-5) & (c > o_prev))
+  signal[1:][bullish] = 2
+  signal[1:][bearish] = 1
+
+  # The first row of every symbol never signals
+  signal[np.asarray(starts)] = 0
+  return signal
+
+def scaled_bodydiffmin(close, bodydiff_pct=0.0005):
+  """
+  The hard-coded 0.003 in Revsignal is an FX pip size. For stocks, scale the
+  minimum body to the instrument's price, e.g. 0.05% of the close.
+  """
+  return np.asarray(close, dtype=np.float64) * bodydiff_pct
+
+def Revsignal_vectorized(df1, bodydiffmin=0.003):
+  """Same signal codes as Revsignal, computed on whole columns."""
+  return engulfing_codes(df1['open'].to_numpy(), df1['close'].to_numpy(), bodydiffmin)
+
+def Revsignal_batch(frames, bodydiff_pct=None, bodydiffmin=0.003):
+  """
+  Engulfing signals for many symbols at once: {symbol: df} -> {symbol: codes}.
+  All symbols are concatenated and compared in a single vectorized pass.
+  With bodydiff_pct set, the minimum body is scaled to each bar's close.
+  """
+  symbols = list(frames)
+  lengths = [len(frames[s]) for s in symbols]
+  starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+  open_ = np.concatenate([frames[s]['open'].to_numpy(dtype=np.float64) for s in symbols])
+  close = np.concatenate([frames[s]['close'].to_numpy(dtype=np.float64) for s in symbols])
+  if bodydiff_pct is not None:
+    bodydiffmin = scaled_bodydiffmin(close, bodydiff_pct)
+
+  codes = engulfing_codes(open_, close, bodydiffmin, starts=starts[np.array(lengths) > 0])
+  return dict(zip(symbols, np.split(codes, starts[1:])))
+
+df['signal1'] = Revsignal_vectorized(df)
 df[df['signal1'] == 1].count()
 
 
@@ -67,7 +134,63 @@ def mytarget(df1, barsfront):
         trendcat[line] = 0  # no clear trend  
   return trendcat
 
-df['Trend'] = mytarget(df, 3)
+def mytarget_multi(df1, horizons, piplim=300e-5, chunk=65536):
+  """
+  Same labels as mytarget, for several barsfront horizons sharing one scan.
+
+  mytarget's answer for a bar is decided by the first look-ahead bar where
+  exactly one of (high breaks above the body) / (low breaks below the body)
+  happens: 1 = downtrend, 2 = uptrend. If no such bar is within the horizon,
+  the label comes from the last look-ahead bar: 3 if it broke both ways,
+  otherwise 0. The look-ahead windows are strided views (no copies) over the
+  next max(horizons) bars. Every bar is still compared against all of them,
+  so the scan is O(n * max(horizons)) time, done in NumPy `chunk` rows at a
+  time (chunk * max(horizons) booleans of memory) instead of nested Python
+  loops. The horizons share the scan: each one only adds O(n) for its labels.
+
+  Returns {barsfront: float array}; rows mytarget leaves as None are NaN.
+  """
+  horizons = sorted(set(horizons))
+  high = df1['high'].to_numpy(dtype=np.float64)
+  low = df1['low'].to_numpy(dtype=np.float64)
+  close = df1['close'].to_numpy(dtype=np.float64)
+  open_ = df1['open'].to_numpy(dtype=np.float64)
+  length = len(df1)
+  max_front = horizons[-1]
+
+  top = np.maximum(close, open_)
+  bottom = np.minimum(close, open_)
+  # windows[line] = high/low of bars line+1 .. line+max_front (NaN past the end)
+  pad = np.full(max_front, np.nan)
+  high_windows = np.lib.stride_tricks.sliding_window_view(np.concatenate([high[1:], pad]), max_front)
+  low_windows = np.lib.stride_tricks.sliding_window_view(np.concatenate([low[1:], pad]), max_front)
+
+  trendcat = {h: np.full(length, np.nan) for h in horizons}
+  for start in range(0, length, chunk):
+    stop = min(start + chunk, length)
+    up = (high_windows[start:stop] - top[start:stop, None]) > piplim
+    down = (bottom[start:stop, None] - low_windows[start:stop]) > piplim
+    one_way = up != down
+    first = np.where(one_way.any(axis=1), one_way.argmax(axis=1), max_front)
+    first_up = up[np.arange(stop - start), np.minimum(first, max_front - 1)]
+
+    for h in horizons:
+      last = h - 1
+      labels = np.where(
+        first < h,
+        np.where(first_up, 2, 1),
+        np.where(up[:, last] & down[:, last], 3, 0)
+      )
+      valid = min(stop, max(0, length - 1 - h))
+      if valid > start:
+        trendcat[h][start:valid] = labels[:valid - start]
+  return trendcat
+
+def mytarget_vectorized(df1, barsfront, piplim=300e-5):
+  """Drop-in for mytarget(df1, barsfront) (NaN where mytarget gives None)."""
+  return mytarget_multi(df1, [barsfront], piplim)[barsfront]
+
+df['Trend'] = mytarget_vectorized(df, 3)
 # df.head(30)
 
 
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
-import pandas as pd
-import ta
+import io
+import json
 import os
 
+import pandas as pd
+
+from indicator_kernels import compute_indicator_arrays
+from indicator_state import IndicatorState, INDICATOR_COLUMNS
+
 def round_numeric_columns(df, decimal_places=2):
   """
   将 DataFrame 中的所有数值列(除时间列外)保留到小数点后 decimal_places 位。
@@ -12,104 +17,226 @@ def round_numeric_columns(df, decimal_places=2):
     df[col] = df[col].round(decimal_places)
   return df
 
-def calculate_indicators(file_path):
+def check_columns(df):
   """
-  读取 CSV (不会修改原文件)，计算多个技术指标并将结果输出到新的 CSV 文件。
-  最终还会将所有数值列(除了 timestamp)保留小数点后两位。
+  必列检测 + 数值类型检测。
+  """
+  required_cols = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+  for col in required_cols:
+    if col not in df.columns:
+      raise KeyError(f"Missing required column: {col}")
+
+  for col in ['open', 'high', 'low', 'close', 'volume']:
+    if not pd.api.types.is_numeric_dtype(df[col]):
+      raise TypeError(f"Column {col} must be numeric")
+
+def compute_indicators(df, session_vwap=False):
+  """
+  在内存中计算指标 (不读写文件)，出错直接抛出异常。
+  df 为最新数据在上 (与 Alpha Vantage CSV 相同)，返回加了指标列的新 DataFrame，
+  指标未四舍五入。
   指标包括:
     - MACD_line, MACD_signal, MACD_histogram (默认参数, 无 window_sign)
     - SMA_50
     - EMA_200
     - RSI_14
     - ATR_14
-    - VWAP
+    - VWAP (14 根滑动窗口，与 ta 相同)
+    - Session_VWAP (session_vwap=True 时：按交易日锚定、每天开盘重置的 VWAP)
+    - Session_SMA_50 (session_vwap=True 时：不跨交易日的 SMA_50，每天前 49 根为 NaN)
   """
-  try:
-    # 1. 确认文件是否存在
-    if not os.path.exists(file_path):
-      raise FileNotFoundError(f"File not found: {file_path}")
-
-    # 2. 读取 CSV，解析日期列
-    df = pd.read_csv(file_path, parse_dates=['timestamp'])
-
-    # 3. 必列检测
-    required_cols = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
-    for col in required_cols:
-      if col not in df.columns:
-        raise KeyError(f"Missing required column: {col}")
-
-    # 4. 数值类型检测
-    for col in ['open', 'high', 'low', 'close', 'volume']:
-      if not pd.api.types.is_numeric_dtype(df[col]):
-        raise TypeError(f"Column {col} must be numeric")
-
-    # 5. 重置索引
-    df = df.reset_index(drop=True)
-
-    # 6. 内存中反转行顺序(把最早数据放在上)，便于正确计算滚动指标
-    df_rev = df.iloc[::-1].copy()
-
-    # 7. 计算各种指标 (在 df_rev 上做滚动计算)
-
-    # 如果 ta.trend.macd_* 不支持 window_sign，你可以省略它
-    df_rev['MACD_line'] = ta.trend.macd(df_rev['close'])
-    df_rev['MACD_signal'] = ta.trend.macd_signal(df_rev['close'])
-    df_rev['MACD_histogram'] = ta.trend.macd_diff(df_rev['close'])
+  # 3. 必列检测 + 4. 数值类型检测
+  check_columns(df)
+
+  # 5. 重置索引
+  df = df.reset_index(drop=True)
+
+  # 6. 反转为最早数据在前的数组 (只是视图，不复制 DataFrame)，便于正确计算滚动指标
+  high = df['high'].to_numpy(dtype='float64')[::-1]
+  low = df['low'].to_numpy(dtype='float64')[::-1]
+  close = df['close'].to_numpy(dtype='float64')[::-1]
+  volume = df['volume'].to_numpy(dtype='float64')[::-1]
+
+  # 7. 计算各种指标 (indicator_kernels 与 ta 逐位一致，但每条 EMA 只算一次)
+  # EMA_200 # TODO: not accurate
+  timestamps = df['timestamp'].to_numpy()[::-1] if session_vwap else None
+  indicators = compute_indicator_arrays(high, low, close, volume, timestamps)
+
+  # 8./9. 反转回原顺序（最新数据在上）并合并回原 df
+  for col, values in indicators.items():
+    df[col] = values[::-1]
+  return df
 
-    # SMA_50
-    df_rev['SMA_50'] = ta.trend.sma_indicator(df_rev['close'], window=50)
+def indicators_output_path(file_path):
+  base, ext = os.path.splitext(file_path)
+  return f"{base}_with_indicators{ext}"
 
-    # EMA_200 # TODO: not accurate
-    df_rev['EMA_200'] = ta.trend.ema_indicator(df_rev['close'], window=200)
+def calculate_indicators_file(file_path, session_vwap=False, oldest_first=False):
+  """
+  与 calculate_indicators 相同，但出错时直接抛出异常 (批量处理用)。
+  session_vwap=True 时多输出 Session_VWAP 和 Session_SMA_50 两列；
+  oldest_first=True 时输出最早数据在上 (增量模式在文件末尾追加新行)。
+  返回 (output_file, df)，df 为未四舍五入的结果。
+  """
+  # 1. 确认文件是否存在
+  if not os.path.exists(file_path):
+    raise FileNotFoundError(f"File not found: {file_path}")
 
-    # # Calculate the hlc3 source price
-    # df['hlc3'] = (df['high'] + df['low'] + df['close']) / 3
-    # # Reverse the source_price to match df_rev
-    # source_price_rev = df.iloc[::-1]['hlc3']
-    # # Calculate EMA on reversed source_price
-    # df_rev['EMA_200'] = ta.trend.ema_indicator(source_price_rev, window=200)
+  # 2. 读取 CSV，解析日期列
+  df = compute_indicators(pd.read_csv(file_path, parse_dates=['timestamp']), session_vwap)
 
+  # 10. 对所有数值列(非 timestamp)四舍五入到小数点后2位
+  df_rounded = round_numeric_columns(df.copy(), decimal_places=2)
 
+  # 11. 不覆盖原文件，而是新建 "_with_indicators" CSV
+  output_file = indicators_output_path(file_path)
+  if oldest_first:
+    df_rounded = df_rounded.iloc[::-1]
+  df_rounded.to_csv(output_file, index=False)
+  return output_file, df
 
-    # RSI_14
-    df_rev['RSI_14'] = ta.momentum.rsi(df_rev['close'], window=14)
+def calculate_indicators(file_path):
+  """
+  读取 CSV (不会修改原文件)，计算多个技术指标并将结果输出到新的 CSV 文件。
+  最终还会将所有数值列(除了 timestamp)保留小数点后两位。
+  指标见 compute_indicators。
+  """
+  try:
+    output_file, _ = calculate_indicators_file(file_path)
+    print(f"Indicators calculated and saved to: {output_file}")
 
-    # ATR_14
-    df_rev['ATR_14'] = ta.volatility.average_true_range(
-      df_rev['high'],
-      df_rev['low'],
-      df_rev['close'],
-      window=14
-    )
+  except Exception as e:
+    print(f"Error: {e}")
 
-    # VWAP
-    df_rev['VWAP'] = ta.volume.volume_weighted_average_price(
-      df_rev['high'],
-      df_rev['low'],
-      df_rev['close'],
-      df_rev['volume']
-    )
+def _state_file_path(file_path):
+  base, _ = os.path.splitext(file_path)
+  return f"{base}_with_indicators_state.json"
 
-    # 8. 将 df_rev 再反转回原顺序（最新数据在上）
-    df_final = df_rev.iloc[::-1].reset_index(drop=True)
+def _save_state(state_file, last_timestamp, state, output_bytes):
+  """
+  原子地写旁路状态文件 (先写临时文件再 os.replace)。
+  output_bytes 是输出 CSV 在这次提交后的字节数，下次启动时据此丢掉没提交完的行。
+  """
+  tmp_file = f"{state_file}.tmp"
+  with open(tmp_file, 'w') as f:
+    json.dump({'last_timestamp': last_timestamp, 'output_bytes': output_bytes,
+               'state': state.to_dict()}, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_file, state_file)
+
+def _build_state(file_path, state_file, output_file):
+  """
+  从头把整个 CSV 喂给 IndicatorState，保存旁路状态文件。
+  last_timestamp 保存原始 CSV 里最新一行的时间字符串 (不做解析)。
+  """
+  df = pd.read_csv(file_path, dtype={'timestamp': str})
+  check_columns(df)
+  state = IndicatorState()
+  df_rev = df.iloc[::-1]
+  for h, l, c, v in zip(df_rev['high'], df_rev['low'], df_rev['close'], df_rev['volume']):
+    state.update(h, l, c, v)
+  _save_state(state_file, df['timestamp'].iloc[0], state, os.path.getsize(output_file))
+
+def _recover_output(output_file, saved):
+  """
+  把输出 CSV 截回上次提交时的长度：追加新行之后、写状态之前崩溃的话，
+  多出来的行 (比状态里的 last_timestamp 新) 在这里丢掉，不会重复。
+  返回 False 表示输出与状态对不上 (文件比记录的短，或旧格式的状态)，需要整体重算。
+  """
+  output_bytes = saved.get('output_bytes')
+  size = os.path.getsize(output_file)
+  if output_bytes is None or size < output_bytes:
+    return False
+  if size > output_bytes:
+    print(f"Dropping {size - output_bytes} bytes of rows written after {saved['last_timestamp']}")
+    with open(output_file, 'r+b') as f:
+      f.truncate(output_bytes)
+  return True
+
+def _read_new_lines(file_path, last_timestamp):
+  """
+  CSV 是最新数据在上，所以只需从文件顶部读到上次处理过的那一行为止。
+  返回 (header, new_lines)；如果找不到 last_timestamp，new_lines 为 None。
+  """
+  new_lines = []
+  with open(file_path) as f:
+    header = f.readline()
+    for line in f:
+      if line.split(',', 1)[0] == last_timestamp:
+        return header, new_lines
+      new_lines.append(line)
+  return header, None
+
+def calculate_indicators_incremental(file_path):
+  """
+  增量模式：只为上次运行之后新加入的行计算指标。
+    - EMA 值、Wilder RSI/ATR 平均值、SMA 窗口、VWAP 滑动累计和
+      保存在 "_with_indicators_state.json" 旁路文件里
+    - 新行的计算量是 O(新行数)，结果与整体重算 (calculate_indicators) 完全一致
+    - "_with_indicators" 文件在增量模式下是最早数据在上，新行只追加在文件末尾，
+      不重写旧内容 (读取方按 timestamp 排序，两种顺序都能用)
+    - 先追加新行，再原子地写状态 (含 last_timestamp 和输出文件长度)；
+      两步之间崩溃的话，下次启动先把输出截回状态记录的长度，新行不会重复
+  第一次运行 (或者找不到旁路文件/上次的最后一行) 时退回整体重算并建立状态。
+  """
+  try:
+    if not os.path.exists(file_path):
+      raise FileNotFoundError(f"File not found: {file_path}")
 
-    # 9. 将新指标列合并回原 df
-    new_cols = [
-      'MACD_line','MACD_signal','MACD_histogram',
-      'SMA_50','EMA_200','RSI_14','ATR_14','VWAP'
+    output_file = indicators_output_path(file_path)
+    state_file = _state_file_path(file_path)
+
+    saved = None
+    if os.path.exists(output_file) and os.path.exists(state_file):
+      with open(state_file) as f:
+        saved = json.load(f)
+
+    header, new_lines = None, None
+    if saved is not None and _recover_output(output_file, saved):
+      header, new_lines = _read_new_lines(file_path, saved['last_timestamp'])
+    if new_lines is None:
+      print("No usable indicator state, running a full recompute...")
+      # 旧状态作废；整体重算出错时直接抛出，不会留下与输出 CSV 不一致的状态文件
+      if os.path.exists(state_file):
+        os.remove(state_file)
+      output_file, _ = calculate_indicators_file(file_path, oldest_first=True)
+      print(f"Indicators calculated and saved to: {output_file}")
+      _build_state(file_path, state_file, output_file)
+      return
+
+    if not new_lines:
+      print(f"No new rows since {saved['last_timestamp']}, nothing to do.")
+      return
+
+    # 1. 只解析新行
+    last_timestamp = new_lines[0].split(',', 1)[0]
+    df = pd.read_csv(io.StringIO(header + ''.join(new_lines)), parse_dates=['timestamp'])
+    check_columns(df)
+
+    # 2. 从旧状态继续计算 (最早的新行在前)
+    state = IndicatorState.from_dict(saved['state'])
+    df_rev = df.iloc[::-1]
+    values = [
+      state.update(h, l, c, v)
+      for h, l, c, v in zip(df_rev['high'], df_rev['low'], df_rev['close'], df_rev['volume'])
     ]
-    for col in new_cols:
-      df[col] = df_final[col]
-
-    # 10. 对所有数值列(非 timestamp)四舍五入到小数点后2位
+    df = df_rev.reset_index(drop=True)
+    df_ind = pd.DataFrame(values, columns=INDICATOR_COLUMNS)
+    for col in INDICATOR_COLUMNS:
+      df[col] = df_ind[col]
     df = round_numeric_columns(df, decimal_places=2)
 
-    # 11. 不覆盖原文件，而是新建 "_with_indicators" CSV
-    base, ext = os.path.splitext(file_path)
-    output_file = f"{base}_with_indicators{ext}"
-    df.to_csv(output_file, index=False)
+    # 3. 新行 (最早的在前) 追加在文件末尾，旧结果不动
+    with open(output_file, 'a', newline='') as out:
+      df.to_csv(out, index=False, header=False)
+      out.flush()
+      os.fsync(out.fileno())
 
-    print(f"Indicators calculated and saved to: {output_file}")
+    # 4. 提交：原子地写状态
+    _save_state(state_file, last_timestamp, state, os.path.getsize(output_file))
+
+    print(f"{len(df)} new rows calculated and saved to: {output_file}")
 
   except Exception as e:
     print(f"Error: {e}")
@@ -117,6 +244,7 @@ def calculate_indicators(file_path):
 if __name__ == '__main__':
   # 使用时替换为你的CSV文件路径
   file_path = './TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01.csv'
-  calculate_indicators(file_path)
+  # 增量模式：只计算新追加的行；想强制整体重算，改用 calculate_indicators(file_path)
+  calculate_indicators_incremental(file_path)
 
 
@@ -2,9 +2,10 @@
 
 # ========== ========== ========== ========== ==========
 # BEFORE you run this file:
-# Fill in SYMBOL, START_MONTH, and END_MONTH
-# Example: 
-#   SYMBOL = "TSLA"
+# Fill in SYMBOLS, START_MONTH, and END_MONTH
+# (or pass them on the command line, see --help)
+# Example:
+#   SYMBOLS = ["TSLA"]
 #   START_MONTH = "2023-12"
 #   END_MONTH   = "2024-06"
 # ========== ========== ========== ========== ==========
@@ -12,43 +13,116 @@
 # This script will query Alpha Vantage's TIME_SERIES_INTRADAY endpoint
 # with month=YYYY-MM, as per the new documentation that supports
 # fetching specific months of historical intraday data.
+#
+# Months are fetched concurrently by a small thread pool sharing one pooled
+# HTTP session. A token bucket keeps the request rate under the Alpha Vantage
+# quota, failed requests are retried with exponential backoff, and finished
+# months are recorded in a progress file so an interrupted backfill resumes
+# where it stopped. Responses go through the shared alphavantage_cache, so a
+# month that was already downloaded is never requested again.
 
 
 
-import requests
+import argparse
+import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from alphavantage_cache import AlphaVantageCache, DEFAULT_CACHE_DIR, DEFAULT_TTL_SECONDS, is_closed_month
 
 # Configuration
 API_KEY = "VIBBPSYNEUTGVC3H"  # Your Alpha Vantage key
 BASE_URL = "https://www.alphavantage.co/query"
 INTERVAL = "1min"        # 1min, 5min, 15min, 30min, or 60min
-SYMBOL = "TSLA"              # Leave blank if not ready to run
+SYMBOLS = ["TSLA"]       # Leave empty if not ready to run
 START_MONTH = "2023-12"  # e.g. "YYYY-MM"
 END_MONTH   = "2024-05"  # e.g. "YYYY-MM"
 
-# Display the command details and confirm with the user
-confirmation_message = (
-  f"You are about to fetch intraday data (1-min) from Alpha Vantage for '{SYMBOL}'\n"
-  f"from {START_MONTH} through {END_MONTH} (regular hours only), in CSV format.\n\n"
-  f"Is this correct and ready to proceed? (y to proceed, any other key to quit): "
-)
-confirmation = input(confirmation_message).strip().lower()
-if confirmation != "y":
-  print("Operation canceled.")
-  exit()
-
-def fetch_and_save_data(symbol, month, filename):
+# Alpha Vantage quota: free keys allow 5 requests/minute, premium keys more.
+REQUESTS_PER_MINUTE = 5
+WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 2.0
+
+# Output directory per symbol, e.g. ./TSLA/past_multiple_months
+OUTPUT_DIR_TEMPLATE = "./{symbol}/past_multiple_months"
+PROGRESS_FILE = ".fetch_progress.json"
+
+class TokenBucket:
   """
-  Fetch intraday 1-minute data for 'symbol' and 'month' (YYYY-MM),
-  saving the CSV data to 'filename'.
-  
-  This uses the documented month parameter in TIME_SERIES_INTRADAY.
+  Thread-safe token bucket. acquire() blocks until a token is available,
+  so at most `capacity` requests can burst and the long-run rate never
+  exceeds `rate_per_minute`.
+  """
+
+  def __init__(self, rate_per_minute, capacity=None):
+    self.rate = rate_per_minute / 60.0
+    self.capacity = capacity if capacity is not None else max(1, int(rate_per_minute))
+    self.tokens = float(self.capacity)
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+
+  def acquire(self):
+    while True:
+      with self.lock:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        wait = (1 - self.tokens) / self.rate
+      time.sleep(wait)
+
+class FetchError(Exception):
+  """A month could not be fetched (after retries, or a permanent API error)."""
+
+class ProgressFile:
+  """
+  Records finished (symbol, month) pairs so a restarted backfill skips them.
   """
-  params = {
+
+  def __init__(self, path):
+    self.path = path
+    self.lock = threading.Lock()
+    self.done = set()
+    if os.path.exists(path):
+      with open(path) as f:
+        self.done = set(json.load(f))
+
+  def is_done(self, symbol, month):
+    return f"{symbol}:{month}" in self.done
+
+  def mark_done(self, symbol, month):
+    with self.lock:
+      self.done.add(f"{symbol}:{month}")
+      tmp = f"{self.path}.tmp"
+      with open(tmp, "w") as f:
+        json.dump(sorted(self.done), f)
+      os.replace(tmp, self.path)
+
+def make_session(pool_size=WORKERS):
+  """
+  One HTTP session shared by all workers, so TCP/TLS connections are reused.
+  """
+  session = requests.Session()
+  adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+  session.mount("http://", adapter)
+  session.mount("https://", adapter)
+  return session
+
+def build_params(symbol, month, interval=INTERVAL, api_key=API_KEY):
+  return {
     "function": "TIME_SERIES_INTRADAY",
     "symbol": symbol,
-    "interval": INTERVAL,
-    "apikey": API_KEY,
+    "interval": interval,
+    "apikey": api_key,
     "datatype": "csv",
     # Per the docs you shared:
     #   adjusted=false => unadjusted (as-traded) prices
@@ -62,14 +136,82 @@ def fetch_and_save_data(symbol, month, filename):
     "outputsize": "full"
   }
 
-  response = requests.get(BASE_URL, params=params)
-  if response.status_code == 200:
-    # If you want each month in its own standalone CSV file, just write in "wb" mode:
-    with open(filename, "wb") as file:
-      file.write(response.content)
-    print(f"Data for month {month} saved to {filename}")
-  else:
-    print(f"Failed to fetch data for {month}: {response.status_code} - {response.text}")
+def check_csv_response(content):
+  """
+  With datatype=csv, Alpha Vantage still answers errors with HTTP 200 and a
+  JSON body. Returns None for a CSV payload, otherwise (retryable, message).
+  """
+  if content.lstrip()[:1] != b"{":
+    return None
+  try:
+    body = json.loads(content)
+  except ValueError:
+    return (True, content[:200].decode(errors="replace"))
+  if "Error Message" in body:
+    return (False, body["Error Message"])
+  # "Note" / "Information" are used for rate-limit and quota messages
+  return (True, body.get("Note") or body.get("Information") or str(body))
+
+def save_content(content, filename):
+  # Write to a temp file first so a crash never leaves a half-written month
+  tmp = f"{filename}.part"
+  with open(tmp, "wb") as file:
+    file.write(content)
+  os.replace(tmp, filename)
+
+def fetch_and_save_data(symbol, month, filename, session=None, limiter=None,
+                        base_url=BASE_URL, interval=INTERVAL, api_key=API_KEY,
+                        max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS, cache=None):
+  """
+  Fetch intraday data for 'symbol' and 'month' (YYYY-MM),
+  saving the CSV data to 'filename'.
+
+  This uses the documented month parameter in TIME_SERIES_INTRADAY.
+  Cached responses are served without touching the network or the rate
+  limiter. Network errors, HTTP 429/5xx and Alpha Vantage rate-limit notes are
+  retried with exponential backoff (plus jitter); anything else raises
+  FetchError.
+  """
+  params = build_params(symbol, month, interval, api_key)
+
+  if cache is not None:
+    content = cache.get(params)
+    if content is not None:
+      save_content(content, filename)
+      print(f"Data for {symbol} {month} saved to {filename} (cached)")
+      return filename
+    if cache.offline:
+      raise FetchError(f"Failed to fetch data for {symbol} {month}: not in cache (offline mode)")
+
+  session = session or make_session(1)
+  for attempt in range(max_retries + 1):
+    if limiter is not None:
+      limiter.acquire()
+
+    retryable, message = True, ""
+    try:
+      response = session.get(base_url, params=params, timeout=60)
+      if response.status_code == 200:
+        problem = check_csv_response(response.content)
+        if problem is None:
+          save_content(response.content, filename)
+          if cache is not None:
+            cache.put(params, response.content)
+          print(f"Data for {symbol} {month} saved to {filename}")
+          return filename
+        retryable, message = problem
+      else:
+        retryable = response.status_code == 429 or response.status_code >= 500
+        message = f"{response.status_code} - {response.text[:200]}"
+    except requests.RequestException as e:
+      message = str(e)
+
+    if not retryable or attempt == max_retries:
+      raise FetchError(f"Failed to fetch data for {symbol} {month}: {message}")
+
+    delay = backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+    print(f"Retrying {symbol} {month} in {delay:.1f}s ({message})")
+    time.sleep(delay)
 
 def months_in_range(start_str, end_str):
   """
@@ -90,14 +232,104 @@ def months_in_range(start_str, end_str):
       month = 1
       year += 1
 
-# Specify the output directory
-OUTPUT_DIR = "./TSLA/past_multiple_months"
+def month_filename(symbol, month, interval=INTERVAL, output_dir_template=OUTPUT_DIR_TEMPLATE):
+  output_dir = output_dir_template.format(symbol=symbol)
+  return os.path.join(output_dir, f"{symbol}_regular_hours_interval_{interval}_{month}.csv")
+
+def fetch_all(symbols, start_month, end_month, workers=WORKERS,
+              requests_per_minute=REQUESTS_PER_MINUTE, base_url=BASE_URL,
+              interval=INTERVAL, api_key=API_KEY,
+              output_dir_template=OUTPUT_DIR_TEMPLATE, progress_file=PROGRESS_FILE,
+              max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS, cache=None):
+  """
+  Fetch every (symbol, month) pair concurrently. Closed months already
+  recorded in the progress file are skipped, and pairs in the cache are
+  served from it. The current, still-open month is never recorded as done,
+  so every run sends it through the fetch/cache path (the cache TTL decides
+  when it is downloaded again).
+  Returns (fetched, skipped, failed) where failed
+  maps "SYMBOL:YYYY-MM" to the error message.
+  """
+  progress = ProgressFile(progress_file)
+  limiter = TokenBucket(requests_per_minute)
+  session = make_session(workers)
+
+  jobs = []
+  skipped = 0
+  for symbol in symbols:
+    os.makedirs(output_dir_template.format(symbol=symbol), exist_ok=True)
+    for m in months_in_range(start_month, end_month):
+      filename = month_filename(symbol, m, interval, output_dir_template)
+      if is_closed_month(m) and progress.is_done(symbol, m) and os.path.exists(filename):
+        skipped += 1
+        continue
+      jobs.append((symbol, m, filename))
+
+  fetched = 0
+  failed = {}
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    futures = {
+      pool.submit(fetch_and_save_data, symbol, m, filename, session, limiter,
+                  base_url, interval, api_key, max_retries, backoff, cache): (symbol, m)
+      for symbol, m, filename in jobs
+    }
+    for future in as_completed(futures):
+      symbol, m = futures[future]
+      try:
+        future.result()
+        if is_closed_month(m):
+          progress.mark_done(symbol, m)
+        fetched += 1
+      except FetchError as e:
+        failed[f"{symbol}:{m}"] = str(e)
+        print(e)
+
+  print(f"Done: {fetched} fetched, {skipped} already on disk, {len(failed)} failed.")
+  if cache is not None:
+    print(cache.report())
+  return fetched, skipped, failed
+
+def main():
+  parser = argparse.ArgumentParser(description="Backfill Alpha Vantage intraday months.")
+  parser.add_argument("--symbols", nargs="+", default=SYMBOLS)
+  parser.add_argument("--start", default=START_MONTH, help="YYYY-MM")
+  parser.add_argument("--end", default=END_MONTH, help="YYYY-MM")
+  parser.add_argument("--interval", default=INTERVAL)
+  parser.add_argument("--workers", type=int, default=WORKERS)
+  parser.add_argument("--rate", type=float, default=REQUESTS_PER_MINUTE, help="requests per minute")
+  parser.add_argument("--base-url", default=BASE_URL)
+  parser.add_argument("--progress-file", default=PROGRESS_FILE)
+  parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+  parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL_SECONDS,
+                      help="seconds before the current month is re-fetched")
+  parser.add_argument("--offline", action="store_true", help="serve from the cache only")
+  parser.add_argument("--no-cache", action="store_true")
+  parser.add_argument("-y", "--yes", action="store_true", help="do not ask for confirmation")
+  args = parser.parse_args()
+
+  if not args.yes:
+    # Display the command details and confirm with the user
+    confirmation_message = (
+      f"You are about to fetch intraday data ({args.interval}) from Alpha Vantage for {args.symbols}\n"
+      f"from {args.start} through {args.end} (regular hours only), in CSV format.\n\n"
+      f"Is this correct and ready to proceed? (y to proceed, any other key to quit): "
+    )
+    confirmation = input(confirmation_message).strip().lower()
+    if confirmation != "y":
+      print("Operation canceled.")
+      return 0
 
-# Ensure the output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+  cache = None
+  if not args.no_cache:
+    cache = AlphaVantageCache(args.cache_dir, ttl_seconds=args.cache_ttl, offline=args.offline)
 
-# Fetch data for each month from START_MONTH to END_MONTH inclusive
-for m in months_in_range(START_MONTH, END_MONTH):
-  filename = os.path.join(OUTPUT_DIR, f"{SYMBOL}_regular_hours_interval_{INTERVAL}_{m}.csv")
-  fetch_and_save_data(SYMBOL, m, filename)
+  _, _, failed = fetch_all(
+    args.symbols, args.start, args.end,
+    workers=args.workers, requests_per_minute=args.rate,
+    base_url=args.base_url, interval=args.interval,
+    progress_file=args.progress_file, cache=cache,
+  )
+  return 1 if failed else 0
 
+if __name__ == "__main__":
+  raise SystemExit(main())
@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
-import requests
+import os
+import sys
+
+# shared Alpha Vantage response cache lives one directory up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from alphavantage_cache import AlphaVantageCache, fetch_csv
 
 # Configuration
 API_KEY = "VIBBPSYNEUTGVC3H"
@@ -24,15 +29,16 @@ params = {
   "extended_hours": "false"  # Only fetch data for regular trading hours
 }
 
-# Fetch the data
-response = requests.get(BASE_URL, params=params)
+OFFLINE = False  # True => only serve from the local cache, never call the API
+
+# Fetch the data (a closed month is only ever downloaded once)
+cache = AlphaVantageCache(offline=OFFLINE)
+content = fetch_csv(BASE_URL, params, cache)
 
-# Check if the request was successful
-if response.status_code == 200:
+if content is not None:
   # Save the CSV data to a file
   filename = f"{SYMBOL}_regular_hours_{MONTH}.csv"
   with open(filename, "wb") as file:
-    file.write(response.content)
+    file.write(content)
   print(f"Data saved to {filename}")
-else:
-  print(f"Failed to fetch data: {response.status_code} - {response.text}")
+print(cache.report())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+# Local cache for Alpha Vantage responses, shared by GET_TICKER_DATA.py,
+# TSLA/get_tesla.py and test/GET_DATA_alphavantage/get_tesla.py.
+#
+# Layout (content-addressed):
+#   <cache_dir>/objects/ab/abcdef...   raw response bytes, named by their sha256
+#   <cache_dir>/index/<key_sha>.json   request key -> content sha + fetch time
+#
+# A request key is (function, symbol, interval, month, adjusted, extended_hours)
+# plus outputsize/datatype, which also change the payload. The API key is not
+# part of it. Closed months never expire. The current month and "latest"
+# requests (no month) expire after ttl_seconds.
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+DEFAULT_CACHE_DIR = os.environ.get(
+  "AV_CACHE_DIR",
+  os.path.join(os.path.dirname(os.path.abspath(__file__)), ".av_cache")
+)
+DEFAULT_TTL_SECONDS = 3600
+
+# Alpha Vantage defaults, so omitted and explicit parameters share one entry
+_PARAM_DEFAULTS = {
+  "interval": None,
+  "month": None,
+  "adjusted": "true",
+  "extended_hours": "true",
+  "outputsize": "compact",
+  "datatype": "json",
+}
+
+class CacheMiss(Exception):
+  """Raised in offline mode when a request is not in the cache."""
+
+def cache_key(params):
+  """
+  Canonical cache key for a request's parameters (api key excluded).
+  """
+  key = {"function": params["function"], "symbol": params["symbol"].upper()}
+  for name, default in _PARAM_DEFAULTS.items():
+    value = params.get(name, default)
+    key[name] = str(value).lower() if value is not None else None
+  return key
+
+def is_closed_month(month, today=None):
+  """
+  True if 'YYYY-MM' is strictly before the current month, i.e. its data can no
+  longer change.
+  """
+  if not month:
+    return False
+  today = today or datetime.date.today()
+  year, mon = map(int, month.split("-"))
+  return (year, mon) < (today.year, today.month)
+
+class AlphaVantageCache:
+  """
+  Content-addressed response cache with hit/miss statistics.
+
+  get(params)             -> cached bytes or None
+  put(params, content)    -> store a successful response
+  fetch(params, fetch_fn) -> get(), falling back to fetch_fn() on a miss
+
+  With offline=True, misses raise CacheMiss instead of calling the network.
+  """
+
+  def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS, offline=False):
+    self.cache_dir = cache_dir
+    self.ttl_seconds = ttl_seconds
+    self.offline = offline
+    self.hits = 0
+    self.misses = 0
+    self.stale = 0
+    self._lock = threading.Lock()
+    os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+    os.makedirs(os.path.join(cache_dir, "index"), exist_ok=True)
+
+  def _index_path(self, key):
+    key_sha = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    return os.path.join(self.cache_dir, "index", f"{key_sha}.json")
+
+  def _object_path(self, content_sha):
+    return os.path.join(self.cache_dir, "objects", content_sha[:2], content_sha)
+
+  def _count(self, name):
+    with self._lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def get(self, params):
+    key = cache_key(params)
+    index_path = self._index_path(key)
+    try:
+      with open(index_path) as f:
+        entry = json.load(f)
+      fresh = (
+        is_closed_month(key["month"])
+        or time.time() - entry["fetched_at"] < self.ttl_seconds
+      )
+      if not fresh and not self.offline:
+        self._count("stale")
+        self._count("misses")
+        return None
+      with open(self._object_path(entry["content"]), "rb") as f:
+        content = f.read()
+    except (OSError, ValueError, KeyError):
+      self._count("misses")
+      return None
+    self._count("hits")
+    return content
+
+  def put(self, params, content):
+    key = cache_key(params)
+    content_sha = hashlib.sha256(content).hexdigest()
+    object_path = self._object_path(content_sha)
+    if not os.path.exists(object_path):
+      os.makedirs(os.path.dirname(object_path), exist_ok=True)
+      tmp = f"{object_path}.{threading.get_ident()}.tmp"
+      with open(tmp, "wb") as f:
+        f.write(content)
+      os.replace(tmp, object_path)
+
+    index_path = self._index_path(key)
+    tmp = f"{index_path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+      json.dump({"key": key, "content": content_sha, "fetched_at": time.time()}, f)
+    os.replace(tmp, index_path)
+
+  def fetch(self, params, fetch_fn):
+    """
+    Return cached bytes for params, or call fetch_fn() (which must return the
+    response bytes, or None if the response should not be cached) on a miss.
+    """
+    content = self.get(params)
+    if content is not None:
+      return content
+    if self.offline:
+      raise CacheMiss(f"Not in cache (offline mode): {cache_key(params)}")
+    content = fetch_fn()
+    if content is not None:
+      self.put(params, content)
+    return content
+
+  def report(self):
+    total = self.hits + self.misses
+    rate = self.hits / total if total else 0.0
+    return (f"Cache: {self.hits} hits, {self.misses} misses "
+            f"({self.stale} stale), hit rate {rate:.0%}")
+
+def fetch_csv(url, params, cache):
+  """
+  Cache-aware GET for the standalone download scripts. Returns the CSV bytes,
+  or None after printing why: an HTTP error, an Alpha Vantage error/rate-limit
+  message (sent as JSON even for datatype=csv), or a miss in offline mode.
+  """
+  def download():
+    response = requests.get(url, params=params, timeout=60)
+    if response.status_code != 200:
+      print(f"Failed to fetch data: {response.status_code} - {response.text}")
+      return None
+    if response.content.lstrip()[:1] == b"{":
+      print(f"Failed to fetch data: {response.text}")
+      return None
+    return response.content
+
+  try:
+    return cache.fetch(params, download)
+  except CacheMiss:
+    print(f"Failed to fetch data: {params['symbol']} {params.get('month') or 'latest'} "
+          f"is not in the cache at {cache.cache_dir} and offline mode is on")
+    return None
+  except requests.RequestException as e:
+    print(f"Failed to fetch data: {e}")
+    return None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import numpy as np
+
+from signal_engine import BUY, SELL
+
+def trade_indices(codes, initial_balance=10000):
+  """
+  找出真正成交的行号 (BUY, SELL, BUY, SELL ... 交替)。
+
+  全进全出的规则下，BUY 只在空仓 (balance > 0) 时成交，
+  SELL 只在持仓 (position > 0) 时成交，
+  因此某个非 HOLD 信号成交，当且仅当它与上一个非 HOLD 信号不同
+  (开始时视为空仓，即上一个信号为 SELL)。
+  """
+  codes = np.asarray(codes, dtype=np.int8)
+  if initial_balance <= 0:
+    return np.empty(0, dtype=np.int64)
+
+  nz = np.flatnonzero(codes)
+  if len(nz) == 0:
+    return nz
+  c = codes[nz]
+  prev = np.empty_like(c)
+  prev[0] = SELL
+  prev[1:] = c[:-1]
+  return nz[c != prev]
+
+def backtest_arrays(close, codes, initial_balance=10000):
+  """
+  数组版回测内核 (全进全出，按收盘价成交)，与 backtest_portfolio 的逐行逻辑一致：
+    - BUY 且 balance > 0:  position = balance / close, balance = 0
+    - SELL 且 position > 0: balance = position * close, position = 0
+    - Portfolio_Value = balance if balance > 0 else position * close
+
+  参数:
+    close  float64 收盘价数组 (最早的数据在前)
+    codes  int8 信号数组 (BUY=1, SELL=-1, HOLD=0)
+
+  返回值: (balance, position, portfolio_value, trades)
+    前三个是与 close 等长的 float64 数组，trades 是成交行号数组
+  """
+  close = np.ascontiguousarray(close, dtype=np.float64)
+  trades = trade_indices(codes, initial_balance)
+
+  # 每笔成交之后的现金/持仓，只需在成交处循环 (成交数远小于行数)
+  cash = np.empty(len(trades) + 1, dtype=np.float64)
+  shares = np.zeros(len(trades) + 1, dtype=np.float64)
+  cash[0] = initial_balance
+  for k, idx in enumerate(trades):
+    if codes[idx] == BUY:
+      shares[k + 1] = cash[k] / close[idx]
+      cash[k + 1] = 0.0
+    else:
+      cash[k + 1] = shares[k] * close[idx]
+      shares[k + 1] = 0.0
+
+  # 每一行属于第几段 (第几笔成交之后)
+  seg = np.zeros(len(close), dtype=np.int64)
+  seg[trades] = 1
+  seg = np.cumsum(seg)
+
+  balance = cash[seg]
+  position = shares[seg]
+  portfolio_value = np.where(balance > 0, balance, position * close)
+  return balance, position, portfolio_value, trades
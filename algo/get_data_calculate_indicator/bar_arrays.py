@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# 固定布局的二进制 K 线文件 (.bars)，回测进程用内存映射 (mmap) 直接读取，
+# 多个进程共享页缓存里的同一份物理内存，启动时间与历史长度无关。
+#
+# 文件布局:
+#   8 字节    魔数 b'BARS0001'
+#   8 字节    头部长度 (uint64, little-endian)
+#   头部      JSON: {"n_rows": N, "columns": [{"name", "dtype", "offset"}, ...]}
+#   数据      每列一段连续数组，按 64 字节对齐
+#
+# 转换:
+#   python bar_arrays.py ./TSLA/..._with_indicators.csv ./TSLA/TSLA_1min.bars
+
+import json
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'BARS0001'
+ALIGN = 64
+
+# 回测用到的列: 时间戳 (int64 ns)、OHLCV、指标
+DEFAULT_COLUMNS = [
+  'timestamp', 'open', 'high', 'low', 'close', 'volume',
+  'MACD_line', 'MACD_signal', 'MACD_histogram',
+  'SMA_50', 'EMA_200', 'RSI_14', 'ATR_14', 'VWAP', 'Session_VWAP', 'Session_SMA_50'
+]
+
+def _align(n):
+  return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def write_bar_arrays(path, arrays):
+  """
+  把 {列名: 一维数组} 写成 .bars 文件 (所有列长度必须相同)。
+  """
+  arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+  lengths = {len(arr) for arr in arrays.values()}
+  if len(lengths) != 1:
+    raise ValueError(f"All columns must have the same length, got {lengths}")
+  n_rows = lengths.pop()
+
+  # 先用占位的 offset 估计头部长度，再回填真实 offset
+  columns = [{'name': name, 'dtype': arr.dtype.str, 'offset': 0} for name, arr in arrays.items()]
+  header = json.dumps({'n_rows': n_rows, 'columns': columns}).encode()
+  header_len = len(header) + 32 * len(columns)  # 给 offset 数字留出位置
+  offset = _align(len(MAGIC) + 8 + header_len)
+  for col, arr in zip(columns, arrays.values()):
+    col['offset'] = offset
+    offset = _align(offset + arr.nbytes)
+  header = json.dumps({'n_rows': n_rows, 'columns': columns}).encode().ljust(header_len)
+
+  with open(path, 'wb') as f:
+    f.write(MAGIC)
+    f.write(struct.pack('<Q', header_len))
+    f.write(header)
+    for col, arr in zip(columns, arrays.values()):
+      f.seek(col['offset'])
+      f.write(arr.tobytes())
+    f.truncate(offset)
+
+def open_bar_arrays(path):
+  """
+  以只读内存映射打开 .bars 文件，返回 {列名: 只读 NumPy 数组}。
+  不复制数据：数组直接指向页缓存，多个进程打开同一文件共享同一份内存。
+  """
+  with open(path, 'rb') as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f"Not a .bars file: {path}")
+    header_len = struct.unpack('<Q', f.read(8))[0]
+    header = json.loads(f.read(header_len))
+
+  mm = np.memmap(path, mode='r')
+  n_rows = header['n_rows']
+  return {
+    col['name']: np.ndarray((n_rows,), dtype=np.dtype(col['dtype']), buffer=mm, offset=col['offset'])
+    for col in header['columns']
+  }
+
+def indicator_csv_to_arrays(csv_path, columns=None):
+  """
+  读取 _with_indicators CSV (最新在上或最早在上都可以)，转成最早数据在前的数组字典。
+  timestamp 转成 int64 纳秒，其余列为 float64 (volume 为 int64)。
+  """
+  df = pd.read_csv(csv_path)
+  columns = [c for c in (columns or DEFAULT_COLUMNS) if c in df.columns]
+  df['timestamp'] = pd.to_datetime(df['timestamp'])
+  df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+  arrays = {}
+  for name in columns:
+    if name == 'timestamp':
+      arrays[name] = df[name].astype('datetime64[ns]').to_numpy().view(np.int64)
+    elif name == 'volume':
+      arrays[name] = df[name].to_numpy(dtype=np.int64)
+    else:
+      arrays[name] = df[name].to_numpy(dtype=np.float64)
+  return arrays
+
+def convert_indicator_csv(csv_path, bars_path, columns=None):
+  arrays = indicator_csv_to_arrays(csv_path, columns)
+  write_bar_arrays(bars_path, arrays)
+  print(f"{len(arrays['close'])} rows x {len(arrays)} columns saved to: {bars_path}")
+
+if __name__ == '__main__':
+  if len(sys.argv) != 3:
+    print("Usage: python bar_arrays.py <with_indicators.csv> <output.bars>")
+    sys.exit(1)
+  convert_indicator_csv(sys.argv[1], sys.argv[2])
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# Real-time bar recorder: IBKR streaming bars for a watchlist -> 1-minute
+# OHLCV bars in the bar store (the "file1.py" step of the workflow).
+#
+# - Sources: reqRealTimeBars (5-second bars, aggregated into 1-minute bars)
+#   or reqHistoricalData(keepUpToDate=True) with 1-minute bars (each update
+#   replaces the still-forming minute). IB limits concurrent real-time bar
+#   subscriptions, so use the historical source for large watchlists.
+# - The IBKR reader thread only puts tuples on a bounded queue (bursts are
+#   absorbed there; if it is ever full the bar is dropped and counted rather
+#   than stalling the reader). A single writer thread aggregates and
+#   group-commits: every COMMIT_SECONDS all completed minutes of all symbols
+#   are written in one pass, one bar_store.append_bars call per symbol. Each
+#   commit only writes a new small segment file, so its cost stays the same
+#   all month; a separate compaction thread folds the segments into the month
+#   partitions every COMPACT_SECONDS (and once more on stop).
+# - A failed write (disk full, permissions, ...) is printed and counted; the
+#   minutes stay pending and are retried on the next commit, so the writer
+#   thread keeps draining the queue.
+# - Memory stays flat with the number of symbols: one forming minute per
+#   symbol plus the completed minutes since the last commit.
+# - Times from IBKR are UTC epoch seconds; they are stored as naive
+#   America/New_York wall-clock like the Alpha Vantage bars.
+#
+# Usage:
+#   python bar_recorder.py TSLA AAPL NVDA --store ./bar_store
+#   python bar_recorder.py --replay bars_5s.csv --store ./bar_store   # symbol,time,open,high,low,close,volume
+
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import bar_store
+
+EXCHANGE_TZ = "America/New_York"
+QUEUE_SIZE = 100000
+COMMIT_SECONDS = 30
+COMPACT_SECONDS = 15 * 60
+FIRST_REQ_ID = 5000
+
+class MinuteAggregator:
+  """
+  Per-symbol forming minute bar. add() merges a sub-minute bar, set_minute()
+  replaces the whole minute (keepUpToDate updates); both return the minute
+  that just completed as (minute_epoch_s, o, h, l, c, v), or None.
+  """
+  def __init__(self):
+    self.current = {}   # symbol -> [minute, open, high, low, close, volume]
+    self.out_of_order = 0
+
+  def add(self, symbol, epoch_s, open_, high, low, close, volume):
+    minute = int(epoch_s) // 60 * 60
+    bar = self.current.get(symbol)
+    if bar is not None and minute == bar[0]:
+      bar[2] = max(bar[2], high)
+      bar[3] = min(bar[3], low)
+      bar[4] = close
+      bar[5] += volume
+      return None
+    return self._start(symbol, bar, [minute, open_, high, low, close, volume])
+
+  def set_minute(self, symbol, epoch_s, open_, high, low, close, volume):
+    minute = int(epoch_s) // 60 * 60
+    bar = self.current.get(symbol)
+    if bar is not None and minute == bar[0]:
+      bar[1:] = [open_, high, low, close, volume]
+      return None
+    return self._start(symbol, bar, [minute, open_, high, low, close, volume])
+
+  def _start(self, symbol, bar, new_bar):
+    if bar is not None and new_bar[0] < bar[0]:
+      self.out_of_order += 1
+      return None
+    self.current[symbol] = new_bar
+    return tuple(bar) if bar is not None else None
+
+  def flush(self):
+    """Close every forming minute (shutdown)."""
+    done = [(symbol, tuple(bar)) for symbol, bar in self.current.items()]
+    self.current.clear()
+    return done
+
+def minutes_to_frame(rows):
+  """[(minute_epoch_s, o, h, l, c, v), ...] -> bar_store DataFrame (exchange wall-clock)."""
+  arr = np.array(rows, dtype=np.float64)
+  ts = pd.to_datetime(arr[:, 0].astype(np.int64), unit="s", utc=True).tz_convert(EXCHANGE_TZ).tz_localize(None)
+  return pd.DataFrame({
+    "timestamp": ts,
+    "open": arr[:, 1],
+    "high": arr[:, 2],
+    "low": arr[:, 3],
+    "close": arr[:, 4],
+    "volume": arr[:, 5].astype(np.int64),
+  })
+
+class BarRecorder:
+  """
+  Queue + writer thread. Producers call on_bar (sub-minute bars) or
+  on_minute_bar (forming 1-minute bars) from any thread.
+  """
+  def __init__(self, store_dir=bar_store.DEFAULT_STORE_DIR, commit_seconds=COMMIT_SECONDS,
+               queue_size=QUEUE_SIZE, compact_seconds=COMPACT_SECONDS):
+    self.store_dir = store_dir
+    self.commit_seconds = commit_seconds
+    self.compact_seconds = compact_seconds
+    self.queue = queue.Queue(maxsize=queue_size)
+    self.aggregator = MinuteAggregator()
+    self.pending = {}   # symbol -> completed minutes not yet written
+    self.symbols = set()   # symbols with segments written (to compact)
+    self.stats = {"bars": 0, "dropped": 0, "minutes": 0, "commits": 0, "errors": 0, "compactions": 0}
+    self._symbols_lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+    self._compactor = None
+
+  def on_bar(self, symbol, epoch_s, open_, high, low, close, volume):
+    self._put((False, symbol, epoch_s, open_, high, low, close, volume))
+
+  def on_minute_bar(self, symbol, epoch_s, open_, high, low, close, volume):
+    self._put((True, symbol, epoch_s, open_, high, low, close, volume))
+
+  def _put(self, item, block=False):
+    try:
+      self.queue.put(item, block=block)
+    except queue.Full:
+      self.stats["dropped"] += 1
+
+  def start(self):
+    self._thread = threading.Thread(target=self._run, name="bar-recorder", daemon=True)
+    self._thread.start()
+    self._compactor = threading.Thread(target=self._run_compactor, name="bar-compactor", daemon=True)
+    self._compactor.start()
+    return self
+
+  def stop(self):
+    """Drain the queue, close the forming minutes, commit them and compact."""
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+    if self._compactor is not None:
+      self._compactor.join()
+    self.compact()
+
+  def _handle(self, item):
+    replace, symbol, epoch_s, open_, high, low, close, volume = item
+    add = self.aggregator.set_minute if replace else self.aggregator.add
+    done = add(symbol, epoch_s, float(open_), float(high), float(low), float(close), float(volume))
+    self.stats["bars"] += 1
+    if done is not None:
+      self.pending.setdefault(symbol, []).append(done)
+
+  def _run(self):
+    last_commit = time.monotonic()
+    while not (self._stop.is_set() and self.queue.empty()):
+      try:
+        self._handle(self.queue.get(timeout=0.5))
+        # drain whatever else is queued before looking at the clock
+        while True:
+          self._handle(self.queue.get_nowait())
+      except queue.Empty:
+        pass
+      if time.monotonic() - last_commit >= self.commit_seconds:
+        self.commit()
+        last_commit = time.monotonic()
+
+    for symbol, bar in self.aggregator.flush():
+      self.pending.setdefault(symbol, []).append(bar)
+    self.commit()
+
+  def commit(self):
+    """
+    Group commit: append all completed minutes of all symbols. A symbol whose
+    write fails keeps its minutes pending for the next commit.
+    """
+    pending, self.pending = self.pending, {}
+    written = False
+    for symbol, rows in pending.items():
+      try:
+        bar_store.append_bars(self.store_dir, symbol, minutes_to_frame(rows))
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"Recorder: writing {len(rows)} minutes of {symbol} failed, will retry: {type(e).__name__}: {e}")
+        self.pending[symbol] = rows + self.pending.get(symbol, [])
+        continue
+      self.stats["minutes"] += len(rows)
+      written = True
+      with self._symbols_lock:
+        self.symbols.add(symbol)
+    if written:
+      self.stats["commits"] += 1
+
+  def compact(self):
+    """Fold the appended segments of every recorded symbol into its month partitions."""
+    with self._symbols_lock:
+      symbols = sorted(self.symbols)
+    for symbol in symbols:
+      try:
+        bar_store.compact(self.store_dir, symbol)
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"Recorder: compacting {symbol} failed, will retry: {type(e).__name__}: {e}")
+        continue
+      self.stats["compactions"] += 1
+
+  def _run_compactor(self):
+    while not self._stop.wait(self.compact_seconds):
+      self.compact()
+
+def replay(recorder, bars):
+  """
+  Feed an iterable of (symbol, epoch_s, open, high, low, close, volume)
+  sub-minute bars through the recorder, as IBKR would (but waiting for room
+  in the queue instead of dropping, since a replay is faster than real time).
+  """
+  for bar in bars:
+    recorder._put((False,) + tuple(bar), block=True)
+
+def replay_csv(recorder, csv_path):
+  df = pd.read_csv(csv_path)
+  replay(recorder, df[["symbol", "time", "open", "high", "low", "close", "volume"]].itertuples(index=False))
+
+def record_live(symbols, recorder, source="realtime", use_rth=True):
+  """
+  Subscribe to IBKR bars for symbols through a pooled connection and feed the
+  recorder until interrupted.
+  """
+  # the IBKR connection pool lives in ibkr_api/
+  sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ibkr_api"))
+  from ibapi.contract import Contract
+  from connection import ConnectionPool, IBConnection
+
+  req_symbols = {FIRST_REQ_ID + i: symbol.upper() for i, symbol in enumerate(symbols)}
+
+  class RecorderApp(IBConnection):
+    def realtimeBar(self, reqId, time, open_, high, low, close, volume, wap, count):
+      recorder.on_bar(req_symbols[reqId], time, open_, high, low, close, volume)
+
+    def historicalDataUpdate(self, reqId, bar):
+      recorder.on_minute_bar(req_symbols[reqId], int(bar.date), bar.open, bar.high, bar.low, bar.close, bar.volume)
+
+  def subscribe(app):
+    for req_id, symbol in req_symbols.items():
+      contract = Contract()
+      contract.symbol = symbol
+      contract.secType = "STK"
+      contract.exchange = "SMART"
+      contract.currency = "USD"
+      if source == "realtime":
+        app.reqRealTimeBars(req_id, contract, 5, "TRADES", use_rth, [])
+      else:
+        app.reqHistoricalData(req_id, contract, "", "120 S", "1 min", "TRADES", int(use_rth), 2, True, [])
+
+  pool = ConnectionPool()
+  pool.get("bar-recorder", RecorderApp, on_connect=subscribe)
+  try:
+    while True:
+      time.sleep(60)
+      print(f"Recorder: {recorder.stats}")
+  except KeyboardInterrupt:
+    pass
+  finally:
+    pool.close()
+
+def main():
+  parser = argparse.ArgumentParser(description="Record IBKR streaming bars into the bar store as 1-minute bars.")
+  parser.add_argument("symbols", nargs="*")
+  parser.add_argument("--store", default=bar_store.DEFAULT_STORE_DIR)
+  parser.add_argument("--source", choices=["realtime", "historical"], default="realtime",
+                      help="reqRealTimeBars (5s) or reqHistoricalData keepUpToDate (1min)")
+  parser.add_argument("--all-hours", action="store_true", help="include pre/post-market bars")
+  parser.add_argument("--commit-seconds", type=float, default=COMMIT_SECONDS)
+  parser.add_argument("--compact-seconds", type=float, default=COMPACT_SECONDS,
+                      help="how often appended segments are folded into the month partitions")
+  parser.add_argument("--replay", help="replay sub-minute bars from a CSV instead of connecting to IBKR")
+  args = parser.parse_args()
+
+  if not args.replay and not args.symbols:
+    parser.error("give symbols to record or --replay")
+
+  recorder = BarRecorder(args.store, args.commit_seconds, compact_seconds=args.compact_seconds).start()
+  try:
+    if args.replay:
+      replay_csv(recorder, args.replay)
+    else:
+      record_live(args.symbols, recorder, args.source, not args.all_hours)
+  finally:
+    recorder.stop()
+    print(f"Recorder stopped: {recorder.stats}")
+  return 0
+
+if __name__ == "__main__":
+  raise SystemExit(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Multi-timeframe bars derived from the 1-minute bars in the bar store, so
+# 5m/15m/30m/1h/daily data no longer needs its own Alpha Vantage download.
+#
+# - Bins are anchored at the regular-hours open (09:30) and never cross a
+#   session: the last hourly bar of the day is 15:30-16:00. Bars outside
+#   regular hours are dropped unless regular_hours=False.
+# - Bars are labelled with the bin's start time (like the 1-minute bars);
+#   daily bars are labelled with the date at midnight.
+# - Each derived timeframe is cached as its own bar store:
+#     <store_dir>/_resampled/<timeframe>/<SYMBOL>/<YYYY>/<MM>.parquet
+#   (<timeframe>_all_hours when pre/post-market bars are kept).
+#   A manifest records the version (bar_store.partition_version: partition
+#   mtime + newest appended segment) of the 1-minute month each cached month
+#   was built from, so when a new, re-imported or appended-to 1-minute month
+#   arrives only that month is rebuilt.
+#
+# Usage:
+#   python bar_resample.py TSLA 15min --store ./bar_store
+#   df = read_resampled('./bar_store', 'TSLA', '1h')
+#   compute_indicators(df.iloc[::-1])  # CALCULATE_INDICATOR expects newest first
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import bar_store
+
+NS_PER_MINUTE = 60 * 10**9
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+SESSION_OPEN_MINUTE = 9 * 60 + 30
+SESSION_CLOSE_MINUTE = 16 * 60
+
+# timeframe name -> bin length in minutes (None = one bar per day)
+TIMEFRAMES = {
+  "5min": 5,
+  "15min": 15,
+  "30min": 30,
+  "1h": 60,
+  "1d": None,
+}
+
+CACHE_SUBDIR = "_resampled"
+MANIFEST_FILE = "manifest.json"
+
+def _bin_starts(ts, timeframe, regular_hours=True):
+  """
+  int64 ns timestamps -> (keep mask, int64 ns bin start for each kept bar).
+  """
+  if timeframe not in TIMEFRAMES:
+    raise ValueError(f"Unknown timeframe {timeframe!r}, expected one of {list(TIMEFRAMES)}")
+  day = ts // NS_PER_DAY * NS_PER_DAY
+  minute = (ts - day) // NS_PER_MINUTE
+  if regular_hours:
+    keep = (minute >= SESSION_OPEN_MINUTE) & (minute < SESSION_CLOSE_MINUTE)
+  else:
+    keep = np.ones(len(ts), dtype=bool)
+
+  minutes = TIMEFRAMES[timeframe]
+  if minutes is None:
+    return keep, day[keep]
+  offset = (minute[keep] - SESSION_OPEN_MINUTE) // minutes * minutes + SESSION_OPEN_MINUTE
+  return keep, day[keep] + offset * NS_PER_MINUTE
+
+def resample_arrays(arrays, timeframe, regular_hours=True):
+  """
+  Resample ascending 1-minute OHLCV arrays (timestamp as int64 ns) into
+  timeframe bars. One vectorized pass: bins are contiguous because the input
+  is sorted, so every column is a reduceat over the bin boundaries.
+  """
+  keep, bins = _bin_starts(np.asarray(arrays["timestamp"], dtype=np.int64), timeframe, regular_hours)
+  if len(bins) == 0:
+    return {name: np.asarray(arrays[name])[:0] for name in ["timestamp"] + bar_store.OHLCV_COLUMNS}
+
+  starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+  ends = np.r_[starts[1:], len(bins)] - 1
+  high = np.asarray(arrays["high"])[keep]
+  low = np.asarray(arrays["low"])[keep]
+  return {
+    "timestamp": bins[starts],
+    "open": np.asarray(arrays["open"])[keep][starts],
+    "high": np.maximum.reduceat(high, starts),
+    "low": np.minimum.reduceat(low, starts),
+    "close": np.asarray(arrays["close"])[keep][ends],
+    "volume": np.add.reduceat(np.asarray(arrays["volume"], dtype=np.int64)[keep], starts),
+  }
+
+def resample_bars(df, timeframe, regular_hours=True):
+  """
+  DataFrame version of resample_arrays (any timestamp format bar_store accepts;
+  the result has 'timestamp' as datetime64[ns], ascending).
+  """
+  ts = df["timestamp"]
+  if not pd.api.types.is_integer_dtype(ts):
+    ts = pd.to_datetime(ts).astype("datetime64[ns]").astype(np.int64)
+  order = np.argsort(ts.to_numpy(), kind="stable")
+  arrays = {c: df[c].to_numpy()[order] for c in bar_store.OHLCV_COLUMNS}
+  arrays["timestamp"] = ts.to_numpy()[order]
+  out = pd.DataFrame(resample_arrays(arrays, timeframe, regular_hours))
+  out["timestamp"] = out["timestamp"].to_numpy().view("datetime64[ns]")
+  return out
+
+def cache_dir(store_dir, timeframe, regular_hours=True):
+  return os.path.join(store_dir, CACHE_SUBDIR, timeframe if regular_hours else f"{timeframe}_all_hours")
+
+def _load_manifest(path):
+  if not os.path.exists(path):
+    return {}
+  with open(path) as f:
+    return json.load(f)
+
+def _save_manifest(path, manifest):
+  tmp = f"{path}.tmp"
+  with open(tmp, "w") as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  os.replace(tmp, path)
+
+def update_cache(store_dir, symbol, timeframe, regular_hours=True):
+  """
+  Bring the cached timeframe up to date with the 1-minute months.
+  Only months whose 1-minute bars are new or changed (partition_version) are
+  rebuilt; sessions never span months, so each month resamples on its own.
+  Returns the number of months rebuilt.
+  """
+  symbol = symbol.upper()
+  root = cache_dir(store_dir, timeframe, regular_hours)
+  manifest_path = os.path.join(root, MANIFEST_FILE)
+  manifest = _load_manifest(manifest_path)
+  built = manifest.setdefault(symbol, {})
+
+  rebuilt = 0
+  for year, month in bar_store.list_months(store_dir, symbol):
+    month_key = f"{year:04d}-{month:02d}"
+    target = bar_store.partition_path(root, symbol, year, month)
+    version = bar_store.partition_version(store_dir, symbol, year, month)
+    if built.get(month_key) == version and os.path.exists(target):
+      continue
+
+    table = bar_store.read_month(store_dir, symbol, year, month, ["timestamp"] + bar_store.OHLCV_COLUMNS)
+    arrays = resample_arrays({name: table.column(name).to_numpy() for name in table.column_names},
+                             timeframe, regular_hours)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.tmp"
+    pq.write_table(pa.table(arrays), tmp)
+    os.replace(tmp, target)
+    built[month_key] = version
+    rebuilt += 1
+
+  if rebuilt:
+    _save_manifest(manifest_path, manifest)
+  return rebuilt
+
+def read_resampled(store_dir, symbol, timeframe, start=None, end=None, regular_hours=True):
+  """
+  timeframe bars for symbol in [start, end] as a DataFrame (same shape as
+  bar_store.read_bars). The cache is updated first; "1min" reads the store
+  directly.
+  """
+  if timeframe == "1min":
+    return bar_store.read_bars(store_dir, symbol, start, end, ["timestamp"] + bar_store.OHLCV_COLUMNS)
+  update_cache(store_dir, symbol, timeframe, regular_hours)
+  return bar_store.read_bars(cache_dir(store_dir, timeframe, regular_hours), symbol, start, end)
+
+def main():
+  parser = argparse.ArgumentParser(description="Build/refresh resampled timeframes from stored 1-minute bars.")
+  parser.add_argument("symbol")
+  parser.add_argument("timeframes", nargs="+", choices=list(TIMEFRAMES))
+  parser.add_argument("--store", default=bar_store.DEFAULT_STORE_DIR)
+  parser.add_argument("--all-hours", action="store_true", help="keep pre/post-market bars")
+  parser.add_argument("--show", action="store_true", help="print the resampled bars")
+  args = parser.parse_args()
+
+  for timeframe in args.timeframes:
+    n = update_cache(args.store, args.symbol, timeframe, not args.all_hours)
+    print(f"{args.symbol.upper()} {timeframe}: {n} months rebuilt")
+    if args.show:
+      print(bar_store.read_bars(cache_dir(args.store, timeframe, not args.all_hours), args.symbol))
+  return 0
+
+if __name__ == "__main__":
+  raise SystemExit(main())
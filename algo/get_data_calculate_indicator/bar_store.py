@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+# Columnar on-disk bar store, replacing the per-month CSVs.
+#
+# Layout (one Parquet file per symbol/year/month partition):
+#   <store_dir>/<SYMBOL>/<YYYY>/<MM>.parquet
+#   <store_dir>/<SYMBOL>/<YYYY>/<MM>.segments/<seq>.parquet   appended, not yet compacted
+#
+# write_bars rewrites the month partition (read + merge + write), which is fine
+# for imports. A live writer uses append_bars instead: each call only writes a
+# new small segment file, so its cost does not grow with the month. compact()
+# later folds the segments into the partition, off the writer's hot path.
+# Readers see partition + segments, newer rows winning on duplicate timestamps.
+# There should be one writer/compactor per symbol at a time.
+#
+# Schema:
+#   timestamp  int64    nanoseconds since epoch of the exchange wall-clock time
+#                       (the same naive times as the Alpha Vantage CSVs), ascending
+#   open/high/low/close float64 (or float32, see PRICE_DTYPE)
+#   volume     int64
+#   + any extra numeric columns (e.g. indicators) that were written
+#
+# Reading a time range only opens the partitions (and segments) that overlap
+# it, and the range/columns are pushed down into the Parquet reader.
+#
+# Import the existing month CSVs:
+#   python bar_store.py import TSLA ./TSLA/past_multiple_months/TSLA_regular_hours_2024-*.csv
+
+import argparse
+import glob
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_STORE_DIR = "./bar_store"
+PRICE_DTYPE = np.float64
+CSV_TIME_FORMAT = "%m/%d/%Y %H:%M"
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+SEGMENT_SUFFIX = ".segments"
+
+_segment_seq = itertools.count()
+
+def _to_ns(value):
+  """datetime-like / 'YYYY-MM-DD ...' string / int ns -> int64 ns (or None)."""
+  if value is None:
+    return None
+  if isinstance(value, (int, np.integer)):
+    return int(value)
+  return pd.Timestamp(value).value
+
+def partition_path(store_dir, symbol, year, month):
+  return os.path.join(store_dir, symbol.upper(), f"{year:04d}", f"{month:02d}.parquet")
+
+def segment_dir(store_dir, symbol, year, month):
+  return os.path.join(store_dir, symbol.upper(), f"{year:04d}", f"{month:02d}{SEGMENT_SUFFIX}")
+
+def segment_paths(store_dir, symbol, year, month):
+  """Uncompacted segment files of one month, oldest first."""
+  return sorted(glob.glob(os.path.join(segment_dir(store_dir, symbol, year, month), "*.parquet")))
+
+def _month_range(start_ns, end_ns):
+  lo = (pd.Timestamp(start_ns).year, pd.Timestamp(start_ns).month) if start_ns is not None else None
+  hi = (pd.Timestamp(end_ns).year, pd.Timestamp(end_ns).month) if end_ns is not None else None
+  return lo, hi
+
+def _in_range(year_month, lo, hi):
+  return (lo is None or year_month >= lo) and (hi is None or year_month <= hi)
+
+def list_partitions(store_dir, symbol, start=None, end=None):
+  """
+  Compacted partition files for symbol, in time order, pruned to [start, end].
+  (list_months also includes months that so far only have segments.)
+  """
+  lo, hi = _month_range(_to_ns(start), _to_ns(end))
+  paths = []
+  for path in sorted(glob.glob(os.path.join(store_dir, symbol.upper(), "*", "*.parquet"))):
+    year = int(os.path.basename(os.path.dirname(path)))
+    month = int(os.path.splitext(os.path.basename(path))[0])
+    if _in_range((year, month), lo, hi):
+      paths.append(path)
+  return paths
+
+def list_months(store_dir, symbol, start=None, end=None):
+  """
+  (year, month) of every month with a partition and/or segments, in time order,
+  pruned to [start, end].
+  """
+  lo, hi = _month_range(_to_ns(start), _to_ns(end))
+  months = set()
+  for path in glob.glob(os.path.join(store_dir, symbol.upper(), "*", "*")):
+    name = os.path.basename(path)
+    if name.endswith(".parquet"):
+      name = name[:-len(".parquet")]
+    elif name.endswith(SEGMENT_SUFFIX):
+      name = name[:-len(SEGMENT_SUFFIX)]
+    else:
+      continue
+    if name.isdigit():
+      months.add((int(os.path.basename(os.path.dirname(path))), int(name)))
+  return sorted(m for m in months if _in_range(m, lo, hi))
+
+def partition_version(store_dir, symbol, year, month):
+  """
+  A string that changes whenever the month's bars change (partition rewritten,
+  segment appended or compacted), for caches derived from the store.
+  """
+  path = partition_path(store_dir, symbol, year, month)
+  mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+  segments = segment_paths(store_dir, symbol, year, month)
+  return f"{mtime}:{os.path.basename(segments[-1]) if segments else ''}"
+
+def parse_timestamps(ts):
+  """
+  Parse a CSV timestamp column: the repo's '%m/%d/%Y %H:%M' first, then any
+  format pandas can infer (e.g. the ISO timestamps CALCULATE_INDICATOR writes).
+  """
+  if pd.api.types.is_datetime64_any_dtype(ts):
+    return ts
+  try:
+    return pd.to_datetime(ts, format=CSV_TIME_FORMAT)
+  except ValueError:
+    return pd.to_datetime(ts)
+
+def _normalize(df, price_dtype=PRICE_DTYPE):
+  """
+  Parse timestamps to int64 ns, sort ascending, drop duplicate bars and cast
+  the OHLCV columns to the store's types.
+  """
+  df = df.copy()
+  ts = df["timestamp"]
+  if not pd.api.types.is_integer_dtype(ts):
+    ts = parse_timestamps(ts).astype("datetime64[ns]").astype(np.int64)
+  df["timestamp"] = ts
+  df = df.drop_duplicates("timestamp", keep="last").sort_values("timestamp")
+  for col in ["open", "high", "low", "close"]:
+    df[col] = df[col].astype(price_dtype)
+  df["volume"] = df["volume"].astype(np.int64)
+  return df.reset_index(drop=True)
+
+def _split_months(df):
+  """Normalized bars -> [((year, month), rows), ...]."""
+  months = df["timestamp"].to_numpy().view("datetime64[ns]").astype("datetime64[M]")
+  return [((pd.Timestamp(m).year, pd.Timestamp(m).month), df[months == m]) for m in np.unique(months)]
+
+def _write_parquet(df, path):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp = f"{path}.tmp"
+  pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp)
+  os.replace(tmp, path)
+
+def _merge_month(store_dir, symbol, year, month, new=None):
+  """
+  Rewrite one month partition as partition + segments (+ new rows), later
+  rows winning on duplicate timestamps, then delete the segments that were
+  merged (segments appended meanwhile are kept).
+  """
+  path = partition_path(store_dir, symbol, year, month)
+  segments = segment_paths(store_dir, symbol, year, month)
+  frames = [pq.read_table(p).to_pandas() for p in ([path] if os.path.exists(path) else []) + segments]
+  if new is not None:
+    frames.append(new)
+  part = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+  if len(frames) > 1:
+    part = part.drop_duplicates("timestamp", keep="last").sort_values("timestamp")
+  _write_parquet(part, path)
+  for segment in segments:
+    os.remove(segment)
+  try:
+    os.rmdir(segment_dir(store_dir, symbol, year, month))
+  except OSError:
+    pass   # not there, or a segment was appended meanwhile
+
+def write_bars(store_dir, symbol, df, price_dtype=PRICE_DTYPE):
+  """
+  Write bars into their year/month partitions. Existing partitions (and their
+  segments) are merged (new rows win on duplicate timestamps). Returns the
+  number of partitions written.
+  """
+  df = _normalize(df, price_dtype)
+  written = 0
+  for (year, month), part in _split_months(df):
+    _merge_month(store_dir, symbol, year, month, part)
+    written += 1
+  return written
+
+def append_bars(store_dir, symbol, df, price_dtype=PRICE_DTYPE):
+  """
+  Append bars as new segment files (one per month touched) without reading or
+  rewriting the partition; the cost only depends on len(df). Rows win over
+  older rows with the same timestamp. Returns the number of segments written.
+  """
+  df = _normalize(df, price_dtype)
+  written = 0
+  for (year, month), part in _split_months(df):
+    name = f"{time.time_ns():020d}-{next(_segment_seq):06d}.parquet"
+    _write_parquet(part, os.path.join(segment_dir(store_dir, symbol, year, month), name))
+    written += 1
+  return written
+
+def compact(store_dir, symbol):
+  """
+  Fold every month's segments into its partition. Returns the number of
+  months compacted.
+  """
+  compacted = 0
+  for year, month in list_months(store_dir, symbol):
+    if segment_paths(store_dir, symbol, year, month):
+      _merge_month(store_dir, symbol, year, month)
+      compacted += 1
+  return compacted
+
+def read_month(store_dir, symbol, year, month, columns=None, filters=None):
+  """One month (partition + segments) as a pyarrow Table, ascending timestamps."""
+  path = partition_path(store_dir, symbol, year, month)
+  segments = segment_paths(store_dir, symbol, year, month)
+  if not segments:
+    return pq.read_table(path, columns=columns, filters=filters)
+
+  frames = []
+  for p in ([path] if os.path.exists(path) else []) + segments:
+    # segments from the recorder only have OHLCV; missing columns come back as NaN
+    names = pq.read_schema(p).names
+    cols = None if columns is None else [c for c in columns if c in names]
+    frames.append(pq.read_table(p, columns=cols, filters=filters).to_pandas())
+  df = pd.concat(frames, ignore_index=True).drop_duplicates("timestamp", keep="last").sort_values("timestamp")
+  if columns is not None:
+    df = df.reindex(columns=columns)
+  return pa.Table.from_pandas(df, preserve_index=False)
+
+def read_table(store_dir, symbol, start=None, end=None, columns=None):
+  """
+  Read bars in [start, end] as one pyarrow Table (ascending timestamps).
+  Only overlapping partitions (and their segments) are opened; the time filter
+  and column list are pushed down into the Parquet reader.
+  """
+  start_ns, end_ns = _to_ns(start), _to_ns(end)
+  filters = []
+  if start_ns is not None:
+    filters.append(("timestamp", ">=", start_ns))
+  if end_ns is not None:
+    filters.append(("timestamp", "<=", end_ns))
+  if columns is not None and "timestamp" not in columns:
+    columns = ["timestamp"] + list(columns)
+
+  tables = [
+    read_month(store_dir, symbol, year, month, columns, filters or None)
+    for year, month in list_months(store_dir, symbol, start_ns, end_ns)
+  ]
+  if not tables:
+    raise FileNotFoundError(f"No bars stored for {symbol} in {store_dir}")
+  return pa.concat_tables(tables)
+
+def read_bars(store_dir, symbol, start=None, end=None, columns=None):
+  """
+  Same as read_table, as a DataFrame with 'timestamp' as datetime64[ns].
+  """
+  df = read_table(store_dir, symbol, start, end, columns).to_pandas()
+  df["timestamp"] = df["timestamp"].to_numpy().view("datetime64[ns]")
+  return df
+
+def read_arrays(store_dir, symbol, start=None, end=None, columns=None):
+  """
+  Same as read_table, as a dict of contiguous NumPy arrays (timestamp stays int64 ns).
+  """
+  table = read_table(store_dir, symbol, start, end, columns)
+  return {name: table.column(name).to_numpy() for name in table.column_names}
+
+def import_csv(store_dir, symbol, csv_paths, price_dtype=PRICE_DTYPE):
+  """
+  Ingest Alpha Vantage month CSVs (newest-first, '%m/%d/%Y %H:%M' timestamps).
+  """
+  frames = []
+  for path in csv_paths:
+    frames.append(pd.read_csv(path, usecols=["timestamp"] + OHLCV_COLUMNS))
+    print(f"Read {path}")
+  df = pd.concat(frames, ignore_index=True)
+  n = write_bars(store_dir, symbol, df, price_dtype)
+  print(f"Imported {len(df)} rows into {n} partitions under {os.path.join(store_dir, symbol.upper())}")
+  return n
+
+def main():
+  parser = argparse.ArgumentParser(description="Columnar bar store (symbol/year/month Parquet partitions).")
+  sub = parser.add_subparsers(dest="command", required=True)
+
+  p_import = sub.add_parser("import", help="ingest month CSVs")
+  p_import.add_argument("symbol")
+  p_import.add_argument("csv_paths", nargs="+")
+  p_import.add_argument("--store", default=DEFAULT_STORE_DIR)
+  p_import.add_argument("--float32", action="store_true", help="store prices as float32")
+
+  p_compact = sub.add_parser("compact", help="fold appended segments into the month partitions")
+  p_compact.add_argument("symbols", nargs="+")
+  p_compact.add_argument("--store", default=DEFAULT_STORE_DIR)
+
+  p_show = sub.add_parser("show", help="print a time range")
+  p_show.add_argument("symbol")
+  p_show.add_argument("--start")
+  p_show.add_argument("--end")
+  p_show.add_argument("--store", default=DEFAULT_STORE_DIR)
+
+  args = parser.parse_args()
+  if args.command == "import":
+    import_csv(args.store, args.symbol, args.csv_paths, np.float32 if args.float32 else np.float64)
+  elif args.command == "compact":
+    for symbol in args.symbols:
+      print(f"{symbol.upper()}: compacted {compact(args.store, symbol)} months")
+  elif args.command == "show":
+    df = read_bars(args.store, args.symbol, args.start, args.end)
+    print(df)
+  return 0
+
+if __name__ == "__main__":
+  raise SystemExit(main())
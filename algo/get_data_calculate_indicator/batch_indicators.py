@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# 批量计算指标：一次处理整个 watchlist，而不是每个 CSV 各跑一次 CALCULATE_INDICATOR.py。
+# - 输入: 若干 CSV 文件/目录，或者 --symbols (每个 symbol 在 --data-dir/<SYMBOL>/ 下找 CSV)
+#   symbol 取自文件名开头的大写代码 ('TSLA_regular_hours_2024-06.csv' -> TSLA)，
+#   对不上的文件 (如 'backup_TSLA_...csv') 跳过并列出，不会被当成一个新 symbol
+# - 进程池并行 (pandas/ta 的导入在每个工作进程只付一次)，每个 CSV 一个任务
+# - --store: 同一 symbol 的常规交易时段文件 ('<SYMBOL>_regular_hours_...csv') 按时间先后拼接
+#   (重叠的行以较新的文件为准)，在整段历史上只算一次指标再一次写入，
+#   EMA/RSI/MACD/ATR 不会在每个月初重新热身；其它文件 (如含盘前盘后的 'TSLA_last_30_days.csv')
+#   只算 CSV，不写入存储，避免不同时段的数据混进同一段历史。每个 symbol 一个写入任务
+# - 每个文件打印进度；结束时打印失败报告 (工作进程崩溃也记为失败)
+# - 退出码: 0 全部成功, 1 有文件失败, 2 没有找到输入文件
+#
+# 用法:
+#   python batch_indicators.py ./TSLA/past_multiple_months --workers 8
+#   python batch_indicators.py --symbols TSLA AAPL NVDA --data-dir . --store ./bar_store
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from CALCULATE_INDICATOR import calculate_indicators_file, compute_indicators
+
+# 文件名开头的股票代码: 大写字母开头，可含数字、'.'、'-' (BRK.B)，后跟 '_'
+SYMBOL_PATTERN = re.compile(r'([A-Z][A-Z0-9.\-]*)_')
+# 只有常规交易时段的文件写入 bar_store
+STORE_PATTERN = re.compile(r'[A-Z][A-Z0-9.\-]*_regular_hours_')
+
+def symbol_from_path(path):
+  """'TSLA_regular_hours_2024-06.csv' -> 'TSLA'；文件名不以股票代码开头时返回 None。"""
+  match = SYMBOL_PATTERN.match(os.path.basename(path))
+  return match.group(1) if match else None
+
+def store_inputs(files):
+  """--store 只用常规交易时段的文件: 'TSLA_regular_hours_2024-06.csv' 保留，'TSLA_last_30_days.csv' 不用。"""
+  return [f for f in files if STORE_PATTERN.match(os.path.basename(f))]
+
+def find_inputs(paths=None, symbols=None, data_dir='.'):
+  """
+  把输入展开为 ({symbol: [csv, ...]}, [跳过的文件, ...])。目录只取其中的 *.csv，
+  已经是 "_with_indicators" 的输出文件会被忽略。
+  --symbols 的 symbol 取自 <data_dir>/<SYMBOL>/ 目录，目录里文件名对不上该 symbol 的跳过；
+  直接给出的文件/目录按文件名识别 symbol，识别不出的跳过。
+  """
+  candidates = []   # (文件, 期望的 symbol 或 None)
+  for path in paths or []:
+    if os.path.isdir(path):
+      candidates.extend((f, None) for f in sorted(glob.glob(os.path.join(path, '*.csv'))))
+    else:
+      candidates.append((path, None))
+  for symbol in symbols or []:
+    symbol = symbol.upper()
+    files = sorted(glob.glob(os.path.join(data_dir, symbol, '**', '*.csv'), recursive=True))
+    candidates.extend((f, symbol) for f in files)
+
+  grouped, skipped = {}, []
+  for f, expected in candidates:
+    if os.path.splitext(f)[0].endswith('_with_indicators'):
+      continue
+    symbol = symbol_from_path(f)
+    if symbol is None or (expected is not None and symbol != expected):
+      skipped.append(f)
+      continue
+    grouped.setdefault(symbol, []).append(f)
+  return grouped, skipped
+
+def _store_symbol(store_dir, symbol, files, session_vwap=False):
+  """
+  把同一 symbol 的所有 CSV 按时间先后拼接，整段只算一次指标，一次写入 bar_store。
+  文件按各自最早的 K 线排序，重复的时间戳保留较新文件里的那一行。返回写入的行数。
+  """
+  import bar_store
+  frames = []
+  for path in files:
+    df = pd.read_csv(path)
+    # 原始数据是 '%m/%d/%Y %H:%M'，CALCULATE_INDICATOR 的输出是 ISO 格式，两种都接受
+    df['timestamp'] = bar_store.parse_timestamps(df['timestamp'])
+    frames.append(df)
+  frames.sort(key=lambda df: df['timestamp'].min())
+  df = pd.concat(frames, ignore_index=True).drop_duplicates('timestamp', keep='last')
+  # compute_indicators 与 CSV 一样要求最新数据在上
+  df = df.sort_values('timestamp', ascending=False, kind='stable')
+  df = compute_indicators(df, session_vwap)
+  bar_store.write_bars(store_dir, symbol, df)
+  return len(df)
+
+def _result(symbol, target, t0, rows=None, output=None):
+  """成功时 rows/output 有值；在 except 块里调用则记下当前异常。"""
+  if output is not None:
+    return {'symbol': symbol, 'file': target, 'ok': True, 'output': output,
+            'rows': rows, 'seconds': time.time() - t0}
+  exc = sys.exc_info()[1]
+  return {'symbol': symbol, 'file': target, 'ok': False, 'error': f"{type(exc).__name__}: {exc}",
+          'traceback': traceback.format_exc(), 'seconds': time.time() - t0}
+
+def _process_file(symbol, path, session_vwap=False):
+  """工作进程：计算一个 CSV 的指标，返回结果字典。"""
+  t0 = time.time()
+  try:
+    output_file, df = calculate_indicators_file(path, session_vwap)
+    return _result(symbol, path, t0, len(df), output_file)
+  except Exception:
+    return _result(symbol, path, t0)
+
+def _process_store(symbol, files, store_dir, session_vwap=False):
+  """
+  工作进程：把一个 symbol 的文件写入 bar_store，返回结果字典。
+  每个 symbol 只有一个写入任务，不会有两个进程写同一个存储分区。
+  """
+  t0 = time.time()
+  target = os.path.join(store_dir, symbol)
+  try:
+    rows = _store_symbol(store_dir, symbol, files, session_vwap)
+    return _result(symbol, target, t0, rows, target)
+  except Exception:
+    return _result(symbol, target, t0)
+
+def _store_jobs(grouped, store_dir=None):
+  """{symbol: [写入存储的文件, ...]}，没有 store_dir 或没有常规时段文件的 symbol 不写。"""
+  if not store_dir:
+    return {}
+  jobs = {symbol: store_inputs(files) for symbol, files in grouped.items()}
+  return {symbol: files for symbol, files in jobs.items() if files}
+
+def run_batch(grouped, workers=None, store_dir=None, session_vwap=False):
+  """
+  在进程池里并行处理所有文件 (每个文件一个任务)，有 store_dir 时每个 symbol 再加一个写入任务。
+  返回全部结果 (每个任务一条)。
+  """
+  store_jobs = _store_jobs(grouped, store_dir)
+  total = sum(len(files) for files in grouped.values()) + len(store_jobs)
+  done = 0
+  results = []
+  with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+    futures = {}
+    for symbol, files in grouped.items():
+      for path in files:
+        futures[pool.submit(_process_file, symbol, path, session_vwap)] = (symbol, path)
+    for symbol, files in store_jobs.items():
+      target = os.path.join(store_dir, symbol)
+      futures[pool.submit(_process_store, symbol, files, store_dir, session_vwap)] = (symbol, target)
+    for future in as_completed(futures):
+      try:
+        r = future.result()
+      except Exception as e:
+        # 工作进程崩溃 (BrokenProcessPool) 等: 该任务记为失败
+        symbol, target = futures[future]
+        r = {'symbol': symbol, 'file': target, 'ok': False, 'error': f"{type(e).__name__}: {e}",
+             'traceback': traceback.format_exc(), 'seconds': 0.0}
+      done += 1
+      status = 'OK  ' if r['ok'] else 'FAIL'
+      detail = f"{r['rows']} rows" if r['ok'] else r['error']
+      print(f"[{done}/{total}] {status} {r['file']} ({detail}, {r['seconds']:.1f}s)")
+      results.append(r)
+  return results
+
+def main():
+  parser = argparse.ArgumentParser(description="Calculate indicators for many CSVs in parallel.")
+  parser.add_argument('paths', nargs='*', help="CSV files or directories")
+  parser.add_argument('--symbols', nargs='+', help="look for CSVs under <data-dir>/<SYMBOL>/")
+  parser.add_argument('--data-dir', default='.')
+  parser.add_argument('--workers', type=int, default=None, help="default: all cores")
+  parser.add_argument('--store', default=None, help="also write results into this bar_store directory")
+  parser.add_argument('--session-vwap', action='store_true', help="also output the per-session Session_VWAP and Session_SMA_50 columns")
+  parser.add_argument('--report', default=None, help="write the failure report as JSON to this file")
+  args = parser.parse_args()
+
+  grouped, skipped = find_inputs(args.paths, args.symbols, args.data_dir)
+  for f in skipped:
+    print(f"Skipping {f}: file name does not start with a known symbol")
+  n_files = sum(len(files) for files in grouped.values())
+  if n_files == 0:
+    print("No input CSV files found.")
+    return 2
+
+  store_jobs = _store_jobs(grouped, args.store)
+  if args.store:
+    for symbol in grouped:
+      if symbol not in store_jobs:
+        print(f"Not storing {symbol}: no '{symbol}_regular_hours_...' files")
+  store_note = f", plus {len(store_jobs)} store writes" if args.store else ""
+  print(f"Calculating indicators for {n_files} files ({len(grouped)} symbols){store_note}...")
+  t0 = time.time()
+  results = run_batch(grouped, args.workers, args.store, args.session_vwap)
+  failed = [r for r in results if not r['ok']]
+
+  print(f"\nDone in {time.time() - t0:.1f}s: {len(results) - len(failed)} succeeded, {len(failed)} failed.")
+  if failed:
+    print("\nFailure report:")
+    for r in failed:
+      print(f"  {r['file']}: {r['error']}")
+  if args.report:
+    with open(args.report, 'w') as f:
+      json.dump(failed, f, indent=2)
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+# 事件驱动回测：在 backtest_core 的全进全出之外，支持
+#   - 入场单: 市价 (收盘价 / 下一根开盘价成交)、限价、止损 (突破) 单，限价/止损单可设有效期
+#   - 括号单 (bracket): 入场成交后同时挂止损单 (stop loss) 和止盈限价单 (take profit)，一边成交另一边撤销
+#   - 按每根 K 线的 high/low 判断是否触发，跳空时按开盘价成交
+#   - 同一根 K 线里止损和止盈都被触及时，按 intrabar 规则决定先后
+#     ('stop_first' 保守 / 'target_first' 乐观 / 'nearest' 离开盘价近的先成交)
+#   - basis/strategy.md 第三部分: min_reward_risk=2.5 时，止盈距离小于 2.5 倍止损距离的信号不交易
+#
+# "事件驱动"指循环只在事件 (信号、成交) 之间跳转，而不是逐根 K 线：
+# 有挂单时用分块的 NumPy 比较找到第一根触发的 K 线，所以一年的 1 分钟数据也只需几十毫秒。
+# 现金/持仓只在成交处记录，最后和 backtest_core 一样按段展开成逐行数组。
+
+import numpy as np
+
+from signal_engine import BUY, SELL
+
+# 入场单类型
+MARKET = 'market'
+LIMIT = 'limit'
+STOP = 'stop'
+
+# 平仓原因
+EXIT_SIGNAL = 0
+EXIT_STOP = 1
+EXIT_TARGET = 2
+EXIT_OPEN = -1   # 回测结束时仍持仓
+
+TRADE_DTYPE = np.dtype([
+  ('signal_idx', np.int64), ('entry_idx', np.int64), ('exit_idx', np.int64),
+  ('entry_price', np.float64), ('exit_price', np.float64), ('shares', np.float64),
+  ('stop', np.float64), ('target', np.float64), ('exit_reason', np.int8),
+])
+
+def _level(value, i, default=np.nan):
+  """标量或数组参数在第 i 根 K 线 (信号 K 线) 上的值。"""
+  if value is None:
+    return default
+  if np.ndim(value) == 0:
+    return float(value)
+  return float(value[i])
+
+def _first_touch(high, low, start, end, below=np.nan, above=np.nan):
+  """
+  [start, end) 中第一根 low <= below 或 high >= above 的 K 线下标，没有则返回 end。
+  从 64 根开始按倍数扩大窗口搜索，触发得早时不会扫描后面的数据。
+  """
+  chunk = 64
+  a = start
+  while a < end:
+    b = min(a + chunk, end)
+    hit = np.zeros(b - a, dtype=bool)
+    if below == below:
+      hit |= low[a:b] <= below
+    if above == above:
+      hit |= high[a:b] >= above
+    if hit.any():
+      return a + int(hit.argmax())
+    a = b
+    chunk *= 2
+  return end
+
+def _next(indices, i, n):
+  """indices (升序) 中第一个 >= i 的值，没有则返回 n。"""
+  k = np.searchsorted(indices, i)
+  return int(indices[k]) if k < len(indices) else n
+
+def backtest_orders(open_, high, low, close, codes, entry_type=MARKET, entry_offset=0.0, entry_ttl=None,
+                    stop_pct=None, stop_price=None, target_pct=None, target_price=None, reward_risk=None,
+                    min_reward_risk=None, fill_on='close', intrabar='stop_first', initial_balance=10000,
+                    entry_price=None):
+  """
+  事件驱动回测 (只做多，全进全出)。
+
+  参数:
+    open_, high, low, close  float64 数组 (最早的数据在前)
+    codes          int8 信号数组 (signal_engine: BUY=1 入场, SELL=-1 按市价平仓并撤销挂单, HOLD=0)
+    entry_type     MARKET / LIMIT (信号 K 线收盘价 * (1 - entry_offset) 挂买入限价单)
+                   / STOP (收盘价 * (1 + entry_offset) 挂突破买入单)
+    entry_price    限价/止损入场单的价格 (标量或按信号 K 线取值的数组，如需求区上沿)，给出时不用 entry_offset
+    entry_ttl      限价/止损入场单的有效 K 线数 (None 为一直有效，直到 SELL 信号)
+    stop_pct / stop_price
+                   止损: 入场价下方百分比，或按信号 K 线取值的绝对价格 (标量或数组)
+    target_pct / target_price / reward_risk
+                   止盈: 入场价上方百分比、绝对价格，或止损距离的倍数 (如 2.5)
+    min_reward_risk  止盈距离 / 止损距离 低于此值的信号直接放弃 (入场价按挂单价或信号 K 线收盘价估算)
+    fill_on        市价单 (入场和 SELL 平仓) 在 'close' 信号 K 线收盘价成交，或 'next_open' 下一根开盘价
+    intrabar       同一根 K 线同时触及止损和止盈时: 'stop_first' / 'target_first' / 'nearest'
+
+  止损/止盈从入场成交的下一根 K 线开始生效 (成交那根 K 线里入场之后的路径未知)。
+  挂着的入场单在 SELL 信号那根 K 线内仍可成交，成交后在收盘时按 SELL 平仓。
+
+  返回值: (balance, position, portfolio_value, trades)
+    前三个与 close 等长 (与 backtest_core.backtest_arrays 相同)，trades 为 TRADE_DTYPE 结构化数组
+  """
+  open_ = np.ascontiguousarray(open_, dtype=np.float64)
+  high = np.ascontiguousarray(high, dtype=np.float64)
+  low = np.ascontiguousarray(low, dtype=np.float64)
+  close = np.ascontiguousarray(close, dtype=np.float64)
+  codes = np.asarray(codes, dtype=np.int8)
+  n = len(close)
+  if fill_on not in ('close', 'next_open'):
+    raise ValueError(f"fill_on must be 'close' or 'next_open', got {fill_on!r}")
+  if intrabar not in ('stop_first', 'target_first', 'nearest'):
+    raise ValueError(f"Unknown intrabar policy {intrabar!r}")
+
+  buys = np.flatnonzero(codes == BUY)
+  sells = np.flatnonzero(codes == SELL)
+
+  cash = float(initial_balance)
+  fills = [(0, cash, 0.0)]   # (K 线下标, 成交后现金, 成交后持股)
+  trades = []
+  i = 0
+  while cash > 0:
+    # ---------- 等待入场信号 ----------
+    s = _next(buys, i, n)
+    if s >= n:
+      break
+    ref = close[s]
+    if entry_type == LIMIT:
+      level = _level(entry_price, s, ref * (1 - entry_offset))
+    elif entry_type == STOP:
+      level = _level(entry_price, s, ref * (1 + entry_offset))
+    else:
+      level = ref
+    stop = _level(stop_price, s, ref * (1 - stop_pct) if stop_pct is not None else np.nan)
+    if min_reward_risk is not None:
+      est_target = _level(target_price, s, level * (1 + target_pct) if target_pct is not None else np.nan)
+      if reward_risk is not None and stop == stop:
+        est_target = level + reward_risk * (level - stop)
+      if not (stop == stop and est_target == est_target and level > stop
+              and (est_target - level) >= min_reward_risk * (level - stop)):
+        i = s + 1
+        continue
+
+    # ---------- 入场成交 ----------
+    if entry_type == MARKET:
+      if fill_on == 'close':
+        j, price = s, ref
+      else:
+        j = s + 1
+        if j >= n:
+          break
+        price = open_[j]
+    elif entry_type in (LIMIT, STOP):
+      end = n if entry_ttl is None else min(n, s + 1 + entry_ttl)
+      end = min(end, _next(sells, s + 1, n) + 1)   # SELL 信号那根收盘时撤单
+      if entry_type == LIMIT:
+        j = _first_touch(high, low, s + 1, end, below=level)
+      else:
+        j = _first_touch(high, low, s + 1, end, above=level)
+      if j >= end:
+        i = max(end, s + 1)
+        continue
+      price = min(open_[j], level) if entry_type == LIMIT else max(open_[j], level)
+    else:
+      raise ValueError(f"Unknown entry_type {entry_type!r}")
+
+    shares = cash / price
+    cash = 0.0
+    fills.append((j, cash, shares))
+
+    # 括号单的止损/止盈价以实际成交价为基准
+    if stop_pct is not None and stop_price is None:
+      stop = price * (1 - stop_pct)
+    target = _level(target_price, s, price * (1 + target_pct) if target_pct is not None else np.nan)
+    if reward_risk is not None and stop == stop:
+      target = price + reward_risk * (price - stop)
+
+    # ---------- 出场 ----------
+    x = _next(sells, j, n)   # SELL 信号
+    t = _first_touch(high, low, j + 1, min(n, x + 1), below=stop, above=target)
+    if t <= x and t < n:
+      stop_hit = low[t] <= stop
+      target_hit = high[t] >= target
+      if stop_hit and target_hit:
+        if intrabar == 'stop_first':
+          target_hit = False
+        elif intrabar == 'target_first':
+          stop_hit = False
+        elif abs(open_[t] - stop) <= abs(target - open_[t]):
+          target_hit = False
+        else:
+          stop_hit = False
+      if stop_hit:
+        exit_price, reason = min(open_[t], stop), EXIT_STOP
+      else:
+        exit_price, reason = max(open_[t], target), EXIT_TARGET
+      exit_idx = t
+    elif x < n:
+      reason = EXIT_SIGNAL
+      if fill_on == 'close' or x + 1 >= n:
+        exit_idx, exit_price = x, close[x]
+      else:
+        exit_idx, exit_price = x + 1, open_[x + 1]
+    else:
+      trades.append((s, j, -1, price, np.nan, shares, stop, target, EXIT_OPEN))
+      break
+
+    cash = shares * exit_price
+    fills.append((exit_idx, cash, 0.0))
+    trades.append((s, j, exit_idx, price, exit_price, shares, stop, target, reason))
+    i = exit_idx + 1
+
+  # ---------- 按段展开成逐行数组 ----------
+  fill_idx = np.array([f[0] for f in fills], dtype=np.int64)
+  fill_cash = np.array([f[1] for f in fills], dtype=np.float64)
+  fill_shares = np.array([f[2] for f in fills], dtype=np.float64)
+  # 每一行使用 "该行及之前最后一次成交" 之后的状态
+  seg = np.searchsorted(fill_idx, np.arange(n), side='right') - 1
+  balance = fill_cash[seg]
+  position = fill_shares[seg]
+  portfolio_value = np.where(balance > 0, balance, position * close)
+  return balance, position, portfolio_value, np.array(trades, dtype=TRADE_DTYPE)
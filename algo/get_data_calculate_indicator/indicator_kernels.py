@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# 融合的指标计算内核：直接在 float64 数组上计算 CALCULATE_INDICATOR.py 的全部指标，
+# 不再经过 ta。
+# - ta 的 macd / macd_signal / macd_diff 各自重算一遍 EMA_12 / EMA_26，这里每条 EMA 只算一次
+# - EMA / RSI 用 pandas 的 ewm (Cython)，SMA / VWAP 用 rolling，与 ta 的运算顺序完全相同
+# - ATR 的 Wilder 平滑在 ta 里是逐行 .iloc 的 Python 循环 (整个计算最慢的部分)，
+#   这里改成在 Python float 列表上的循环，运算顺序不变
+# 结果与 ta 逐位一致 (见 verify_against_ta，允许的最大绝对误差为 TA_TOLERANCE)。
+#
+# 按交易日重置 (session):
+# - ta 的 VWAP 是 14 根滑动窗口，不是市场上说的 VWAP；session_vwap 从每个交易日的第一根 K 线
+#   开始累计 (典型价*成交量) / 成交量
+# - 交易日边界由时间戳的日期变化决定 (session_starts)，重置用"带重置的累计和" (cumsum_reset)，
+#   整年的 1 分钟数据一次向量化完成，没有按天的 Python 循环
+# - session_rolling 是不跨交易日的滑动和/均值，用于其他指标的按日重置：
+#   Session_SMA_50 是每天开盘重新开始的 SMA_50 (当天前 49 根为 NaN)
+#
+# 与 ta 对比:
+#   python indicator_kernels.py ./TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01.csv [--tolerance 1e-9]
+#   任何一列超出容差 (或 NaN 的位置不同) 时退出码为 1
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicator_state import INDICATOR_COLUMNS
+
+# verify_against_ta 允许的最大绝对误差
+TA_TOLERANCE = 1e-9
+
+def _ewm(x, span=None, alpha=None, min_periods=0):
+  return pd.Series(x, copy=False).ewm(span=span, alpha=alpha, min_periods=min_periods, adjust=False).mean().to_numpy()
+
+def _rolling(x, window, mean=True):
+  r = pd.Series(x, copy=False).rolling(window, min_periods=window)
+  return (r.mean() if mean else r.sum()).to_numpy()
+
+def macd(close, fast=12, slow=26, signal=9):
+  """
+  返回 (MACD_line, MACD_signal, MACD_histogram)，两条 EMA 和信号线各算一次。
+  """
+  line = _ewm(close, span=fast, min_periods=fast) - _ewm(close, span=slow, min_periods=slow)
+  sig = _ewm(line, span=signal, min_periods=signal)
+  return line, sig, line - sig
+
+def rsi(close, window=14):
+  diff = np.empty_like(close)
+  diff[0] = np.nan
+  np.subtract(close[1:], close[:-1], out=diff[1:])
+  # 与 ta 相同: 上涨为 diff 否则 0.0；下跌为 -diff 否则 -0.0 (第一根的 NaN 按 0 处理)
+  up = np.where(diff > 0, diff, 0.0)
+  down = -np.where(diff < 0, diff, 0.0)
+  emaup = _ewm(up, alpha=1 / window, min_periods=window)
+  emadn = _ewm(down, alpha=1 / window, min_periods=window)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.where(emadn == 0, 100, 100 - (100 / (1 + emaup / emadn)))
+
+def true_range(high, low, close):
+  tr = high - low
+  if len(close) > 1:
+    prev_close = close[:-1]
+    np.maximum(tr[1:], np.abs(high[1:] - prev_close), out=tr[1:])
+    np.maximum(tr[1:], np.abs(low[1:] - prev_close), out=tr[1:])
+  return tr
+
+def atr(high, low, close, window=14):
+  """
+  Wilder ATR：前 window-1 根为 0，第 window 根为真实波幅均值，之后递推平滑。
+  """
+  tr = true_range(high, low, close)
+  out = np.zeros(len(close))
+  if len(close) < window:
+    return out
+  value = tr[:window].mean()
+  out[window - 1] = value
+  result = out.tolist()
+  w = float(window)
+  for i, x in enumerate(tr[window:].tolist(), start=window):
+    value = (value * (window - 1) + x) / w
+    result[i] = value
+  return np.array(result)
+
+def rolling_vwap(high, low, close, volume, window=14):
+  """
+  与 ta.volume.volume_weighted_average_price 相同的 window 根滑动 VWAP。
+  """
+  typical_price = (high + low + close) / 3.0
+  return _rolling(typical_price * volume, window, mean=False) / _rolling(volume, window, mean=False)
+
+def session_starts(timestamps):
+  """
+  每个交易日第一根 K 线处为 True 的布尔数组 (时间戳为最早在前，交易所当地时间)。
+  """
+  days = pd.to_datetime(np.asarray(timestamps)).to_numpy().astype('datetime64[D]')
+  starts = np.empty(len(days), dtype=bool)
+  if len(days):
+    starts[0] = True
+    np.not_equal(days[1:], days[:-1], out=starts[1:])
+  return starts
+
+def _session_index(starts):
+  """每根 K 线所在交易日第一根 K 线的下标。"""
+  return np.maximum.accumulate(np.where(starts, np.arange(len(starts)), 0))
+
+def cumsum_reset(x, starts):
+  """
+  在 starts 为 True 的位置重新开始的累计和 (每个交易日单独累计)。
+  """
+  x = np.asarray(x, dtype=np.float64)
+  total = np.cumsum(x)
+  before = total - x  # 每根 K 线之前的累计和
+  return total - before[_session_index(starts)]
+
+def session_vwap(high, low, close, volume, starts):
+  """
+  按交易日锚定的 VWAP：当天开盘以来 sum(典型价*成交量) / sum(成交量)。
+  当天累计成交量为 0 时为 NaN。
+  """
+  typical_price = (high + low + close) / 3.0
+  total_volume = cumsum_reset(volume, starts)
+  total_pv = cumsum_reset(typical_price * volume, starts)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.where(total_volume != 0, total_pv / total_volume, np.nan)
+
+def session_rolling(x, starts, window, mean=True):
+  """
+  不跨交易日的 window 根滑动和/均值：每个交易日的前 window-1 根为 NaN。
+  """
+  x = np.asarray(x, dtype=np.float64)
+  session_index = _session_index(starts)
+  total = cumsum_reset(x, starts)
+  out = np.full(len(x), np.nan)
+  if len(x) > window:
+    out[window:] = total[window:] - total[:-window]
+  # 当日第 window 根: 窗口从当日第一根开始，直接取当日累计和；
+  # 当日前 window-1 根: 窗口会跨过交易日边界，置为 NaN
+  position = np.arange(len(x)) - session_index
+  full = position == window - 1
+  out[full] = total[full]
+  out[position < window - 1] = np.nan
+  return out / window if mean else out
+
+def compute_indicator_arrays(high, low, close, volume, timestamps=None):
+  """
+  输入为最早数据在前的一维数组，返回 {指标列名: float64 数组} (INDICATOR_COLUMNS 顺序)。
+  给出 timestamps 时另外返回按交易日锚定的 'Session_VWAP' 和不跨交易日的 'Session_SMA_50'。
+  """
+  high = np.asarray(high, dtype=np.float64)
+  low = np.asarray(low, dtype=np.float64)
+  close = np.asarray(close, dtype=np.float64)
+  volume = np.asarray(volume, dtype=np.float64)
+
+  macd_line, macd_signal, macd_hist = macd(close)
+  indicators = {
+    'MACD_line': macd_line,
+    'MACD_signal': macd_signal,
+    'MACD_histogram': macd_hist,
+    'SMA_50': _rolling(close, 50),
+    'EMA_200': _ewm(close, span=200, min_periods=200),
+    'RSI_14': rsi(close, 14),
+    'ATR_14': atr(high, low, close, 14),
+    'VWAP': rolling_vwap(high, low, close, volume, 14),
+  }
+  if timestamps is not None:
+    starts = session_starts(timestamps)
+    indicators['Session_VWAP'] = session_vwap(high, low, close, volume, starts)
+    indicators['Session_SMA_50'] = session_rolling(close, starts, 50)
+  return indicators
+
+def _ta_indicators(df_rev):
+  import ta
+  return {
+    'MACD_line': ta.trend.macd(df_rev['close']),
+    'MACD_signal': ta.trend.macd_signal(df_rev['close']),
+    'MACD_histogram': ta.trend.macd_diff(df_rev['close']),
+    'SMA_50': ta.trend.sma_indicator(df_rev['close'], window=50),
+    'EMA_200': ta.trend.ema_indicator(df_rev['close'], window=200),
+    'RSI_14': ta.momentum.rsi(df_rev['close'], window=14),
+    'ATR_14': ta.volatility.average_true_range(df_rev['high'], df_rev['low'], df_rev['close'], window=14),
+    'VWAP': ta.volume.volume_weighted_average_price(df_rev['high'], df_rev['low'], df_rev['close'], df_rev['volume']),
+  }
+
+def verify_against_ta(file_path, tolerance=TA_TOLERANCE):
+  """
+  回归检查：对同一个 CSV 分别用 ta 和本模块计算，逐列比较。
+  NaN 的位置必须相同，其余值的最大绝对误差不能超过 tolerance。
+  返回不通过的列名列表。
+  """
+  df = pd.read_csv(file_path)
+  df_rev = df.iloc[::-1].reset_index(drop=True)
+
+  t0 = time.time()
+  expected = _ta_indicators(df_rev)
+  t_ta = time.time() - t0
+
+  t0 = time.time()
+  actual = compute_indicator_arrays(df_rev['high'], df_rev['low'], df_rev['close'], df_rev['volume'])
+  t_kernel = time.time() - t0
+
+  mismatched = []
+  for col in INDICATOR_COLUMNS:
+    a = actual[col]
+    b = expected[col].to_numpy(dtype=np.float64)
+    if np.array_equal(a, b, equal_nan=True):
+      print(f"  {col:<15} OK")
+      continue
+    nan_a, nan_b = np.isnan(a), np.isnan(b)
+    if not np.array_equal(nan_a, nan_b):
+      print(f"  {col:<15} MISMATCH (NaN at {np.count_nonzero(nan_a != nan_b)} different rows)")
+      mismatched.append(col)
+      continue
+    max_diff = np.max(np.abs(a[~nan_a] - b[~nan_b]))
+    if max_diff <= tolerance:
+      print(f"  {col:<15} OK (max abs diff {max_diff:.3e})")
+    else:
+      print(f"  {col:<15} MISMATCH (max abs diff {max_diff:.3e} > {tolerance:.0e})")
+      mismatched.append(col)
+  print(f"{len(df)} rows: ta {t_ta:.3f}s, kernels {t_kernel:.3f}s ({t_ta / t_kernel:.1f}x)")
+  return mismatched
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Check the indicator kernels against ta.")
+  parser.add_argument('csv', help="bars CSV (newest first)")
+  parser.add_argument('--tolerance', type=float, default=TA_TOLERANCE, help="max allowed absolute difference")
+  args = parser.parse_args()
+  sys.exit(1 if verify_against_ta(args.csv, args.tolerance) else 0)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import math
+from collections import deque
+
+import numpy as np
+
+# 与 CALCULATE_INDICATOR.py 相同的指标列
+INDICATOR_COLUMNS = [
+  'MACD_line', 'MACD_signal', 'MACD_histogram',
+  'SMA_50', 'EMA_200', 'RSI_14', 'ATR_14', 'VWAP'
+]
+
+NAN = float('nan')
+
+
+class EWM:
+  """
+  与 pandas ewm(adjust=False, min_periods=...).mean() 逐位一致的递推状态。
+  ta 的 EMA / MACD / RSI 都基于它。
+  """
+  __slots__ = ('alpha', 'min_periods', 'weighted', 'nobs')
+
+  def __init__(self, alpha, min_periods):
+    self.alpha = alpha
+    self.min_periods = min_periods
+    self.weighted = NAN
+    self.nobs = 0
+
+  def update(self, value):
+    is_observation = value == value
+    self.nobs += is_observation
+    if self.weighted == self.weighted:
+      if is_observation and self.weighted != value:
+        old_wt = 1. - self.alpha
+        self.weighted = old_wt * self.weighted + self.alpha * value
+        self.weighted /= (old_wt + self.alpha)
+    elif is_observation:
+      self.weighted = value
+    return self.weighted if self.nobs >= self.min_periods else NAN
+
+  def to_dict(self):
+    return {'weighted': self.weighted, 'nobs': self.nobs}
+
+  def load(self, d):
+    self.weighted = d['weighted']
+    self.nobs = d['nobs']
+
+
+class RollingSum:
+  """
+  与 pandas rolling(window).sum() / .mean() 逐位一致的滑动窗口状态
+  (Kahan 补偿求和，加入和移出各自一套补偿量)。
+  """
+  __slots__ = ('window', 'mean', 'values', 'sum_x', 'compensation_add', 'compensation_remove',
+               'nobs', 'neg_ct', 'num_consecutive_same_value', 'prev_value')
+
+  def __init__(self, window, mean=False):
+    self.window = window
+    self.mean = mean
+    self.values = deque()
+    self.sum_x = 0.0
+    self.compensation_add = 0.0
+    self.compensation_remove = 0.0
+    self.nobs = 0
+    self.neg_ct = 0
+    self.num_consecutive_same_value = 0
+    self.prev_value = NAN
+
+  def update(self, value):
+    if not self.values:
+      self.prev_value = value
+
+    # 先移出窗口外的值
+    if len(self.values) == self.window:
+      old = self.values.popleft()
+      if old == old:
+        self.nobs -= 1
+        y = -old - self.compensation_remove
+        t = self.sum_x + y
+        self.compensation_remove = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, old) < 0:
+          self.neg_ct -= 1
+
+    # 再加入新值
+    self.values.append(value)
+    if value == value:
+      self.nobs += 1
+      y = value - self.compensation_add
+      t = self.sum_x + y
+      self.compensation_add = t - self.sum_x - y
+      self.sum_x = t
+      if math.copysign(1.0, value) < 0:
+        self.neg_ct += 1
+      if value == self.prev_value:
+        self.num_consecutive_same_value += 1
+      else:
+        self.num_consecutive_same_value = 1
+      self.prev_value = value
+
+    if self.nobs < self.window or self.nobs == 0:
+      return NAN
+    if self.mean:
+      result = self.sum_x / self.nobs
+      if self.num_consecutive_same_value >= self.nobs:
+        result = self.prev_value
+      elif self.neg_ct == 0 and result < 0:
+        result = 0.0
+      elif self.neg_ct == self.nobs and result > 0:
+        result = 0.0
+      return result
+    if self.num_consecutive_same_value >= self.nobs:
+      return self.prev_value * self.nobs
+    return self.sum_x
+
+  def to_dict(self):
+    return {
+      'values': list(self.values),
+      'sum_x': self.sum_x,
+      'compensation_add': self.compensation_add,
+      'compensation_remove': self.compensation_remove,
+      'nobs': self.nobs,
+      'neg_ct': self.neg_ct,
+      'num_consecutive_same_value': self.num_consecutive_same_value,
+      'prev_value': self.prev_value,
+    }
+
+  def load(self, d):
+    for k, v in d.items():
+      setattr(self, k, deque(v) if k == 'values' else v)
+
+
+class IndicatorState:
+  """
+  增量指标计算的全部状态：
+    - MACD: EMA_12 / EMA_26 / 信号线 EMA_9
+    - SMA_50 的滑动窗口
+    - EMA_200
+    - RSI_14 的 Wilder 平均涨跌幅
+    - ATR_14 的 Wilder 平均真实波幅
+    - VWAP 的 14 根滑动 (典型价*成交量, 成交量) 累计和
+
+  按时间顺序 (最早的在前) 每次喂入一根 K 线，得到与 ta 整体重算相同的指标值。
+  状态可以用 to_dict() / from_dict() 存取 (JSON 旁路文件)。
+  """
+
+  def __init__(self):
+    self.ema_fast = EWM(2.0 / (12 + 1), 12)
+    self.ema_slow = EWM(2.0 / (26 + 1), 26)
+    self.macd_signal = EWM(2.0 / (9 + 1), 9)
+    self.sma_50 = RollingSum(50, mean=True)
+    self.ema_200 = EWM(2.0 / (200 + 1), 200)
+    self.rsi_up = EWM(1 / 14, 14)
+    self.rsi_down = EWM(1 / 14, 14)
+    self.vwap_pv = RollingSum(14)
+    self.vwap_volume = RollingSum(14)
+    self.atr_window = 14
+    self.atr = 0.0
+    self.atr_warmup = []
+    self.prev_close = NAN
+    self.count = 0
+
+  def update(self, high, low, close, volume):
+    """
+    喂入一根 K 线，返回 INDICATOR_COLUMNS 顺序的指标值 (未四舍五入)。
+    """
+    high = float(high)
+    low = float(low)
+    close = float(close)
+    volume = float(volume)
+    prev_close = self.prev_close
+
+    # MACD
+    fast = self.ema_fast.update(close)
+    slow = self.ema_slow.update(close)
+    macd_line = fast - slow
+    macd_signal = self.macd_signal.update(macd_line)
+    macd_hist = macd_line - macd_signal
+
+    # SMA_50 / EMA_200
+    sma_50 = self.sma_50.update(close)
+    ema_200 = self.ema_200.update(close)
+
+    # RSI_14 (第一根 K 线的涨跌幅按 0 处理，与 ta 一致)
+    diff = close - prev_close
+    up = diff if diff > 0 else 0.0
+    down = -diff if diff < 0 else -0.0
+    emaup = self.rsi_up.update(up)
+    emadn = self.rsi_down.update(down)
+    if emadn == 0:
+      rsi = 100.0
+    else:
+      rsi = 100 - (100 / (1 + emaup / emadn))
+
+    # ATR_14 (前 window-1 根为 0，第 window 根为真实波幅均值，之后 Wilder 平滑)
+    if prev_close == prev_close:
+      true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+    else:
+      true_range = high - low
+    if self.count < self.atr_window:
+      self.atr_warmup.append(true_range)
+      if self.count == self.atr_window - 1:
+        self.atr = float(np.sum(np.array(self.atr_warmup)) / self.atr_window)
+        self.atr_warmup = []
+      atr = self.atr
+    else:
+      self.atr = (self.atr * (self.atr_window - 1) + true_range) / float(self.atr_window)
+      atr = self.atr
+
+    # VWAP (14 根滑动窗口)
+    typical_price = (high + low + close) / 3.0
+    total_pv = self.vwap_pv.update(typical_price * volume)
+    total_volume = self.vwap_volume.update(volume)
+    vwap = total_pv / total_volume if total_volume == total_volume and total_volume != 0 else NAN
+
+    self.prev_close = close
+    self.count += 1
+    return (macd_line, macd_signal, macd_hist, sma_50, ema_200, rsi, atr, vwap)
+
+  def to_dict(self):
+    return {
+      'ema_fast': self.ema_fast.to_dict(),
+      'ema_slow': self.ema_slow.to_dict(),
+      'macd_signal': self.macd_signal.to_dict(),
+      'sma_50': self.sma_50.to_dict(),
+      'ema_200': self.ema_200.to_dict(),
+      'rsi_up': self.rsi_up.to_dict(),
+      'rsi_down': self.rsi_down.to_dict(),
+      'vwap_pv': self.vwap_pv.to_dict(),
+      'vwap_volume': self.vwap_volume.to_dict(),
+      'atr': self.atr,
+      'atr_warmup': list(self.atr_warmup),
+      'prev_close': self.prev_close,
+      'count': self.count,
+    }
+
+  @classmethod
+  def from_dict(cls, d):
+    state = cls()
+    for name in ['ema_fast', 'ema_slow', 'macd_signal', 'sma_50', 'ema_200',
+                 'rsi_up', 'rsi_down', 'vwap_pv', 'vwap_volume']:
+      getattr(state, name).load(d[name])
+    state.atr = d['atr']
+    state.atr_warmup = list(d['atr_warmup'])
+    state.prev_close = d['prev_close']
+    state.count = d['count']
+    return state
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+# 市场结构 + 供需区 (basis/strategy.md 第一、二部分)，在最早数据在前的 OHLC 数组上计算。
+#
+# 1. 摆动点 (swing_points): 第 p 根的 high 是前后各 k 根里的最高点即为摆动高点，
+#    低点同理。用滚动最大/最小值 (pandas rolling，单调队列，O(n)) 一次向量化求出；
+#    摆动点要等右边 k 根走完才能确认，所以它在第 p + k 根才"可见"，不使用未来数据。
+# 2. 市场结构 (market_structure): 维护有效高点 Valid_High 和有效低点 Valid_Low
+#    - 收盘价突破有效高点 -> 上升趋势 (Trend = 1)。有效低点转移到
+#      "旧有效高点到突破这根之间的最低点" (创出更高高点之前的那个回调低点)
+#    - 收盘价跌破有效低点 -> 下降趋势 (Trend = -1)，对称处理
+#    - 突破之后新的有效高点 (上升趋势) 还没形成，Valid_High 为 NaN，直到下一个摆动高点确认，
+#      取突破以来的最高价
+#    循环只在事件 (突破、摆动点确认) 之间跳转，事件之间用分块的 NumPy 比较查找下一次突破。
+# 3. 供需区 (supply_demand_zones):
+#    - 盘整: 大行情前 base_window 根 K 线的波动范围 <= base_atr_mult * ATR
+#    - 大行情: 实体 >= impulse_atr_mult * ATR 且收盘突破盘整区间
+#    - 上升趋势中向上的大行情 -> 需求区 = 大行情前一根 K 线的 low 到 high；
+#      下降趋势中向下的大行情 -> 供给区
+#    - 区域一直有效，直到收盘价穿过区域另一侧 (失效) 或出现同方向的新区域
+#    - Zone_Entry: 价格第一次回到区域内的那根 (需求区 1，供给区 -1)
+# 4. zone_signals: 按第三部分的风险回报比 (>= 2.5) 生成 event_backtest 可用的信号、
+#    入场限价、止损 (区域外侧) 和止盈 (最近的高点/低点)。
+#
+# 输出列 (structure_arrays / compute_structure):
+#   Trend, Valid_High, Valid_Low, Structure_Break,
+#   Demand_High, Demand_Low, Supply_High, Supply_Low, Zone_Entry
+#
+# 用法:
+#   python market_structure.py ./TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01.csv
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicator_kernels import atr as wilder_atr
+from signal_engine import BUY, SELL
+
+SWING_K = 5
+ATR_WINDOW = 14
+BASE_WINDOW = 5
+BASE_ATR_MULT = 1.5
+IMPULSE_ATR_MULT = 2.0
+MIN_REWARD_RISK = 2.5
+
+STRUCTURE_COLUMNS = [
+  'Trend', 'Valid_High', 'Valid_Low', 'Structure_Break',
+  'Demand_High', 'Demand_Low', 'Supply_High', 'Supply_Low', 'Zone_Entry',
+]
+
+def _rolling_max(x, window):
+  return pd.Series(x, copy=False).rolling(window, min_periods=1).max().to_numpy()
+
+def _rolling_min(x, window):
+  return pd.Series(x, copy=False).rolling(window, min_periods=1).min().to_numpy()
+
+def _first_true(mask_fn, start, end):
+  """
+  [start, end) 中第一个 mask_fn(a, b) 为 True 的下标，没有则返回 end。
+  mask_fn 返回 [a, b) 上的布尔数组；窗口从 64 根开始倍增，事件来得早时不会扫描后面的数据。
+  """
+  chunk = 64
+  a = start
+  while a < end:
+    b = min(a + chunk, end)
+    hit = mask_fn(a, b)
+    if hit.any():
+      return a + int(hit.argmax())
+    a = b
+    chunk *= 2
+  return end
+
+def swing_points(high, low, k=SWING_K):
+  """
+  返回 (swing_high_idx, swing_low_idx)，升序的摆动点下标 p (在 p + k 根确认)。
+  左边允许相等，右边必须严格更低/更高，连续相同的高点只算最后一个。
+  """
+  high = np.asarray(high, dtype=np.float64)
+  low = np.asarray(low, dtype=np.float64)
+  n = len(high)
+  if n < 2 * k + 1:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+  # 第 j 根的滚动值覆盖 [j - window + 1, j]，取 j = p + k
+  max_all = _rolling_max(high, 2 * k + 1)[2 * k:]
+  max_right = _rolling_max(high, k)[2 * k:]
+  min_all = _rolling_min(low, 2 * k + 1)[2 * k:]
+  min_right = _rolling_min(low, k)[2 * k:]
+  mid_high = high[k:n - k]
+  mid_low = low[k:n - k]
+  sh = np.flatnonzero((mid_high >= max_all) & (mid_high > max_right)) + k
+  sl = np.flatnonzero((mid_low <= min_all) & (mid_low < min_right)) + k
+  return sh, sl
+
+def market_structure(high, low, close, k=SWING_K):
+  """
+  返回 {'Trend', 'Valid_High', 'Valid_Low', 'Structure_Break'}，与 close 等长。
+    Trend            int8: 1 上升 / -1 下降 / 0 尚未确定
+    Valid_High/Low   当前有效高点/低点 (该根收盘后的状态)，尚未形成时为 NaN
+    Structure_Break  int8: 1 收盘突破有效高点 / -1 收盘跌破有效低点 / 0
+  """
+  high = np.ascontiguousarray(high, dtype=np.float64)
+  low = np.ascontiguousarray(low, dtype=np.float64)
+  close = np.ascontiguousarray(close, dtype=np.float64)
+  n = len(close)
+  sh, sl = swing_points(high, low, k)
+
+  trend = 0
+  vh = vl = np.nan
+  vh_bar = vl_bar = -1
+  events = [(0, 0, np.nan, np.nan)]   # (K 线下标, Trend, Valid_High, Valid_Low): 从该根收盘起的状态
+  breaks = []                         # (K 线下标, 方向)
+
+  # 起点: 第一个摆动高点和摆动低点都确认之后
+  if len(sh) and len(sl):
+    vh_bar, vl_bar = int(sh[0]), int(sl[0])
+    vh, vl = high[vh_bar], low[vl_bar]
+    t = max(vh_bar, vl_bar) + k
+    events.append((t, 0, vh, vl))
+    t += 1
+  else:
+    t = n
+
+  pending = 0   # 1: 等待新的有效高点，-1: 等待新的有效低点
+  since = -1    # 上一次突破的 K 线
+  while t < n:
+    # 等待中的一侧在下一个摆动点确认时形成
+    if pending == 1:
+      k_idx = np.searchsorted(sh, since)
+      confirm = int(sh[k_idx]) + k if k_idx < len(sh) else n
+    elif pending == -1:
+      k_idx = np.searchsorted(sl, since)
+      confirm = int(sl[k_idx]) + k if k_idx < len(sl) else n
+    else:
+      confirm = n
+    end = min(confirm, n - 1) + 1
+
+    if pending == 1:
+      b = _first_true(lambda a, z: close[a:z] < vl, t, end)
+    elif pending == -1:
+      b = _first_true(lambda a, z: close[a:z] > vh, t, end)
+    else:
+      b = _first_true(lambda a, z: (close[a:z] > vh) | (close[a:z] < vl), t, end)
+
+    if b < end:
+      if close[b] > vh:
+        # 更高的高点: 有效低点转移到这次上涨之前的回调低点
+        vl_bar = vh_bar + int(low[vh_bar:b + 1].argmin())
+        vl = low[vl_bar]
+        vh = np.nan
+        trend, pending = 1, 1
+      else:
+        vh_bar = vl_bar + int(high[vl_bar:b + 1].argmax())
+        vh = high[vh_bar]
+        vl = np.nan
+        trend, pending = -1, -1
+      since = b
+      breaks.append((b, trend))
+      events.append((b, trend, vh, vl))
+      t = b + 1
+    elif confirm < n:
+      if pending == 1:
+        vh_bar = since + int(high[since:confirm + 1].argmax())
+        vh = high[vh_bar]
+      else:
+        vl_bar = since + int(low[since:confirm + 1].argmin())
+        vl = low[vl_bar]
+      pending = 0
+      events.append((confirm, trend, vh, vl))
+      t = confirm + 1
+    else:
+      break
+
+  ev_idx = np.array([e[0] for e in events], dtype=np.int64)
+  seg = np.searchsorted(ev_idx, np.arange(n), side='right') - 1
+  structure_break = np.zeros(n, dtype=np.int8)
+  for b, direction in breaks:
+    structure_break[b] = direction
+  return {
+    'Trend': np.array([e[1] for e in events], dtype=np.int8)[seg],
+    'Valid_High': np.array([e[2] for e in events], dtype=np.float64)[seg],
+    'Valid_Low': np.array([e[3] for e in events], dtype=np.float64)[seg],
+    'Structure_Break': structure_break,
+  }
+
+def _zone_lifetimes(created, zone_near, zone_far, low, high, close, demand, n):
+  """
+  每个区域的 (首次回到区域的 K 线, 失效或被替换的 K 线)，没有则为 n。
+  需求区: 回到区域 = low <= 区域上沿，失效 = close < 区域下沿；供给区相反。
+  """
+  entries = np.full(len(created), n, dtype=np.int64)
+  ends = np.full(len(created), n, dtype=np.int64)
+  for z, t in enumerate(created):
+    limit = int(created[z + 1]) if z + 1 < len(created) else n
+    near, far = zone_near[z], zone_far[z]
+    if demand:
+      entry = _first_true(lambda a, b: low[a:b] <= near, t + 1, limit)
+      broken = _first_true(lambda a, b: close[a:b] < far, max(entry, t + 1), limit)
+    else:
+      entry = _first_true(lambda a, b: high[a:b] >= near, t + 1, limit)
+      broken = _first_true(lambda a, b: close[a:b] > far, max(entry, t + 1), limit)
+    if entry < limit:
+      entries[z] = entry
+    ends[z] = broken
+  return entries, ends
+
+def supply_demand_zones(open_, high, low, close, trend, atr, base_window=BASE_WINDOW,
+                        base_atr_mult=BASE_ATR_MULT, impulse_atr_mult=IMPULSE_ATR_MULT):
+  """
+  返回 {'Demand_High', 'Demand_Low', 'Supply_High', 'Supply_Low', 'Zone_Entry'} 以及
+  区域列表 'demand' / 'supply' (结构化数组: created, entry, end, zone_high, zone_low)。
+  区域在大行情那根 (created) 收盘时出现，[created, end) 期间有效。
+  """
+  open_ = np.ascontiguousarray(open_, dtype=np.float64)
+  high = np.ascontiguousarray(high, dtype=np.float64)
+  low = np.ascontiguousarray(low, dtype=np.float64)
+  close = np.ascontiguousarray(close, dtype=np.float64)
+  trend = np.asarray(trend)
+  atr = np.asarray(atr, dtype=np.float64)
+  n = len(close)
+
+  # 前一根为止的盘整区间 (第 t 根用 [t - base_window, t - 1])
+  base_high = np.full(n, np.nan)
+  base_low = np.full(n, np.nan)
+  base_high[1:] = _rolling_max(high, base_window)[:-1]
+  base_low[1:] = _rolling_min(low, base_window)[:-1]
+  prev_atr = np.full(n, np.nan)
+  prev_atr[1:] = atr[:-1]
+  valid = np.zeros(n, dtype=bool)
+  valid[base_window:] = True
+
+  with np.errstate(invalid='ignore'):
+    consolidation = valid & (prev_atr > 0) & (base_high - base_low <= base_atr_mult * prev_atr)
+    body = close - open_
+    impulse_up = consolidation & (body >= impulse_atr_mult * prev_atr) & (close > base_high)
+    impulse_down = consolidation & (-body >= impulse_atr_mult * prev_atr) & (close < base_low)
+
+  columns = {
+    'Demand_High': np.full(n, np.nan), 'Demand_Low': np.full(n, np.nan),
+    'Supply_High': np.full(n, np.nan), 'Supply_Low': np.full(n, np.nan),
+    'Zone_Entry': np.zeros(n, dtype=np.int8),
+  }
+  zone_dtype = np.dtype([('created', np.int64), ('entry', np.int64), ('end', np.int64),
+                         ('zone_high', np.float64), ('zone_low', np.float64)])
+  zones = {}
+  for name, mask, demand in (('demand', impulse_up & (trend == 1), True),
+                             ('supply', impulse_down & (trend == -1), False)):
+    created = np.flatnonzero(mask)
+    zone_high = high[created - 1]   # 大行情前一根 K 线
+    zone_low = low[created - 1]
+    if demand:
+      entries, ends = _zone_lifetimes(created, zone_high, zone_low, low, high, close, True, n)
+      hi_col, lo_col, code = 'Demand_High', 'Demand_Low', 1
+    else:
+      entries, ends = _zone_lifetimes(created, zone_low, zone_high, low, high, close, False, n)
+      hi_col, lo_col, code = 'Supply_High', 'Supply_Low', -1
+
+    # 每根 K 线最近创建的区域，若仍在有效期内则输出
+    if len(created):
+      latest = np.searchsorted(created, np.arange(n), side='right') - 1
+      z = np.maximum(latest, 0)
+      active = (latest >= 0) & (np.arange(n) < ends[z])
+      columns[hi_col] = np.where(active, zone_high[z], np.nan)
+      columns[lo_col] = np.where(active, zone_low[z], np.nan)
+      columns['Zone_Entry'][entries[entries < n]] = code
+
+    table = np.empty(len(created), dtype=zone_dtype)
+    table['created'] = created
+    table['entry'] = entries
+    table['end'] = ends
+    table['zone_high'] = zone_high
+    table['zone_low'] = zone_low
+    zones[name] = table
+
+  columns.update(zones)
+  return columns
+
+def structure_arrays(open_, high, low, close, atr=None, k=SWING_K, base_window=BASE_WINDOW,
+                     base_atr_mult=BASE_ATR_MULT, impulse_atr_mult=IMPULSE_ATR_MULT):
+  """
+  输入为最早数据在前的一维数组，返回 {列名: 数组} (STRUCTURE_COLUMNS) 以及区域列表
+  'demand' / 'supply'。atr 不给时用 Wilder ATR_14 (与 CALCULATE_INDICATOR 相同)。
+  """
+  high = np.ascontiguousarray(high, dtype=np.float64)
+  low = np.ascontiguousarray(low, dtype=np.float64)
+  close = np.ascontiguousarray(close, dtype=np.float64)
+  if atr is None:
+    atr = wilder_atr(high, low, close, ATR_WINDOW)
+  result = market_structure(high, low, close, k)
+  result.update(supply_demand_zones(open_, high, low, close, result['Trend'], atr,
+                                    base_window, base_atr_mult, impulse_atr_mult))
+  return result
+
+def compute_structure(df, **params):
+  """
+  DataFrame 版本: df 为最新数据在上 (与 Alpha Vantage CSV 相同)，返回加了 STRUCTURE_COLUMNS 的新 DataFrame。
+  有 ATR_14 列时直接使用。
+  """
+  df = df.reset_index(drop=True)
+  arrays = [df[c].to_numpy(dtype='float64')[::-1] for c in ('open', 'high', 'low', 'close')]
+  atr = df['ATR_14'].to_numpy(dtype='float64')[::-1] if 'ATR_14' in df.columns else None
+  result = structure_arrays(*arrays, atr=atr, **params)
+  for col in STRUCTURE_COLUMNS:
+    df[col] = result[col][::-1]
+  return df
+
+def zone_signals(structure, high, min_reward_risk=MIN_REWARD_RISK):
+  """
+  第二、三部分的交易规则，返回 event_backtest.backtest_orders 需要的
+  (codes, entry_price, stop_price, target_price)，后三个是按信号 K 线取值的数组:
+    - 需求区出现的那根 K 线发出 BUY，在区域上沿挂买入限价单 (entry_type=LIMIT)
+    - 止损在区域下沿，止盈在最近的高点 (大行情那根的 high)
+    - 止盈距离 < min_reward_risk * 止损距离的区域不交易
+    - 供给区出现的那根 K 线发出 SELL (只做多: 平仓并撤销挂单)
+  """
+  high = np.asarray(high, dtype=np.float64)
+  n = len(high)
+  codes = np.zeros(n, dtype=np.int8)
+  entry = np.full(n, np.nan)
+  stop = np.full(n, np.nan)
+  target = np.full(n, np.nan)
+
+  demand = structure['demand']
+  created = demand['created']
+  reward = high[created] - demand['zone_high']
+  risk = demand['zone_high'] - demand['zone_low']
+  ok = (risk > 0) & (reward >= min_reward_risk * risk)
+  created = created[ok]
+  codes[created] = BUY
+  entry[created] = demand['zone_high'][ok]
+  stop[created] = demand['zone_low'][ok]
+  target[created] = high[created]
+
+  codes[structure['supply']['created']] = SELL
+  return codes, entry, stop, target
+
+def main():
+  if len(sys.argv) < 2:
+    print("usage: python market_structure.py <ohlcv csv (newest first)>")
+    return 1
+  df = pd.read_csv(sys.argv[1])
+  df_rev = df.iloc[::-1].reset_index(drop=True)
+  arrays = [df_rev[c].to_numpy(dtype=np.float64) for c in ('open', 'high', 'low', 'close')]
+
+  t0 = time.time()
+  result = structure_arrays(*arrays)
+  elapsed = time.time() - t0
+
+  trend = result['Trend']
+  print(f"{len(df_rev)} bars in {elapsed * 1000:.1f} ms")
+  print(f"  uptrend {np.mean(trend == 1):.1%}  downtrend {np.mean(trend == -1):.1%}")
+  print(f"  structure breaks: {np.count_nonzero(result['Structure_Break'])}")
+  print(f"  demand zones: {len(result['demand'])}  supply zones: {len(result['supply'])}")
+  print(f"  zone entries: {np.count_nonzero(result['Zone_Entry'])}")
+  return 0
+
+if __name__ == "__main__":
+  raise SystemExit(main())
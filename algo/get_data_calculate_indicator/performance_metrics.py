@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# 绩效指标：在权益曲线 (Portfolio_Value) 和成交行号上用 NumPy 归约计算，
+# 不修改输入，不做 DataFrame groupby，可在参数扫描的内层循环里调用。
+# - 日收益: 每个交易日最后一根的权益 (day_end_indices 只需对时间戳算一次，同一份数据的所有回测共用)
+# - Sharpe / Sortino: 日收益年化 (sqrt(252))，无风险利率按 0
+# - 最大回撤及持续时间: 从前高到收复 (或数据结束) 的最长时间
+# - CAGR / Calmar = CAGR / |最大回撤|
+# - 胜率、盈亏比 (profit factor): 按每一笔 BUY -> SELL 的完整交易
+# - 持仓时间占比 (exposure)、换手率 (成交额 / 平均权益)
+# 成交行号与 backtest_core.trade_indices / backtest_arrays 相同 (BUY, SELL 交替，全进全出)。
+
+import numpy as np
+
+import backtest_core
+import signal_engine
+
+NS_PER_DAY = 24 * 60 * 60 * 10**9
+TRADING_DAYS_PER_YEAR = 252
+DAYS_PER_YEAR = 365.25
+
+def day_end_indices(timestamps):
+  """
+  int64 ns 升序时间戳 -> 每个交易日最后一根 K 线的行号。
+  """
+  day = np.asarray(timestamps, dtype=np.int64) // NS_PER_DAY
+  if len(day) == 0:
+    return np.empty(0, dtype=np.int64)
+  return np.r_[np.flatnonzero(day[1:] != day[:-1]), len(day) - 1]
+
+def daily_returns(portfolio_value, day_ends, initial_balance=10000):
+  """
+  每个交易日的收益率 (第一天相对 initial_balance)。
+  """
+  values = np.asarray(portfolio_value, dtype=np.float64)[day_ends]
+  prev = np.empty_like(values)
+  if len(values):
+    prev[0] = initial_balance
+    prev[1:] = values[:-1]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return values / prev - 1
+
+def sharpe_ratio(returns, periods_per_year=TRADING_DAYS_PER_YEAR):
+  if len(returns) < 2:
+    return np.nan
+  std = returns.std(ddof=1)
+  return returns.mean() / std * np.sqrt(periods_per_year) if std > 0 else np.nan
+
+def sortino_ratio(returns, periods_per_year=TRADING_DAYS_PER_YEAR):
+  if len(returns) < 2:
+    return np.nan
+  downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+  return returns.mean() / downside * np.sqrt(periods_per_year) if downside > 0 else np.nan
+
+def max_drawdown(portfolio_value, timestamps=None):
+  """
+  返回 (最大回撤 (负数), 最长回撤持续 K 线数, 最长回撤持续天数)。
+  持续时间从前高那根算到重新站上前高 (或数据结束)；没有 timestamps 时天数为 NaN。
+  """
+  equity = np.asarray(portfolio_value, dtype=np.float64)
+  if len(equity) == 0:
+    return 0.0, 0, np.nan
+  peak = np.maximum.accumulate(equity)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    mdd = float((equity / peak).min() - 1)
+
+  # 创新高 (或持平) 的行；两次新高之间就是一段回撤，最后一段持续到数据结束
+  highs = np.flatnonzero(equity >= peak)
+  last_underwater = np.r_[highs[1:] - 1, len(equity) - 1]
+  longest = int((last_underwater - highs).max())
+  if timestamps is None:
+    days = np.nan
+  else:
+    ts = np.asarray(timestamps, dtype=np.int64)
+    days = float((ts[last_underwater] - ts[highs]).max()) / NS_PER_DAY
+  return mdd, longest, days
+
+def round_trips(trades):
+  """
+  交替的 BUY/SELL 成交行号 -> (入场行号, 出场行号)；最后一笔未平仓的 BUY 不计入。
+  """
+  trades = np.asarray(trades, dtype=np.int64)
+  n = len(trades) // 2
+  return trades[0:2 * n:2], trades[1:2 * n:2]
+
+def trade_stats(pnl):
+  """
+  每笔交易盈亏 -> (胜率, 盈亏比)。没有亏损交易时盈亏比为 inf (也没有盈利时为 NaN)。
+  """
+  pnl = np.asarray(pnl, dtype=np.float64)
+  if len(pnl) == 0:
+    return np.nan, np.nan
+  gross_profit = pnl[pnl > 0].sum()
+  gross_loss = -pnl[pnl < 0].sum()
+  win_rate = np.count_nonzero(pnl > 0) / len(pnl)
+  if gross_loss > 0:
+    profit_factor = gross_profit / gross_loss
+  else:
+    profit_factor = np.inf if gross_profit > 0 else np.nan
+  return win_rate, profit_factor
+
+def exposure(trades, n_rows):
+  """
+  持仓的 K 线占比 (BUY 那根到 SELL 前一根算持仓)。
+  """
+  if n_rows == 0:
+    return 0.0
+  trades = np.asarray(trades, dtype=np.int64)
+  entries, exits = round_trips(trades)
+  held = int((exits - entries).sum())
+  if len(trades) % 2 == 1:
+    held += n_rows - int(trades[-1])
+  return held / n_rows
+
+def performance_summary(portfolio_value, trades, timestamps, initial_balance=10000, day_ends=None):
+  """
+  全进全出回测 (backtest_core.backtest_arrays) 的全部绩效指标，返回字典。
+  day_ends 可预先用 day_end_indices 算好传入 (扫描时所有组合共用)。
+  """
+  equity = np.asarray(portfolio_value, dtype=np.float64)
+  ts = np.asarray(timestamps, dtype=np.int64)
+  trades = np.asarray(trades, dtype=np.int64)
+  if day_ends is None:
+    day_ends = day_end_indices(ts)
+  n = len(equity)
+
+  returns = daily_returns(equity, day_ends, initial_balance)
+  mdd, mdd_bars, mdd_days = max_drawdown(equity, ts)
+  final_value = float(equity[-1]) if n else float(initial_balance)
+  years = (ts[-1] - ts[0]) / NS_PER_DAY / DAYS_PER_YEAR if n > 1 else 0.0
+  if years > 0 and initial_balance > 0 and final_value > 0:
+    cagr = (final_value / initial_balance) ** (1 / years) - 1
+  else:
+    cagr = np.nan
+
+  # 全进全出: BUY 那根的权益就是投入的现金，SELL 那根的权益就是卖出所得
+  entries, exits = round_trips(trades)
+  pnl = equity[exits] - equity[entries]
+  win_rate, profit_factor = trade_stats(pnl)
+  mean_equity = equity.mean() if n else np.nan
+  traded_value = equity[trades].sum()
+
+  return {
+    'Sharpe': sharpe_ratio(returns),
+    'Sortino': sortino_ratio(returns),
+    'Max_Drawdown': mdd,
+    'Max_Drawdown_Bars': mdd_bars,
+    'Max_Drawdown_Days': mdd_days,
+    'CAGR': cagr,
+    'Calmar': cagr / -mdd if mdd < 0 else np.nan,
+    'Round_Trips': len(pnl),
+    'Win_Rate': win_rate,
+    'Profit_Factor': profit_factor,
+    'Exposure': exposure(trades, n),
+    'Turnover': traded_value / mean_equity if mean_equity > 0 else np.nan,
+  }
+
+def frame_metrics(df, initial_balance=10000):
+  """
+  analyze_portfolio 用: 从 DataFrame 的 timestamp / Signal / Portfolio_Value 列读取数组
+  (不修改 df)，成交行号由信号重新推出。
+  """
+  codes = signal_engine.labels_to_codes(df['Signal'].to_numpy())
+  timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+  return performance_summary(
+    df['Portfolio_Value'].to_numpy(),
+    backtest_core.trade_indices(codes, initial_balance),
+    timestamps,
+    initial_balance,
+  )
+
+def print_metrics(metrics):
+  print(f"Sharpe Ratio: {metrics['Sharpe']:.2f}")
+  print(f"Sortino Ratio: {metrics['Sortino']:.2f}")
+  print(f"Max Drawdown: {metrics['Max_Drawdown']:.2%} "
+        f"(longest {metrics['Max_Drawdown_Days']:.1f} days / {metrics['Max_Drawdown_Bars']} bars under water)")
+  print(f"CAGR: {metrics['CAGR']:.2%}")
+  print(f"Calmar Ratio: {metrics['Calmar']:.2f}")
+  print(f"Round Trips: {metrics['Round_Trips']}")
+  print(f"Win Rate: {metrics['Win_Rate']:.2%}")
+  print(f"Profit Factor: {metrics['Profit_Factor']:.2f}")
+  print(f"Exposure: {metrics['Exposure']:.2%}")
+  print(f"Turnover: {metrics['Turnover']:.1f}x")
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# 组合回测：一份共享现金同时交易整个自选股列表，而不是每只股票各自一份 initial_balance。
+# - 各股票的 1 分钟 K 线对齐到同一个分钟时钟 (所有时间戳的并集)，
+#   数据是 (时间 x 股票) 的二维数组；某只股票缺少的那一分钟不产生信号，估值沿用上一根收盘价
+# - 信号仍由 signal_engine 按每只股票自己的 K 线计算 (ATR_mean 的滚动窗口不跨越缺失的分钟)
+# - 每个有信号的分钟: 先执行 SELL (释放现金)，再按仓位规则分配现金给 BUY
+#     'equal':         每只股票最多占当前总资产的 1 / max_positions
+#     'cash_fraction': 每次买入使用剩余现金的 fraction
+#   同一分钟 BUY 的股票多于可用仓位/现金时，按 priority (越大越优先，默认按股票顺序) 分配
+# - 循环只走有信号的分钟，每一步在长度为股票数的一维状态上做向量运算；
+#   持仓只在成交处记录增减量，最后 cumsum 成 (时间 x 股票) 的持仓数组
+# 只有一只股票、'cash_fraction' 且 fraction=1 时，结果与 backtest_core.backtest_arrays 逐位一致。
+#
+# 用法 (K 线来自 bar_store.py):
+#   python portfolio_backtest.py TSLA AAPL NVDA --store ./bar_store --max-positions 2
+
+import argparse
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import bar_store
+import indicator_kernels
+import signal_engine
+from signal_engine import BUY, SELL
+
+INITIAL_BALANCE = 10000
+ATR_WINDOW = 14
+MAX_POSITIONS = 10
+NS_PER_MINUTE = 60 * 10**9
+
+TRADE_DTYPE = np.dtype([
+  ('row', np.int64), ('symbol', np.int64), ('side', np.int8),
+  ('shares', np.float64), ('price', np.float64),
+])
+
+def align_to_clock(timestamps, columns):
+  """
+  把各股票的数组对齐到同一个时钟。
+    timestamps  [int64 ns 升序数组, ...] (每只股票一个)
+    columns     {列名: [一维数组, ...]}，与 timestamps 一一对应
+  返回 (clock, present, aligned):
+    clock    所有时间戳的并集 (int64 ns)
+    present  bool (T, S)，该股票在该分钟有 K 线
+    aligned  {列名: (T, S) 数组}，缺失处为 NaN (整数列为 0)
+  """
+  timestamps = [np.asarray(ts, dtype=np.int64) for ts in timestamps]
+  nonempty = [ts for ts in timestamps if len(ts)]
+  if not nonempty:
+    clock = np.empty(0, dtype=np.int64)
+    rows = [np.empty(0, dtype=np.int64) for _ in timestamps]
+  elif all((ts % NS_PER_MINUTE == 0).all() for ts in nonempty):
+    # 整分钟的时间戳: 在分钟位图上取并集，O(n)，不需要对所有时间戳排序
+    first = min(int(ts[0]) for ts in nonempty) // NS_PER_MINUTE
+    last = max(int(ts[-1]) for ts in nonempty) // NS_PER_MINUTE
+    minutes = [ts // NS_PER_MINUTE - first for ts in timestamps]
+    mark = np.zeros(last - first + 1, dtype=bool)
+    for m in minutes:
+      mark[m] = True
+    clock = (np.flatnonzero(mark) + first) * NS_PER_MINUTE
+    row_of_minute = np.cumsum(mark) - 1
+    rows = [row_of_minute[m] for m in minutes]
+  else:
+    clock = np.unique(np.concatenate(timestamps))
+    rows = [np.searchsorted(clock, ts) for ts in timestamps]
+  n_rows, n_symbols = len(clock), len(timestamps)
+
+  # 先按 (股票, 时间) 连续写入再转置，比按列分散写入快
+  present = np.zeros((n_symbols, n_rows), dtype=bool)
+  for s, r in enumerate(rows):
+    present[s, r] = True
+
+  aligned = {}
+  for name, arrays in columns.items():
+    dtype = np.result_type(*arrays) if arrays else np.float64
+    fill = np.nan if np.issubdtype(dtype, np.floating) else 0
+    out = np.full((n_symbols, n_rows), fill, dtype=dtype)
+    for s, (r, arr) in enumerate(zip(rows, arrays)):
+      out[s, r] = arr
+    aligned[name] = np.ascontiguousarray(out.T)
+  return clock, np.ascontiguousarray(present.T), aligned
+
+def ffill_rows(x):
+  """
+  (T, S) 数组按列向下填充 NaN (第一根有效值之前保持 NaN)。
+  """
+  valid = ~np.isnan(x)
+  idx = np.where(valid, np.arange(len(x))[:, None], 0)
+  np.maximum.accumulate(idx, axis=0, out=idx)
+  return x[idx, np.arange(x.shape[1])[None, :]]
+
+def backtest_portfolio_arrays(close, codes, initial_balance=INITIAL_BALANCE, sizing='equal',
+                              max_positions=MAX_POSITIONS, fraction=1.0, priority=None):
+  """
+  共享现金的多股票回测 (每只股票全进全出，按收盘价成交)。
+
+  参数:
+    close     float64 (T, S) 收盘价，缺失处为 NaN (估值时向下填充)
+    codes     int8 (T, S) 信号 (BUY=1, SELL=-1, HOLD=0)，缺失的分钟应为 HOLD
+    sizing    'equal' 或 'cash_fraction' (见文件头)
+    priority  可选 (T, S) 数组，同一分钟内 BUY 的分配顺序 (越大越优先)
+
+  返回值: (balance, position, portfolio_value, trades)
+    balance          (T,) 现金
+    position         (T, S) 持股数
+    portfolio_value  (T,) 现金 + 持仓市值
+    trades           TRADE_DTYPE 结构化数组，按成交顺序
+  """
+  if sizing not in ('equal', 'cash_fraction'):
+    raise ValueError(f"sizing must be 'equal' or 'cash_fraction', got {sizing!r}")
+  close = np.asarray(close, dtype=np.float64)
+  codes = np.asarray(codes, dtype=np.int8)
+  n_rows, n_symbols = close.shape
+  price = ffill_rows(close)
+
+  shares = np.zeros(n_symbols)
+  held = np.zeros(n_symbols, dtype=bool)
+  cash = float(initial_balance)
+  cash_rows = [0]
+  cash_after = [cash]
+  trades = []
+
+  for t in np.flatnonzero((codes != 0).any(axis=1)):
+    row = codes[t]
+    changed = False
+
+    sell = np.flatnonzero((row == SELL) & held)
+    for s in sell:
+      cash += shares[s] * close[t, s]
+      trades.append((t, s, SELL, shares[s], close[t, s]))
+      shares[s] = 0.0
+    if len(sell):
+      held[sell] = False
+      changed = True
+
+    slots = max_positions - int(held.sum()) if sizing == 'equal' else n_symbols
+    if cash > 0 and slots > 0:
+      buy = np.flatnonzero((row == BUY) & ~held)
+      if len(buy):
+        if priority is not None:
+          buy = buy[np.argsort(-np.asarray(priority[t])[buy], kind='stable')]
+        if sizing == 'equal':
+          equity = cash + float(shares[held] @ price[t, held])
+          per_position = equity / max_positions
+        for s in buy[:slots]:
+          amount = min(cash, per_position) if sizing == 'equal' else cash * fraction
+          if amount <= 0:
+            break
+          shares[s] = amount / close[t, s]
+          held[s] = True
+          cash -= amount
+          trades.append((t, s, BUY, shares[s], close[t, s]))
+          changed = True
+
+    if changed:
+      cash_rows.append(t)
+      cash_after.append(cash)
+
+  trades = np.array(trades, dtype=TRADE_DTYPE)
+  delta = np.zeros((n_rows, n_symbols))
+  delta[trades['row'], trades['symbol']] = np.where(trades['side'] == BUY, trades['shares'], -trades['shares'])
+  position = np.cumsum(delta, axis=0)
+
+  seg = np.searchsorted(np.array(cash_rows), np.arange(n_rows), side='right') - 1
+  balance = np.array(cash_after)[seg]
+  holdings = np.where(position != 0, position * price, 0.0).sum(axis=1)
+  portfolio_value = balance + holdings
+  return balance, position, portfolio_value, trades
+
+def _symbol_signals(task):
+  """
+  工作进程: 读取一只股票的 K 线，计算指标和信号。
+  返回 (timestamp, close, codes)。
+  """
+  store_dir, symbol, start, end, atr_window, thresholds = task
+  bars = bar_store.read_arrays(store_dir, symbol, start, end, bar_store.OHLCV_COLUMNS)
+  high = bars['high'].astype(np.float64)
+  low = bars['low'].astype(np.float64)
+  close = bars['close'].astype(np.float64)
+  _, _, macd_hist = indicator_kernels.macd(close)
+  rsi = indicator_kernels.rsi(close, 14)
+  atr = indicator_kernels.atr(high, low, close, 14)
+  atr_mean = pd.Series(atr).rolling(window=atr_window).mean().to_numpy()
+  codes = signal_engine.signal_codes(macd_hist, rsi, atr, atr_mean, **thresholds)
+  return bars['timestamp'], close, codes
+
+def load_watchlist(store_dir, symbols, start=None, end=None, atr_window=ATR_WINDOW,
+                   thresholds=None, processes=None):
+  """
+  读取 bar_store 里的多只股票，计算信号并对齐到同一个时钟。
+  返回 (clock, close, codes)，后两个为 (T, S) 数组，列顺序与 symbols 相同。
+  """
+  if thresholds is None:
+    thresholds = signal_engine.AGGRESSIVE_THRESHOLDS
+  tasks = [(store_dir, symbol, start, end, atr_window, thresholds) for symbol in symbols]
+  if processes == 1 or len(tasks) == 1:
+    results = [_symbol_signals(task) for task in tasks]
+  else:
+    with Pool(processes=min(processes or os.cpu_count(), len(tasks))) as pool:
+      results = pool.map(_symbol_signals, tasks)
+
+  clock, _, aligned = align_to_clock(
+    [r[0] for r in results],
+    {'close': [r[1] for r in results], 'codes': [r[2] for r in results]},
+  )
+  return clock, aligned['close'], aligned['codes']
+
+def main():
+  parser = argparse.ArgumentParser(description="Shared-cash backtest over a watchlist stored in the bar store.")
+  parser.add_argument("symbols", nargs="+")
+  parser.add_argument("--store", default=bar_store.DEFAULT_STORE_DIR)
+  parser.add_argument("--start")
+  parser.add_argument("--end")
+  parser.add_argument("--initial-balance", type=float, default=INITIAL_BALANCE)
+  parser.add_argument("--sizing", choices=["equal", "cash_fraction"], default="equal")
+  parser.add_argument("--max-positions", type=int, default=MAX_POSITIONS)
+  parser.add_argument("--fraction", type=float, default=1.0)
+  parser.add_argument("--workers", type=int, help="processes for loading/indicators (default: all CPUs)")
+  args = parser.parse_args()
+  symbols = [s.upper() for s in args.symbols]
+
+  t0 = time.time()
+  clock, close, codes = load_watchlist(args.store, symbols, args.start, args.end, processes=args.workers)
+  t1 = time.time()
+  balance, position, portfolio_value, trades = backtest_portfolio_arrays(
+    close, codes, args.initial_balance, args.sizing, args.max_positions, args.fraction
+  )
+  t2 = time.time()
+
+  start_date = pd.Timestamp(clock[0]).date()
+  end_date = pd.Timestamp(clock[-1]).date()
+  final_value = portfolio_value[-1]
+  print(f"{len(symbols)} symbols x {len(clock)} minutes ({start_date} - {end_date})")
+  print(f"Load + signals: {t1 - t0:.2f}s, backtest: {t2 - t1:.2f}s\n")
+  print(f"Final Portfolio Value: ${final_value:.2f}")
+  print(f"Total ROI: {final_value / args.initial_balance - 1:.2%}")
+  print(f"Trades: {len(trades)}")
+  print(f"Max positions held at once: {int((position > 0).sum(axis=1).max())}\n")
+
+  per_symbol = pd.DataFrame({
+    'Symbol': symbols,
+    'Buys': np.bincount(trades['symbol'][trades['side'] == BUY], minlength=len(symbols)),
+    'Sells': np.bincount(trades['symbol'][trades['side'] == SELL], minlength=len(symbols)),
+  })
+  print(per_symbol.to_string(index=False))
+  return 0
+
+if __name__ == "__main__":
+  raise SystemExit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import numpy as np
+import pandas as pd
+
+# 信号编码 (int8)，便于在整列 NumPy 数组上做运算
+HOLD = 0
+BUY = 1
+SELL = -1
+
+SIGNAL_LABELS = {HOLD: 'HOLD', BUY: 'BUY', SELL: 'SELL'}
+
+# 更激进的 BUY 阈值 (test_algorithm_3/4/5)，SELL 与原逻辑相同
+AGGRESSIVE_THRESHOLDS = {
+  'buy_macd_min': -0.1,
+  'buy_rsi_max': 45,
+  'buy_atr_mult': 0.8,
+  'sell_macd_max': 0,
+  'sell_rsi_min': 70,
+}
+
+# 原始阈值 (test_algorithm / test_algorithm_2)
+ORIGINAL_THRESHOLDS = {
+  'buy_macd_min': 0,
+  'buy_rsi_max': 30,
+  'buy_atr_mult': 1.0,
+  'sell_macd_max': 0,
+  'sell_rsi_min': 70,
+}
+
+def signal_codes(macd_hist, rsi, atr, atr_mean,
+                 buy_macd_min=-0.1, buy_rsi_max=45, buy_atr_mult=0.8,
+                 sell_macd_max=0, sell_rsi_min=70):
+  """
+  列式信号引擎：把 BUY/SELL/HOLD 规则变成整列数组上的布尔掩码。
+
+  - BUY:  MACD_histogram > buy_macd_min
+          且 RSI_14 < buy_rsi_max
+          且 ATR_14 > buy_atr_mult * ATR_mean
+  - SELL: MACD_histogram < sell_macd_max 且 RSI_14 > sell_rsi_min
+  - HOLD: 否则
+
+  BUY 优先于 SELL，与逐行函数的 if/elif 顺序一致。
+  NaN 参与比较结果为 False，因此指标尚未就绪的行与逐行版本一样为 HOLD。
+
+  返回值: int8 数组 (BUY=1, SELL=-1, HOLD=0)
+  """
+  macd_hist = np.asarray(macd_hist, dtype=np.float64)
+  rsi = np.asarray(rsi, dtype=np.float64)
+  atr = np.asarray(atr, dtype=np.float64)
+  atr_mean = np.asarray(atr_mean, dtype=np.float64)
+
+  with np.errstate(invalid='ignore'):
+    buy_cond = (
+      (macd_hist > buy_macd_min)
+      & (rsi < buy_rsi_max)
+      & (atr > buy_atr_mult * atr_mean)
+    )
+    sell_cond = (macd_hist < sell_macd_max) & (rsi > sell_rsi_min)
+
+  codes = np.zeros(macd_hist.shape[0], dtype=np.int8)
+  codes[sell_cond] = SELL
+  codes[buy_cond] = BUY
+  return codes
+
+def codes_to_labels(codes):
+  """
+  将 int8 信号编码转换为 'BUY'/'SELL'/'HOLD' 字符串数组。
+  """
+  labels = np.full(len(codes), 'HOLD', dtype=object)
+  labels[codes == BUY] = 'BUY'
+  labels[codes == SELL] = 'SELL'
+  return labels
+
+def generate_signals(df, thresholds=None):
+  """
+  在 DataFrame 上一次性生成整列信号。
+  需要列: MACD_histogram, RSI_14, ATR_14, ATR_mean
+
+  返回值: (codes, labels)
+    codes  是 int8 数组，可直接交给回测内核
+    labels 是 'BUY'/'SELL'/'HOLD' 字符串数组，可直接赋给 df['Signal']
+  """
+  if thresholds is None:
+    thresholds = AGGRESSIVE_THRESHOLDS
+  codes = signal_codes(
+    df['MACD_histogram'].to_numpy(),
+    df['RSI_14'].to_numpy(),
+    df['ATR_14'].to_numpy(),
+    df['ATR_mean'].to_numpy(),
+    **thresholds
+  )
+  return codes, codes_to_labels(codes)
+
+def lazy_reasons(df, codes, reason_fn):
+  """
+  只对真正交易 (BUY/SELL) 的行生成 Reason 字符串，HOLD 行为空字符串。
+  reason_fn(row) 沿用各脚本里原本的逐行函数，返回 (signal, reason)。
+  """
+  reasons = np.full(len(df), '', dtype=object)
+  trade_idx = np.flatnonzero(codes != HOLD)
+  if len(trade_idx) == 0:
+    return pd.Series(reasons, index=df.index)
+
+  cols = ['MACD_histogram', 'RSI_14', 'ATR_14', 'ATR_mean']
+  subset = df[cols].iloc[trade_idx]
+  for pos, row in zip(trade_idx, subset.itertuples(index=False)):
+    reasons[pos] = reason_fn(row._asdict())[1]
+  return pd.Series(reasons, index=df.index)
+
+def labels_to_codes(labels):
+  """
+  将 'BUY'/'SELL'/'HOLD' 字符串列转换回 int8 信号编码。
+  """
+  labels = np.asarray(labels, dtype=object)
+  codes = np.zeros(len(labels), dtype=np.int8)
+  codes[labels == 'BUY'] = BUY
+  codes[labels == 'SELL'] = SELL
+  return codes
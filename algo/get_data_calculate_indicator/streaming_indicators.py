@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# 实时 (IBKR real-time bars) 逐根更新指标，不再每分钟对整个 CSV 重跑 calculate_indicators。
+# 用法:
+#   stream = StreamingIndicators.from_state_file('./TSLA/TSLA_..._with_indicators_state.json')
+#   在 IBKR 的 realtimeBar / historicalDataUpdate 回调里:
+#     values = stream.update(bar)
+#     signal = stream.signal()
+
+import json
+
+import numpy as np
+import pandas as pd
+
+import signal_engine
+from indicator_state import IndicatorState, INDICATOR_COLUMNS, RollingSum
+
+
+class StreamingIndicators:
+  """
+  有状态的流式指标对象，指标集合与 CALCULATE_INDICATOR.py 相同
+  (MACD_line/MACD_signal/MACD_histogram, SMA_50, EMA_200, RSI_14, ATR_14, VWAP)，
+  另外附带 test_algorithm 里用到的 ATR_mean (ATR_14 的滚动均值)。
+
+  每次 update() 只做 O(1) 的递推 (微秒级)，不接触任何历史文件。
+  返回的是未四舍五入的值；CSV 里的指标是保留两位小数的。
+  """
+
+  def __init__(self, state=None, atr_window=14):
+    self.state = state if state is not None else IndicatorState()
+    self.atr_window = atr_window
+    self._atr_mean = RollingSum(atr_window, mean=True)
+    self.last_time = None
+    self.values = dict.fromkeys(INDICATOR_COLUMNS + ['ATR_mean'], float('nan'))
+
+  @classmethod
+  def from_state_file(cls, state_file, atr_window=14):
+    """
+    从 calculate_indicators_incremental 写出的旁路状态文件继续，
+    即从历史文件的最后一根 K 线之后接着算。
+    注意 ATR_mean 不在旁路状态里，需要 atr_window 根新 K 线后才有值。
+    """
+    with open(state_file) as f:
+      saved = json.load(f)
+    return cls(IndicatorState.from_dict(saved['state']), atr_window=atr_window)
+
+  @classmethod
+  def from_csv(cls, file_path, atr_window=14):
+    """
+    用历史 CSV (最新数据在上，与 Alpha Vantage 下载的格式相同) 预热。
+    """
+    df = pd.read_csv(file_path, usecols=['timestamp', 'high', 'low', 'close', 'volume'])
+    stream = cls(atr_window=atr_window)
+    df_rev = df.iloc[::-1]
+    for t, h, l, c, v in zip(df_rev['timestamp'], df_rev['high'], df_rev['low'], df_rev['close'], df_rev['volume']):
+      stream.update_values(t, h, l, c, v)
+    return stream
+
+  def update_values(self, time, high, low, close, volume):
+    """
+    喂入一根 K 线的数值，返回最新的指标字典。
+    """
+    values = self.state.update(high, low, close, volume)
+    for col, value in zip(INDICATOR_COLUMNS, values):
+      self.values[col] = value
+    self.values['ATR_mean'] = self._atr_mean.update(self.values['ATR_14'])
+    self.last_time = time
+    return self.values
+
+  def update(self, bar):
+    """
+    喂入一根 K 线对象：IBKR 的 RealTimeBar / BarData (有 high/low/close/volume 属性)
+    或者包含这些键的 dict。
+    """
+    if isinstance(bar, dict):
+      return self.update_values(bar.get('time', bar.get('timestamp')),
+                                bar['high'], bar['low'], bar['close'], bar['volume'])
+    return self.update_values(getattr(bar, 'time', getattr(bar, 'date', None)),
+                              bar.high, bar.low, bar.close, bar.volume)
+
+  def signal(self, thresholds=None):
+    """
+    用 signal_engine 的同一套规则给出最新一根 K 线的信号: 'BUY'/'SELL'/'HOLD'。
+    """
+    if thresholds is None:
+      thresholds = signal_engine.AGGRESSIVE_THRESHOLDS
+    code = signal_engine.signal_codes(
+      np.array([self.values['MACD_histogram']]),
+      np.array([self.values['RSI_14']]),
+      np.array([self.values['ATR_14']]),
+      np.array([self.values['ATR_mean']]),
+      **thresholds
+    )[0]
+    return signal_engine.SIGNAL_LABELS[int(code)]
+
+  def save(self, state_file, last_timestamp):
+    """
+    把当前状态写回旁路文件 (格式与 calculate_indicators_incremental 相同)。
+    这里不写输出 CSV 的长度 (output_bytes)，增量模式读到这样的状态文件会整体重算一次。
+    """
+    with open(state_file, 'w') as f:
+      json.dump({'last_timestamp': last_timestamp, 'state': self.state.to_dict()}, f)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# 参数扫描：test_algorithm_3.py 里更激进的 BUY 阈值是写死的，
+# 这里对这些阈值 (以及 ATR_mean 的滚动窗口 atr_window) 做网格搜索。
+# - 指标 CSV 只读取一次，之后以只读 NumPy 数组的形式交给进程池
+# - 如果 FILE_PATH 是 .bars 文件 (bar_arrays.py)，每个工作进程直接内存映射，
+#   所有进程共享页缓存里的同一份数据，不再复制
+# - 任务按 atr_window 分批 (每批最多 batch_size 组阈值)，ATR_mean 在每个工作进程里每个窗口只算一次
+# - 输出按 Total ROI 排序的 analyze_portfolio 指标表，另加 performance_metrics 的风险指标
+#   (Sharpe、最大回撤、胜率等，交易日边界在每个工作进程里只算一次)
+
+import itertools
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import backtest_core
+import bar_arrays
+import performance_metrics
+import signal_engine
+
+# ========== 扫描网格 (按需修改) ==========
+FILE_PATH = './TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01_with_indicators.csv'
+INITIAL_BALANCE = 10000
+GRID = {
+  'atr_window': [7, 14, 21, 28, 42],
+  'buy_macd_min': [-0.3, -0.2, -0.1, -0.05, 0],
+  'buy_rsi_max': [30, 35, 40, 45, 50],
+  'buy_atr_mult': [0.6, 0.7, 0.8, 0.9, 1.0],
+  'sell_rsi_min': [60, 65, 70, 75, 80],
+  'sell_macd_max': [0],
+}
+OUTPUT_FILE = 'sweep_results.csv'
+# 指标 CSV 的时间格式 (与 test_algorithm 系列脚本相同)；CALCULATE_INDICATOR.py 写出的是 ISO 格式
+TIME_FORMAT = '%m/%d/%Y %H:%M'
+ISO_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 工作进程里的只读数据 (由 _init_worker 设置)
+_DATA = {}
+_ATR_MEANS = {}   # atr_window -> ATR_mean，同一工作进程的各批共用
+
+def load_indicator_arrays(file_path):
+  """
+  读取指标数据，返回 (arrays, start_date, end_date)，arrays 为最早数据在前的 float64 数组。
+    - .bars 文件: 只读内存映射，几乎不花时间
+    - _with_indicators CSV: 读取一次并转换为连续数组
+  """
+  if file_path.endswith('.bars'):
+    bars = bar_arrays.open_bar_arrays(file_path)
+    arrays = {
+      'timestamp': bars['timestamp'],
+      'close': bars['close'],
+      'macd_hist': bars['MACD_histogram'],
+      'rsi': bars['RSI_14'],
+      'atr': bars['ATR_14'],
+    }
+    ts = bars['timestamp'][[0, -1]].view('datetime64[ns]')
+    return arrays, pd.Timestamp(ts[0]).date(), pd.Timestamp(ts[1]).date()
+
+  df = pd.read_csv(file_path, usecols=['timestamp', 'close', 'MACD_histogram', 'RSI_14', 'ATR_14'])
+  try:
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIME_FORMAT)
+  except ValueError:
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=ISO_TIME_FORMAT)
+  # 增量模式的输出最早在上，calculate_indicators 的输出最新在上，统一按时间排序
+  df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+  timestamp = df['timestamp']
+  arrays = {
+    'timestamp': timestamp.to_numpy(dtype='datetime64[ns]').view(np.int64),
+    'close': np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64)),
+    'macd_hist': np.ascontiguousarray(df['MACD_histogram'].to_numpy(dtype=np.float64)),
+    'rsi': np.ascontiguousarray(df['RSI_14'].to_numpy(dtype=np.float64)),
+    'atr': np.ascontiguousarray(df['ATR_14'].to_numpy(dtype=np.float64)),
+  }
+  for arr in arrays.values():
+    arr.flags.writeable = False
+  return arrays, timestamp.iloc[0].date(), timestamp.iloc[-1].date()
+
+def _init_worker(data):
+  """
+  data 是数组字典，或者 .bars 文件路径 (在工作进程里内存映射)。
+  """
+  global _DATA, _ATR_MEANS
+  if isinstance(data, str):
+    data, _, _ = load_indicator_arrays(data)
+  _DATA = dict(data, day_ends=performance_metrics.day_end_indices(data['timestamp']))
+  _ATR_MEANS = {}
+
+def atr_mean(atr, atr_window, cache):
+  """
+  ATR 的 atr_window 滚动均值，按窗口缓存在 cache 里 (一个窗口分成多批时不重算)。
+  """
+  if atr_window not in cache:
+    cache[atr_window] = pd.Series(atr).rolling(window=atr_window).mean().to_numpy()
+  return cache[atr_window]
+
+def summarize(portfolio_value, trades, total_months, initial_balance=10000):
+  """
+  与 analyze_portfolio 相同的汇总指标，但只用数组，不做 DataFrame groupby。
+  """
+  final_value = float(portfolio_value[-1])
+  total_profit = final_value - initial_balance
+  total_roi = total_profit / initial_balance if initial_balance != 0 else 0
+  avg_monthly_roi = total_roi / total_months
+  return {
+    'Final_Portfolio_Value': final_value,
+    'Total_Profit': total_profit,
+    'Total_ROI': total_roi,
+    'Average_Monthly_ROI': avg_monthly_roi,
+    'Average_Yearly_ROI': avg_monthly_roi * 12,
+    'Trades': len(trades),
+  }
+
+def _run_batch(task):
+  """
+  一批任务：同一个 atr_window 下的多组阈值。
+  """
+  atr_window, combos, total_months, initial_balance = task
+  mean = atr_mean(_DATA['atr'], atr_window, _ATR_MEANS)
+
+  rows = []
+  for thresholds in combos:
+    codes = signal_engine.signal_codes(
+      _DATA['macd_hist'], _DATA['rsi'], _DATA['atr'], mean, **thresholds
+    )
+    _, _, portfolio_value, trades = backtest_core.backtest_arrays(_DATA['close'], codes, initial_balance)
+    row = {'atr_window': atr_window, **thresholds}
+    row.update(summarize(portfolio_value, trades, total_months, initial_balance))
+    row.update(performance_metrics.performance_summary(
+      portfolio_value, trades, _DATA['timestamp'], initial_balance, _DATA['day_ends']
+    ))
+    rows.append(row)
+  return rows
+
+def expand_grid(grid):
+  """
+  将网格展开为 {atr_window: [阈值字典, ...]}。
+  """
+  threshold_keys = [k for k in grid if k != 'atr_window']
+  combos = [
+    dict(zip(threshold_keys, values))
+    for values in itertools.product(*(grid[k] for k in threshold_keys))
+  ]
+  return {w: combos for w in grid['atr_window']}
+
+def run_sweep(file_path, grid, initial_balance=10000, processes=None, batch_size=250):
+  """
+  载入一次数据，把所有参数组合分批分发到进程池 (默认使用全部 CPU)。
+  返回按 Total_ROI 从高到低排序的 DataFrame。
+  """
+  arrays, start_date, end_date = load_indicator_arrays(file_path)
+  total_months = (
+    (end_date.year - start_date.year) * 12
+    + (end_date.month - start_date.month)
+    + 1
+  )
+  # .bars 文件只传路径，工作进程各自映射同一个文件
+  worker_data = file_path if file_path.endswith('.bars') else arrays
+
+  tasks = []
+  for atr_window, combos in expand_grid(grid).items():
+    for i in range(0, len(combos), batch_size):
+      tasks.append((atr_window, combos[i:i + batch_size], total_months, initial_balance))
+
+  rows = []
+  with Pool(processes=processes or os.cpu_count(), initializer=_init_worker, initargs=(worker_data,)) as pool:
+    for batch in pool.imap_unordered(_run_batch, tasks):
+      rows.extend(batch)
+
+  results = pd.DataFrame(rows)
+  results = results.sort_values('Total_ROI', ascending=False).reset_index(drop=True)
+  return results
+
+def main():
+  n_combos = int(np.prod([len(v) for v in GRID.values()]))
+  print(f"Sweeping {n_combos} parameter combinations on {os.cpu_count()} cores...")
+
+  t0 = time.time()
+  results = run_sweep(FILE_PATH, GRID, initial_balance=INITIAL_BALANCE)
+  print(f"Done in {time.time() - t0:.1f}s\n")
+
+  print("Top 20 parameter sets:\n")
+  print(results.head(20).to_string())
+
+  results.to_csv(OUTPUT_FILE, index=False)
+  print(f"\nFull results saved to: {OUTPUT_FILE}")
+
+if __name__ == '__main__':
+  main()
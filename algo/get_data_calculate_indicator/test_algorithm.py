@@ -5,18 +5,22 @@
 
 import pandas as pd
 
+import backtest_core
+import performance_metrics
+import signal_engine
+
 # Load data
 file_path = './TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01_with_indicators.csv'
 df = pd.read_csv(file_path)
 
 
-# Reverse the DataFrame so that data is ordered from oldest to latest
-df = df.iloc[::-1].reset_index(drop=True)
-
-
 # Convert 'timestamp' column to datetime
 df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M')
 
+
+# Sort the DataFrame so that data is ordered from oldest to latest
+df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
 # Calculate rolling mean for ATR (for volatility detection)
 atr_window = 14
 df['ATR_mean'] = df['ATR_14'].rolling(window=atr_window).mean()
@@ -39,19 +43,9 @@ df['Signal'] = df.apply(generate_signals, axis=1)
 # Backtesting the strategy
 def backtest_portfolio(df, initial_balance=10000):
   """Backtesting logic to calculate portfolio performance."""
-  balance = initial_balance
-  position = 0
-  df['Portfolio_Value'] = float(initial_balance)  # Explicitly set as float
-
-  for i, row in df.iterrows():
-    if row['Signal'] == 'BUY' and balance > 0:
-      position = balance / row['close']  # Buy as many shares as possible
-      balance = 0
-    elif row['Signal'] == 'SELL' and position > 0:
-      balance = position * row['close']  # Sell all shares
-      position = 0
-    # Update portfolio value
-    df.at[i, 'Portfolio_Value'] = balance if balance > 0 else position * row['close']
+  codes = signal_engine.labels_to_codes(df['Signal'].to_numpy())
+  _, _, portfolio_value, _ = backtest_core.backtest_arrays(df['close'].to_numpy(), codes, initial_balance)
+  df['Portfolio_Value'] = portfolio_value
 
   return df
 
@@ -69,20 +63,20 @@ def analyze_portfolio(df, initial_balance=10000):
   - Average monthly and yearly ROI
   """
   # Extract trading days
-  df['Trading_Date'] = df['timestamp'].dt.date  # Extract unique trading dates
-  unique_trading_days = df['Trading_Date'].nunique()  # Count unique trading days
+  trading_date = df['timestamp'].dt.date  # Extract unique trading dates
+  unique_trading_days = trading_date.nunique()  # Count unique trading days
 
   # Start and end date (based on unique trading dates)
-  trading_start_date = df['Trading_Date'].iloc[0]
-  trading_end_date = df['Trading_Date'].iloc[-1]
+  trading_start_date = trading_date.iloc[0]
+  trading_end_date = trading_date.iloc[-1]
 
   # Total months (based on trading period)
   total_months = (trading_end_date.year - trading_start_date.year) * 12 + \
                  (trading_end_date.month - trading_start_date.month) + 1
 
   # Calculate monthly income
-  df['Month'] = df['timestamp'].dt.to_period('M')  # Group by month
-  monthly_summary = df.groupby('Month').agg(
+  month = df['timestamp'].dt.to_period('M').rename('Month')  # Group by month
+  monthly_summary = df.groupby(month).agg(
     Monthly_End_Value=('Portfolio_Value', 'last'),  # Portfolio value at the end of each month
   )
   monthly_summary['Monthly_Income'] = monthly_summary['Monthly_End_Value'].diff().fillna(0)
@@ -109,6 +103,9 @@ def analyze_portfolio(df, initial_balance=10000):
   print(f"Average Monthly ROI: {avg_monthly_roi:.2%}")
   print(f"Average Yearly ROI: {avg_yearly_roi:.2%}")
 
+  # Risk-adjusted metrics (does not modify df)
+  performance_metrics.print_metrics(performance_metrics.frame_metrics(df, initial_balance))
+
   # Print monthly details
   print("\n================================")
   print("Monthly Performance:\n")
@@ -4,17 +4,21 @@
 
 import pandas as pd
 
+import backtest_core
+import performance_metrics
+import signal_engine
+
 def main():
   # Load data
   file_path = './TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01_with_indicators.csv'
   df = pd.read_csv(file_path)
 
-  # Reverse so the oldest row is first; confirm your CSV isn't already in ascending order
-  df = df.iloc[::-1].reset_index(drop=True)
-
   # Convert 'timestamp' to datetime
   df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M')
 
+  # Sort so the oldest row is first (works whether the CSV is newest- or oldest-first)
+  df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
   # Calculate rolling mean for ATR (as in your original code)
   atr_window = 14
   df['ATR_mean'] = df['ATR_14'].rolling(window=atr_window).mean()
@@ -59,23 +63,11 @@ def backtest_portfolio(df, initial_balance=10000):
   """
   Backtesting logic to calculate portfolio performance,
   the same way as your original code.
+  Runs on the close/signal arrays in one pass instead of iterrows.
   """
-  balance = initial_balance
-  position = 0
-  df['Portfolio_Value'] = float(initial_balance)
-
-  for i, row in df.iterrows():
-    if row['Signal'] == 'BUY' and balance > 0:
-      # Buy as many shares as possible
-      position = balance / row['close']
-      balance = 0
-    elif row['Signal'] == 'SELL' and position > 0:
-      # Sell all shares
-      balance = position * row['close']
-      position = 0
-
-    # Update portfolio value on each row
-    df.at[i, 'Portfolio_Value'] = balance if balance > 0 else position * row['close']
+  codes = signal_engine.labels_to_codes(df['Signal'].to_numpy())
+  _, _, portfolio_value, _ = backtest_core.backtest_arrays(df['close'].to_numpy(), codes, initial_balance)
+  df['Portfolio_Value'] = portfolio_value
 
   return df
 
@@ -89,12 +81,12 @@ def analyze_portfolio(df, initial_balance=10000):
     - Total ROI and average monthly/yearly ROI
   """
   # Extract unique trading dates
-  df['Trading_Date'] = df['timestamp'].dt.date
-  unique_trading_days = df['Trading_Date'].nunique()
+  trading_date = df['timestamp'].dt.date
+  unique_trading_days = trading_date.nunique()
 
   # Start & end date
-  trading_start_date = df['Trading_Date'].iloc[0]
-  trading_end_date = df['Trading_Date'].iloc[-1]
+  trading_start_date = trading_date.iloc[0]
+  trading_end_date = trading_date.iloc[-1]
 
   # Total months over the trading period
   total_months = (
@@ -104,8 +96,8 @@ def analyze_portfolio(df, initial_balance=10000):
   )
 
   # Group by month
-  df['Month'] = df['timestamp'].dt.to_period('M')
-  monthly_summary = df.groupby('Month').agg(
+  month = df['timestamp'].dt.to_period('M').rename('Month')
+  monthly_summary = df.groupby(month).agg(
     Monthly_End_Value=('Portfolio_Value', 'last')
   )
 
@@ -136,6 +128,9 @@ def analyze_portfolio(df, initial_balance=10000):
   print(f"Average Monthly ROI: {avg_monthly_roi:.2%}")
   print(f"Average Yearly ROI: {avg_yearly_roi:.2%}")
 
+  # Risk-adjusted metrics (does not modify df)
+  performance_metrics.print_metrics(performance_metrics.frame_metrics(df, initial_balance))
+
   print("\n================================")
   print("Monthly Performance:\n")
   print(monthly_summary)
@@ -20,27 +20,29 @@
 
 import pandas as pd
 
+import performance_metrics
+import signal_engine
+
 def main():
   # 1. 读取数据
   file_path = './TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01_with_indicators.csv'
   df = pd.read_csv(file_path)
 
-  # 2. 数据顺序处理：确保最早日期在顶部
-  df = df.iloc[::-1].reset_index(drop=True)
-
-  # 3. 时间戳转换
+  # 2. 时间戳转换
   df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M')
 
+  # 3. 数据顺序处理：按时间排序，确保最早日期在顶部 (CSV 最新在上或最早在上都可以)
+  df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
   # 4. 计算 ATR 滚动均值
   atr_window = 14
   df['ATR_mean'] = df['ATR_14'].rolling(window=atr_window).mean()
 
   # 5. 生成交易信号：使用更激进的 BUY 策略，SELL 策略不变
   #    同时返回为什么给出这个信号（reason）
-  df[['Signal', 'Reason']] = df.apply(
-    lambda row: pd.Series(generate_signals_more_aggressive(row)),
-    axis=1
-  )
+  #    列式信号引擎一次算完整列，Reason 只为 BUY/SELL 行生成
+  codes, df['Signal'] = signal_engine.generate_signals(df, signal_engine.AGGRESSIVE_THRESHOLDS)
+  df['Reason'] = signal_engine.lazy_reasons(df, codes, generate_signals_more_aggressive)
 
   # 6. 打印统计信息（便于了解大致有多少 BUY/SELL/HOLD）
   print("Signal Counts:")
@@ -51,7 +53,10 @@ def main():
   # 7. 测
   df = backtest_portfolio(df, initial_balance=10000)
 
-  # 8. 分析结果
+  # 8. 分析结果 (提前退出时只分析处理过的行；一行都没处理就不分析)
+  if df.empty:
+    print("No rows were processed, skipping the analysis.")
+    return
   monthly_summary = analyze_portfolio(df, initial_balance=10000)
 
   # 9. 存盘
@@ -128,16 +133,19 @@ def backtest_portfolio(df, initial_balance=10000):
     - 每一行（每分钟）依据 Signal 决定是否买入或卖出
     - 并在控制台打印详细信息，包括为什么买卖、指标值等等
     - 按下 "Y" 才会继续处理下一行
+  按 "Q" 提前退出时只返回已经处理过的行 (后面的行没有回测，Portfolio_Value 没有意义)。
   """
   balance = initial_balance
   position = 0
   df['Portfolio_Value'] = float(initial_balance)
 
   # 逐行遍历
+  processed = len(df)
   for i, row in df.iterrows():
     # 当前所需信息
     current_signal = row['Signal']
-    reason = row['Reason']
+    # HOLD 行没有预先生成 Reason，逐行打印时再按需生成
+    reason = row['Reason'] or generate_signals_more_aggressive(row)[1]
     timestamp = row['timestamp']
     close_price = row['close']
 
@@ -154,6 +162,7 @@ def backtest_portfolio(df, initial_balance=10000):
     user_input = input("Press 'Y' to proceed to the next minute (or 'Q' to quit): ").strip().lower()
     if user_input == 'q':
       print("User requested to quit early.")
+      processed = i
       break
     elif user_input != 'y':
       # 如果输入既不是 'y' 也不是 'q'，就默认继续
@@ -173,7 +182,7 @@ def backtest_portfolio(df, initial_balance=10000):
     portfolio_value = balance if balance > 0 else position * close_price
     df.at[i, 'Portfolio_Value'] = portfolio_value
 
-  return df
+  return df.iloc[:processed]
 
 def analyze_portfolio(df, initial_balance=10000):
   """
@@ -184,12 +193,12 @@ def analyze_portfolio(df, initial_balance=10000):
     - 每月末的组合价值、月度收益、月度增长率
     - 总收益率ROI，月度/年度平均ROI
   """
-  df['Trading_Date'] = df['timestamp'].dt.date
-  unique_trading_days = df['Trading_Date'].nunique()
+  trading_date = df['timestamp'].dt.date
+  unique_trading_days = trading_date.nunique()
 
   # 起止日期
-  trading_start_date = df['Trading_Date'].iloc[0]
-  trading_end_date = df['Trading_Date'].iloc[-1]
+  trading_start_date = trading_date.iloc[0]
+  trading_end_date = trading_date.iloc[-1]
 
   # 总月数
   total_months = (
@@ -199,8 +208,8 @@ def analyze_portfolio(df, initial_balance=10000):
   )
 
   # 按月分组
-  df['Month'] = df['timestamp'].dt.to_period('M')
-  monthly_summary = df.groupby('Month').agg(
+  month = df['timestamp'].dt.to_period('M').rename('Month')
+  monthly_summary = df.groupby(month).agg(
     Monthly_End_Value=('Portfolio_Value', 'last')
   )
 
@@ -231,6 +240,9 @@ def analyze_portfolio(df, initial_balance=10000):
   print(f"Average Monthly ROI: {avg_monthly_roi:.2%}")
   print(f"Average Yearly ROI: {avg_yearly_roi:.2%}")
 
+  # 风险调整后的指标 (不修改 df)
+  performance_metrics.print_metrics(performance_metrics.frame_metrics(df, initial_balance))
+
   print("\n================================")
   print("Monthly Performance:\n")
   print(monthly_summary)
@@ -2,28 +2,32 @@
 
 
 
+import numpy as np
 import pandas as pd
 
+import backtest_core
+import performance_metrics
+import signal_engine
+
 def main():
   # 1. 读取数据
   file_path = './TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01_with_indicators.csv'
   df = pd.read_csv(file_path)
 
-  # 2. 数据顺序处理：确保最早日期在顶部
-  df = df.iloc[::-1].reset_index(drop=True)
-
-  # 3. 时间戳转换
+  # 2. 时间戳转换
   df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M')
 
+  # 3. 数据顺序处理：按时间排序，确保最早日期在顶部 (CSV 最新在上或最早在上都可以)
+  df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
   # 4. 计算 ATR 滚动均值
   atr_window = 14
   df['ATR_mean'] = df['ATR_14'].rolling(window=atr_window).mean()
 
   # 5. 生成交易信号（这里沿用更激进的 BUY 策略为例，也可替换回原策略）
-  df[['Signal', 'Reason']] = df.apply(
-    lambda row: pd.Series(generate_signals_more_aggressive(row)),
-    axis=1
-  )
+  #    列式信号引擎一次算完整列，Reason 只为 BUY/SELL 行生成
+  codes, df['Signal'] = signal_engine.generate_signals(df, signal_engine.AGGRESSIVE_THRESHOLDS)
+  df['Reason'] = signal_engine.lazy_reasons(df, codes, generate_signals_more_aggressive)
 
 
   # 7. 回测
@@ -102,44 +106,27 @@ def backtest_portfolio(df, initial_balance=10000):
     - 仅在 signal == 'BUY' 或 'SELL' 时打印详细信息
     - 不再要求用户按键
   """
-  balance = initial_balance
-  position = 0
-  df['Portfolio_Value'] = float(initial_balance)
-
-  # 交易编号，从 0 开始
-  transaction_count = 0
-
-  for i, row in df.iterrows():
-    current_signal = row['Signal']
-    reason = row['Reason']
-    timestamp = row['timestamp']
-    close_price = row['close']
-
-    # 仅在 BUY 或 SELL 输出
-    if current_signal in ['BUY', 'SELL']:
-      print("="*60)
-      print(f"Transaction Index: {transaction_count}")
-      print(f"Index in DataFrame: {i}")
-      print(f"Time: {timestamp}")
-      print(f"Close: {close_price:.4f}")
-      print(f"Signal: {current_signal}")
-      print(f"Reason: {reason}")
-      print(f"Current Balance: {balance:.2f}")
-      print(f"Current Position (shares): {position:.4f}")
-
-      transaction_count += 1  # 下一个交易
-
-    # 根据信号买卖
-    if current_signal == 'BUY' and balance > 0:
-      position = balance / close_price
-      balance = 0.0
-    elif current_signal == 'SELL' and position > 0:
-      balance = position * close_price
-      position = 0.0
-
-    # 更新组合价值
-    portfolio_value = balance if balance > 0 else position * close_price
-    df.at[i, 'Portfolio_Value'] = portfolio_value
+  codes = signal_engine.labels_to_codes(df['Signal'].to_numpy())
+  balance, position, portfolio_value, _ = backtest_core.backtest_arrays(
+    df['close'].to_numpy(), codes, initial_balance
+  )
+  df['Portfolio_Value'] = portfolio_value
+
+  # 仅在 BUY 或 SELL 输出 (打印的是该行成交之前的余额/持仓)
+  signal_rows = np.flatnonzero(codes != signal_engine.HOLD)
+  for transaction_count, i in enumerate(signal_rows):
+    balance_before = balance[i - 1] if i > 0 else float(initial_balance)
+    position_before = position[i - 1] if i > 0 else 0.0
+
+    print("="*60)
+    print(f"Transaction Index: {transaction_count}")
+    print(f"Index in DataFrame: {df.index[i]}")
+    print(f"Time: {df['timestamp'].iat[i]}")
+    print(f"Close: {df['close'].iat[i]:.4f}")
+    print(f"Signal: {df['Signal'].iat[i]}")
+    print(f"Reason: {df['Reason'].iat[i]}")
+    print(f"Current Balance: {balance_before:.2f}")
+    print(f"Current Position (shares): {position_before:.4f}")
 
   return df
 
@@ -152,12 +139,12 @@ def analyze_portfolio(df, initial_balance=10000):
     - 每月末的组价值、月度收益、月度增长率
     - 总收益率ROI，月度/年度平均ROI
   """
-  df['Trading_Date'] = df['timestamp'].dt.date
-  unique_trading_days = df['Trading_Date'].nunique()
+  trading_date = df['timestamp'].dt.date
+  unique_trading_days = trading_date.nunique()
 
   # 起止日期
-  trading_start_date = df['Trading_Date'].iloc[0]
-  trading_end_date = df['Trading_Date'].iloc[-1]
+  trading_start_date = trading_date.iloc[0]
+  trading_end_date = trading_date.iloc[-1]
 
   # 总月数
   total_months = (
@@ -167,8 +154,8 @@ def analyze_portfolio(df, initial_balance=10000):
   )
 
   # 按月分组
-  df['Month'] = df['timestamp'].dt.to_period('M')
-  monthly_summary = df.groupby('Month').agg(
+  month = df['timestamp'].dt.to_period('M').rename('Month')
+  monthly_summary = df.groupby(month).agg(
     Monthly_End_Value=('Portfolio_Value', 'last')
   )
 
@@ -207,6 +194,9 @@ def analyze_portfolio(df, initial_balance=10000):
   print(f"Average Monthly ROI: {avg_monthly_roi:.2%}")
   print(f"Average Yearly ROI: {avg_yearly_roi:.2%}")
 
+  # 风险调整后的指标 (不修改 df)
+  performance_metrics.print_metrics(performance_metrics.frame_metrics(df, initial_balance))
+
   print("\n================================")
   print("Monthly Performance:\n")
   print(monthly_summary)
@@ -6,26 +6,29 @@
 
 import pandas as pd
 
+import backtest_core
+import performance_metrics
+import signal_engine
+
 def main():
   # 1. 读取数据
   file_path = './TSLA/TSLA_regular_hours_interval_1min_2023-12_2025-01_with_indicators.csv'
   df = pd.read_csv(file_path)
 
-  # 2. 数据顺序处理：确保最早日期在顶部
-  df = df.iloc[::-1].reset_index(drop=True)
-
-  # 3. 时间戳转换
+  # 2. 时间戳转换
   df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M')
 
+  # 3. 数据顺序处理：按时间排序，确保最早日期在顶部 (CSV 最新在上或最早在上都可以)
+  df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
   # 4. 计算 ATR 滚动均值
   atr_window = 14
   df['ATR_mean'] = df['ATR_14'].rolling(window=atr_window).mean()
 
   # 5. 生成交易信号（此处保留“更激进的BUY”逻辑为例，也可替换回原逻辑）
-  df[['Signal', 'Reason']] = df.apply(
-    lambda row: pd.Series(generate_signals_more_aggressive(row)),
-    axis=1
-  )
+  #    列式信号引擎一次算完整列，Reason 只为 BUY/SELL 行生成
+  codes, df['Signal'] = signal_engine.generate_signals(df, signal_engine.AGGRESSIVE_THRESHOLDS)
+  df['Reason'] = signal_engine.lazy_reasons(df, codes, generate_signals_more_aggressive)
 
   # 6. 打印统计信息（便于了解多少 BUY / SELL / HOLD）
   print("Signal Counts:")
@@ -109,81 +112,67 @@ def backtest_portfolio(df, initial_balance=10000):
     - 仅在 (signal == 'BUY' and balance>0) 或 (signal == 'SELL' and position>0) 时打印交易信息
     - 通过记录上一次买入的金额 last_buy_cost 来计算卖出时的单次交易收益
   """
-  balance = initial_balance
-  position = 0
-  df['Portfolio_Value'] = float(initial_balance)
+  codes = signal_engine.labels_to_codes(df['Signal'].to_numpy())
+  balance, position, portfolio_value, trades = backtest_core.backtest_arrays(
+    df['close'].to_numpy(), codes, initial_balance
+  )
+  df['Portfolio_Value'] = portfolio_value
 
   # 记录上次买入时实际花费的现金
   # 当下一次 SELL 时，可计算单次交易盈利:  (本次卖出所得 - last_buy_cost)
-  last_buy_cost = 0.0  
+  last_buy_cost = 0.0
 
-  # 交易编号，从 0 开始
-  transaction_count = 0
+  # 上一笔成交之后的余额/持仓，即本笔成交之前的状态
+  balance_before = float(initial_balance)
+  position_before = 0.0
 
-  for i, row in df.iterrows():
-    current_signal = row['Signal']
-    reason = row['Reason']
-    timestamp = row['timestamp']
-    close_price = row['close']
+  # 只遍历真正成交的行，交易编号从 0 开始
+  for transaction_count, i in enumerate(trades):
+    current_signal = df['Signal'].iat[i]
+    close_price = df['close'].iat[i]
+
+    print("="*60)
+    print(f"Transaction Index: {transaction_count}")
+    print(f"DataFrame Row Index: {df.index[i]}")
+    print(f"Time: {df['timestamp'].iat[i]}")
+    print(f"Close Price: {close_price:.4f}")
+    print(f"Signal: {current_signal}")
+    print(f"Reason: {df['Reason'].iat[i]}")
 
     # (1) BUY 信号 && balance > 0 才能实际买入
-    if current_signal == 'BUY' and balance > 0:
-      # 打印交易信息
-      print("="*60)
-      print(f"Transaction Index: {transaction_count}")
-      print(f"DataFrame Row Index: {i}")
-      print(f"Time: {timestamp}")
-      print(f"Close Price: {close_price:.4f}")
-      print(f"Signal: {current_signal}")
-      print(f"Reason: {reason}")
-      print(f"Current Balance (Before Buy): {balance:.2f}")
-      print(f"Current Position (shares): {position:.4f}")
+    if current_signal == 'BUY':
+      print(f"Current Balance (Before Buy): {balance_before:.2f}")
+      print(f"Current Position (shares): {position_before:.4f}")
 
       # 用全部余额买入
-      position = balance / close_price
-      last_buy_cost = balance  # 记录此次买入花费
-      balance = 0.0
-
-      transaction_count += 1  # 更新交易次数
+      last_buy_cost = balance_before  # 记录此次买入花费
 
-      print(f"Bought {position:.4f} shares. New Balance = {balance:.2f}")
+      print(f"Bought {position[i]:.4f} shares. New Balance = {balance[i]:.2f}")
       print(f"----")
 
     # (2) SELL 信号 && position > 0 才能实际卖出
-    elif current_signal == 'SELL' and position > 0:
-      print("="*60)
-      print(f"Transaction Index: {transaction_count}")
-      print(f"DataFrame Row Index: {i}")
-      print(f"Time: {timestamp}")
-      print(f"Close Price: {close_price:.4f}")
-      print(f"Signal: {current_signal}")
-      print(f"Reason: {reason}")
-      print(f"Current Balance (Before Sell): {balance:.2f}")
-      print(f"Current Position (shares): {position:.4f}")
+    else:
+      print(f"Current Balance (Before Sell): {balance_before:.2f}")
+      print(f"Current Position (shares): {position_before:.4f}")
 
       # 全部卖出
-      sell_amount = position * close_price
-      balance = sell_amount
-      position = 0.0
+      sell_amount = balance[i]
 
       # 计算本次交易盈利
       profit = sell_amount - last_buy_cost
       # 避免除零
       roi_per_trade = profit / last_buy_cost if last_buy_cost != 0 else 0.0
 
-      transaction_count += 1
-
       print(f"Sold all shares for {sell_amount:.2f} USD.")
       print(f"Trade Profit: {profit:.2f}, ROI: {roi_per_trade:.2%}")
-      print(f"New Balance: {balance:.2f}")
+      print(f"New Balance: {balance[i]:.2f}")
       print(f"----")
 
       # 卖出后，将 last_buy_cost 归零，以便下次买入重新计算
       last_buy_cost = 0.0
 
-    # 无论是否交易，都要更新当下的组合价值
-    portfolio_value = balance if balance > 0 else position * close_price
-    df.at[i, 'Portfolio_Value'] = portfolio_value
+    balance_before = balance[i]
+    position_before = position[i]
 
   return df
 
@@ -196,12 +185,12 @@ def analyze_portfolio(df, initial_balance=10000):
     - 每月末的组合价值、月度收益、月度增长率
     - 总收益率ROI，月度/年度平均ROI
   """
-  df['Trading_Date'] = df['timestamp'].dt.date
-  unique_trading_days = df['Trading_Date'].nunique()
+  trading_date = df['timestamp'].dt.date
+  unique_trading_days = trading_date.nunique()
 
   # 起止日期
-  trading_start_date = df['Trading_Date'].iloc[0]
-  trading_end_date = df['Trading_Date'].iloc[-1]
+  trading_start_date = trading_date.iloc[0]
+  trading_end_date = trading_date.iloc[-1]
 
   # 总月数
   total_months = (
@@ -211,8 +200,8 @@ def analyze_portfolio(df, initial_balance=10000):
   )
 
   # 按月分组
-  df['Month'] = df['timestamp'].dt.to_period('M')
-  monthly_summary = df.groupby('Month').agg(
+  month = df['timestamp'].dt.to_period('M').rename('Month')
+  monthly_summary = df.groupby(month).agg(
     Monthly_End_Value=('Portfolio_Value', 'last')
   )
 
@@ -243,6 +232,9 @@ def analyze_portfolio(df, initial_balance=10000):
   print(f"Average Monthly ROI: {avg_monthly_roi:.2%}")
   print(f"Average Yearly ROI: {avg_yearly_roi:.2%}")
 
+  # 风险调整后的指标 (不修改 df)
+  performance_metrics.print_metrics(performance_metrics.frame_metrics(df, initial_balance))
+
   print("\n================================")
   print("Monthly Performance:\n")
   print(monthly_summary)
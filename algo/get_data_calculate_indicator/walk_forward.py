@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# 滚动前推 (walk-forward) 优化：test_algorithm 系列脚本和 sweep_thresholds.py 都是在
+# 整个 2023-12 ~ 2025-01 文件上调参、再在同一段数据上报告结果 (样本内)，阈值容易过拟合。
+# 这里按自然月 (与 past_multiple_months 里的每月文件一致) 切成滚动的训练/测试窗口:
+#   第 k 折: 训练 = 第 k ~ k+TRAIN_MONTHS-1 个月，测试 = 紧接着的 TEST_MONTHS 个月
+# 每折在训练窗口上对 GRID 做网格搜索，取 OBJECTIVE 最好的参数，在测试窗口上回测 (样本外)，
+# 各折的样本外权益首尾相接 (下一折从上一折的期末资金开始)，得到一条完整的样本外权益曲线。
+# 默认 2 个月训练 + 1 个月测试，在 14 个月的数据上正好 12 折。
+#
+# - 数据读取一次 (sweep_thresholds.load_indicator_arrays，.bars 文件在工作进程里内存映射)
+# - 指标在整段历史上算好，所有窗口直接切片，不重算；每个窗口开头的指标已经"热身"过
+# - 每个参数组合的信号在整段历史上只算一次，再切片给所有训练窗口回测，
+#   所以任务按参数组合分批 (同 sweep_thresholds._run_batch)，每批一次算完所有折
+# - 进程池并行，父进程只收每批的 (组合 x 折) 得分矩阵
+
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import backtest_core
+import performance_metrics
+import signal_engine
+from sweep_thresholds import FILE_PATH, GRID, INITIAL_BALANCE, atr_mean, expand_grid, load_indicator_arrays
+
+# ========== 前推设置 (按需修改) ==========
+TRAIN_MONTHS = 2
+TEST_MONTHS = 1
+OBJECTIVE = 'Total_ROI'   # 或 performance_metrics.performance_summary 的任一指标，如 'Sharpe'、'Calmar'
+OUTPUT_FILE = 'walk_forward_results.csv'
+EQUITY_FILE = 'walk_forward_equity.csv'
+
+# 工作进程里的只读数据 (由 _init_worker 设置)
+_DATA = {}
+_FOLDS = []
+_ATR_MEANS = {}   # atr_window -> ATR_mean，同一工作进程的各批共用
+
+def month_starts(timestamps):
+  """
+  int64 ns 升序时间戳 -> (每个月的 datetime64[M] 标签, 该月第一根 K 线的行号)。
+  """
+  months = np.asarray(timestamps, dtype=np.int64).view('datetime64[ns]').astype('datetime64[M]')
+  starts = np.r_[0, np.flatnonzero(months[1:] != months[:-1]) + 1]
+  return months[starts], starts
+
+def make_folds(timestamps, train_months=TRAIN_MONTHS, test_months=TEST_MONTHS):
+  """
+  滚动窗口 (每次前进 test_months 个月)，返回列表，每项为
+  (train_start, train_end, test_start, test_end, 训练起始月, 测试起始月, 测试结束月)，行号为左闭右开。
+  """
+  labels, starts = month_starts(timestamps)
+  bounds = np.r_[starts, len(timestamps)]
+  folds = []
+  for k in range(0, len(labels) - train_months - test_months + 1, test_months):
+    split = k + train_months
+    end = split + test_months
+    folds.append((int(bounds[k]), int(bounds[split]), int(bounds[split]), int(bounds[end]),
+                  str(labels[k]), str(labels[split]), str(labels[end - 1])))
+  return folds
+
+def _init_worker(data, folds):
+  """
+  data 是数组字典，或者 .bars 文件路径 (在工作进程里内存映射)。
+  每个训练窗口的交易日边界在这里算一次。
+  """
+  global _DATA, _FOLDS, _ATR_MEANS
+  if isinstance(data, str):
+    data, _, _ = load_indicator_arrays(data)
+  _DATA = data
+  _ATR_MEANS = {}
+  _FOLDS = [
+    (a, b, performance_metrics.day_end_indices(data['timestamp'][a:b]))
+    for a, b, *_ in folds
+  ]
+
+def score(portfolio_value, trades, timestamps, day_ends, initial_balance, objective=OBJECTIVE):
+  """
+  一次回测在 objective 上的得分 (越大越好)。
+  """
+  if objective == 'Total_ROI':
+    return portfolio_value[-1] / initial_balance - 1
+  metrics = performance_metrics.performance_summary(portfolio_value, trades, timestamps, initial_balance, day_ends)
+  return metrics[objective]
+
+def _run_batch(task):
+  """
+  一批任务：同一个 atr_window 下的多组阈值，在所有训练窗口上的得分。
+  ATR_mean 在整段历史上算 (每个工作进程每个窗口一次)，每组阈值的信号只算一次，再切片给各个窗口。
+  返回 (参数字典列表, 得分矩阵 (组合数 x 折数))。
+  """
+  atr_window, combos, initial_balance, objective = task
+  mean = atr_mean(_DATA['atr'], atr_window, _ATR_MEANS)
+
+  scores = np.empty((len(combos), len(_FOLDS)))
+  for i, thresholds in enumerate(combos):
+    codes = signal_engine.signal_codes(
+      _DATA['macd_hist'], _DATA['rsi'], _DATA['atr'], mean, **thresholds
+    )
+    for f, (a, b, day_ends) in enumerate(_FOLDS):
+      _, _, portfolio_value, trades = backtest_core.backtest_arrays(_DATA['close'][a:b], codes[a:b], initial_balance)
+      scores[i, f] = score(portfolio_value, trades, _DATA['timestamp'][a:b], day_ends, initial_balance, objective)
+  return [{'atr_window': atr_window, **thresholds} for thresholds in combos], scores
+
+def _out_of_sample(arrays, folds, params, initial_balance):
+  """
+  每折用选出的参数在测试窗口上回测，资金首尾相接。
+  返回 (各折测试结果列表, 拼接的权益曲线, 拼接后的成交行号)。
+  窗口结束时仍持仓的，按最后一根收盘价计值 (视为在窗口末平仓)，下一折从空仓开始。
+  """
+  atr_means = {}
+  balance = float(initial_balance)
+  results, curves, all_trades = [], [], []
+  offset = 0
+  for (_, _, a, b, *_), p in zip(folds, params):
+    p = dict(p)
+    mean = atr_mean(arrays['atr'], p.pop('atr_window'), atr_means)
+    codes = signal_engine.signal_codes(arrays['macd_hist'], arrays['rsi'], arrays['atr'], mean, **p)
+    _, _, portfolio_value, trades = backtest_core.backtest_arrays(arrays['close'][a:b], codes[a:b], balance)
+
+    results.append({
+      'Test_Start_Value': balance,
+      'Test_End_Value': float(portfolio_value[-1]),
+      'Test_ROI': float(portfolio_value[-1]) / balance - 1,
+      'Test_Trades': len(trades),
+    })
+    if len(trades) % 2 == 1:
+      trades = np.r_[trades, b - a - 1]
+    curves.append(portfolio_value)
+    all_trades.append(trades + offset)
+    offset += b - a
+    balance = float(portfolio_value[-1])
+  return results, np.concatenate(curves), np.concatenate(all_trades)
+
+def run_walk_forward(file_path, grid, train_months=TRAIN_MONTHS, test_months=TEST_MONTHS,
+                     objective=OBJECTIVE, initial_balance=INITIAL_BALANCE, processes=None, batch_size=250):
+  """
+  返回 (每折结果 DataFrame, 样本外权益 DataFrame (timestamp, Portfolio_Value), 样本外绩效字典)。
+  """
+  arrays, _, _ = load_indicator_arrays(file_path)
+  folds = make_folds(arrays['timestamp'], train_months, test_months)
+  if not folds:
+    raise ValueError(f"{file_path} has fewer than {train_months + test_months} months of data")
+  worker_data = file_path if file_path.endswith('.bars') else arrays
+
+  tasks = []
+  for atr_window, combos in expand_grid(grid).items():
+    for i in range(0, len(combos), batch_size):
+      tasks.append((atr_window, combos[i:i + batch_size], initial_balance, objective))
+
+  params, scores = [], []
+  with Pool(processes=processes or os.cpu_count(), initializer=_init_worker,
+            initargs=(worker_data, folds)) as pool:
+    # 按任务顺序收集 (imap)，得分相同时总是选网格里靠前的组合
+    for batch_params, batch_scores in pool.imap(_run_batch, tasks):
+      params.extend(batch_params)
+      scores.append(batch_scores)
+  scores = np.concatenate(scores)
+
+  # 每折训练得分最高的组合 (NaN 视为最差)
+  best = np.argmax(np.where(np.isnan(scores), -np.inf, scores), axis=0)
+  best_params = [params[i] for i in best]
+  results, equity, trades = _out_of_sample(arrays, folds, best_params, initial_balance)
+
+  rows = []
+  for f, (fold, p, result) in enumerate(zip(folds, best_params, results)):
+    rows.append({
+      'Fold': f + 1,
+      'Train_Start': fold[4],
+      'Test_Start': fold[5],
+      'Test_End': fold[6],
+      **p,
+      f'Train_{objective}': scores[best[f], f],
+      **result,
+    })
+
+  first = folds[0][2]
+  last = folds[-1][3]
+  timestamps = np.asarray(arrays['timestamp'][first:last], dtype=np.int64)
+  equity_df = pd.DataFrame({'timestamp': timestamps.view('datetime64[ns]'), 'Portfolio_Value': equity})
+  summary = performance_metrics.performance_summary(equity, trades, timestamps, initial_balance)
+  return pd.DataFrame(rows), equity_df, summary
+
+def main():
+  n_combos = int(np.prod([len(v) for v in GRID.values()]))
+  print(f"Walk-forward: {TRAIN_MONTHS} train month(s) / {TEST_MONTHS} test month(s), "
+        f"{n_combos} parameter combinations, objective {OBJECTIVE}, {os.cpu_count()} cores...")
+
+  t0 = time.time()
+  folds, equity, summary = run_walk_forward(FILE_PATH, GRID)
+  print(f"Done in {time.time() - t0:.1f}s ({len(folds)} folds)\n")
+
+  print(folds.to_string(index=False))
+
+  final_value = equity['Portfolio_Value'].iloc[-1]
+  print("\nOut-of-sample (stitched test windows):\n")
+  print(f"Period: {equity['timestamp'].iloc[0].date()} - {equity['timestamp'].iloc[-1].date()}")
+  print(f"Final Portfolio Value: ${final_value:.2f}")
+  print(f"Total ROI: {final_value / INITIAL_BALANCE - 1:.2%}")
+  performance_metrics.print_metrics(summary)
+
+  folds.to_csv(OUTPUT_FILE, index=False)
+  equity.to_csv(EQUITY_FILE, index=False)
+  print(f"\nFold results saved to: {OUTPUT_FILE}")
+  print(f"Out-of-sample equity saved to: {EQUITY_FILE}")
+
+if __name__ == '__main__':
+  main()
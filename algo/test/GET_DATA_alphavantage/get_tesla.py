@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
-import requests
+import os
+import sys
+
+# shared Alpha Vantage response cache (algo/get_data_calculate_indicator)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "get_data_calculate_indicator"))
+from alphavantage_cache import AlphaVantageCache, fetch_csv
 
 # Configuration
 API_KEY = "VIBBPSYNEUTGVC3H"
@@ -19,16 +24,16 @@ params = {
   "apikey": API_KEY,
 }
 
-# Fetch the data
-response = requests.get(BASE_URL, params=params)
+OFFLINE = False  # True => only serve from the local cache, never call the API
+
+# Fetch the data (the last 30 days are still changing, so the cache entry expires after its TTL)
+cache = AlphaVantageCache(offline=OFFLINE)
+content = fetch_csv(BASE_URL, params, cache)
 
-# Check if the request was successful
-if response.status_code == 200:
+if content is not None:
   # Save the CSV data to a file
   filename = f"{SYMBOL}_last_30_days.csv"
   with open(filename, "wb") as file:
-    file.write(response.content)
+    file.write(content)
   print(f"Data saved to {filename}")
-else:
-  print(f"Failed to fetch data: {response.status_code} - {response.text}")
-
+print(cache.report())
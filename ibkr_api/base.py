@@ -1,36 +1,269 @@
 #!/usr/bin/env python3
+import json
 import threading
-import time
-from flask import Flask, render_template, jsonify
-from ibapi.client import EClient
-from ibapi.wrapper import EWrapper
+import uuid
+from collections import deque, namedtuple
+from flask import Flask, render_template, jsonify, request, Response
+from ibapi.common import UNSET_DOUBLE
 from ibapi.contract import Contract
 
+from connection import ConnectionPool, IBConnection
+
+# one pooled connection (with its own client ID) per account
+ACCOUNT_IDS = ["U19929135"]
+ACCOUNT_SUMMARY_TAGS = "NetLiquidation,TotalCashValue,EquityWithLoanValue"
+KEEPALIVE_SECONDS = 15
+PUBLISH_INTERVAL = 0.25  # seconds; changes arriving within it share one snapshot
+PNL_FIRST_REQ_ID = 9100
+
 # Flask app
 app = Flask(__name__)
 
-# Global variables for storing data
-account_data = {}
-portfolio_data = []
-total_unrealized_pnl = 0.0
-total_daily_pnl = 0.0
-refresh_count = 0
+# Immutable view of the portfolio that the Flask routes serve. A new one is
+# built for every published change and never modified afterwards.
+#
+# Versions restart at 0 with the process, so SSE event ids are
+# "<epoch>-<version>" with a per-process epoch: a browser holding an id from
+# before a restart gets a full snapshot instead of a stale 304 or deltas.
+# ETags add the route name ("<route>-<epoch>-<version>"), because the page and
+# the two JSON bodies of one snapshot are different representations.
+PortfolioSnapshot = namedtuple("PortfolioSnapshot", [
+  "version", "account_data", "portfolio_data", "total_unrealized_pnl", "total_daily_pnl", "json",
+  "portfolio_json", "event_id"
+])
+
+# Shared portfolio state. The IBKR subscriptions stay open and every callback
+# updates it; browsers get the changes pushed over Server-Sent Events, so there
+# is one TWS subscription no matter how many viewers are connected.
+#
+# Double buffering: the set_*/publish methods (called from the IBKR reader
+# threads, one per pooled connection) edit a private working copy under a
+# writer lock. publish() builds a new PortfolioSnapshot from it and swaps
+# `hub.snapshot` with a single reference assignment, so readers never take a
+# lock and never see a half-built table. Until the first accountDownloadEnd
+# nothing is published.
+#
+# Coalescing: a change does not publish by itself. The first change after a
+# publish starts a PUBLISH_INTERVAL timer; everything that arrives before it
+# fires goes into one snapshot, and repeated changes to the same account tag,
+# position or PnL keep only the latest value. A burst of pnlSingle ticks
+# therefore costs one rebuild and one version, not one per field.
+#
+# A position that goes to 0 is dropped from the table and announced as a
+# "position_removed" event.
+class PortfolioHub:
+  def __init__(self, history=1000):
+    self.cond = threading.Condition()  # only used to wake SSE streams
+    self._write_lock = threading.RLock()
+    self._account_data = {}   # account -> {tag: (value, currency)}
+    self._positions = {}      # "account:conId" -> row dict
+    self._account_pnl = {}    # account -> {"dailyPnL", "unrealizedPnL", "realizedPnL"}
+    self._pending = {}        # (event, key) -> (event, data), changes since the last publish
+    self._timer = None
+    self.ready = False
+    self.changes = deque(maxlen=history)  # (version, event, data)
+    self.epoch = uuid.uuid4().hex[:8]
+    self.snapshot = self._build(0)
+
+  def _build(self, version):
+    account_data = {account: dict(tags) for account, tags in self._account_data.items()}
+    portfolio_data = [dict(row, key=key) for key, row in self._positions.items()]
+    total_unrealized_pnl = round(sum(row["unrealizedPNL"] for row in portfolio_data), 2)
+    total_daily_pnl = round(sum(pnl["dailyPnL"] or 0.0 for pnl in self._account_pnl.values()), 2)
+    accounts = {
+      account: {"summary": account_data.get(account, {}), "pnl": dict(self._account_pnl.get(account, {}))}
+      for account in sorted(set(account_data) | set(self._account_pnl))
+    }
+    portfolio = {
+      "version": version,
+      "accounts": accounts,
+      "positions": portfolio_data,
+      "totals": {"unrealizedPnL": total_unrealized_pnl, "dailyPnL": total_daily_pnl},
+    }
+    data = {
+      "version": version,
+      "account_data": account_data,
+      "portfolio_data": portfolio_data,
+      "total_unrealized_pnl": total_unrealized_pnl,
+      "total_daily_pnl": total_daily_pnl,
+    }
+    return PortfolioSnapshot(version, account_data, tuple(portfolio_data), total_unrealized_pnl,
+                             total_daily_pnl, json.dumps(data), json.dumps(portfolio), self.event_id(version))
+
+  def event_id(self, version):
+    return f"{self.epoch}-{version}"
+
+  def parse_event_id(self, event_id):
+    """
+    SSE Last-Event-ID -> version, or None if it is from another process
+    (different epoch), malformed, or ahead of the current snapshot.
+    """
+    epoch, _, version = (event_id or "").rpartition("-")
+    if epoch != self.epoch or not version.isdigit() or int(version) > self.snapshot.version:
+      return None
+    return int(version)
+
+  def _changed(self, event, key, data):
+    self._pending.pop((event, key), None)  # keep the latest value, in arrival order
+    self._pending[(event, key)] = (event, data)
+    if self.ready and self._timer is None:
+      self._timer = threading.Timer(PUBLISH_INTERVAL, self._flush)
+      self._timer.daemon = True
+      self._timer.start()
+
+  def _flush(self):
+    with self._write_lock:
+      self._timer = None
+      self.publish()
+
+  def set_account_value(self, account, tag, value, currency):
+    with self._write_lock:
+      tags = self._account_data.setdefault(account, {})
+      if tags.get(tag) == (value, currency):
+        return
+      tags[tag] = (value, currency)
+      self._changed("account", (account, tag), {"account": account, "tag": tag, "value": value, "currency": currency})
+
+  def set_position(self, key, fields):
+    """
+    Merge fields into a position row: updatePortfolio supplies the whole row,
+    pnlSingle only the live PnL fields.
+    """
+    with self._write_lock:
+      if key not in self._positions and "position" not in fields:
+        return  # late pnlSingle for a position that was already closed
+      old = self._positions.get(key, {})
+      row = dict(old, **fields)
+      if row == old:
+        return
+      self._positions[key] = row
+      self._changed("position", key, dict(row, key=key))
+
+  def remove_position(self, key):
+    """updatePortfolio with position 0: the position was closed."""
+    with self._write_lock:
+      if self._positions.pop(key, None) is not None:
+        self._changed("position_removed", key, {"key": key})
+
+  def set_account_pnl(self, account, daily_pnl, unrealized_pnl, realized_pnl):
+    with self._write_lock:
+      pnl = {"dailyPnL": daily_pnl, "unrealizedPnL": unrealized_pnl, "realizedPnL": realized_pnl}
+      if self._account_pnl.get(account) == pnl:
+        return
+      self._account_pnl[account] = pnl
+      total = sum(p["dailyPnL"] or 0.0 for p in self._account_pnl.values())
+      self._changed("pnl", account, dict(pnl, account=account, total_daily_pnl=round(total, 2)))
+
+  def download_end(self):
+    """accountDownloadEnd: the first full portfolio has arrived."""
+    with self._write_lock:
+      self.ready = True
+      self.publish()
+
+  def publish(self):
+    if not self._pending:
+      return
+    snapshot = self._build(self.snapshot.version + 1)
+    with self.cond:
+      for event, data in self._pending.values():
+        self.changes.append((snapshot.version, event, data))
+      self._pending = {}
+      self.snapshot = snapshot
+      self.cond.notify_all()
+
+  def wait_changes(self, since, timeout):
+    """
+    Block until there is a snapshot newer than `since` (or timeout).
+    Returns (version, changes); changes is None when changes after `since`
+    may have dropped out of the history buffer (or `since` is ahead of the
+    current version) and the client needs a full snapshot instead.
+    """
+    with self.cond:
+      self.cond.wait_for(lambda: self.snapshot.version != since, timeout)
+      version = self.snapshot.version
+      if since > version or (version > since and (not self.changes or self.changes[0][0] > since)):
+        return version, None
+      return version, [change for change in self.changes if change[0] > since]
+
+hub = PortfolioHub()
+
+def _pnl_value(value):
+  """TWS sends UNSET_DOUBLE for values it does not have (yet)."""
+  return None if value == UNSET_DOUBLE else round(value, 2)
+
+# Streaming PnL: one reqPnL for the account, plus one reqPnLSingle per open
+# position, subscribed when a position appears and cancelled when it closes.
+# `client` only needs reqPnL/cancelPnL/reqPnLSingle/cancelPnLSingle, so a
+# fake client can drive it without TWS.
+class PnLSubscriptions:
+  def __init__(self, client, account, first_req_id=PNL_FIRST_REQ_ID):
+    self.client = client
+    self.account = account
+    self.next_req_id = first_req_id
+    self.account_req_id = None
+    self.req_ids = {}   # conId -> reqId
+    self.con_ids = {}   # reqId -> conId
+
+  def _new_req_id(self):
+    req_id = self.next_req_id
+    self.next_req_id += 1
+    return req_id
+
+  def reset(self):
+    """Forget all subscriptions without cancelling (after the connection dropped)."""
+    self.account_req_id = None
+    self.req_ids.clear()
+    self.con_ids.clear()
+
+  def start(self):
+    if self.account_req_id is None:
+      self.account_req_id = self._new_req_id()
+      self.client.reqPnL(self.account_req_id, self.account, "")
+
+  def on_position(self, con_id, position):
+    """Call for every updatePortfolio: subscribes new positions, cancels closed ones."""
+    if position != 0 and con_id not in self.req_ids:
+      req_id = self._new_req_id()
+      self.req_ids[con_id] = req_id
+      self.con_ids[req_id] = con_id
+      self.client.reqPnLSingle(req_id, self.account, "", con_id)
+    elif position == 0 and con_id in self.req_ids:
+      req_id = self.req_ids.pop(con_id)
+      del self.con_ids[req_id]
+      self.client.cancelPnLSingle(req_id)
+
+  def position_key(self, req_id):
+    """reqId of a pnlSingle callback -> hub position key (None if already cancelled)."""
+    con_id = self.con_ids.get(req_id)
+    return None if con_id is None else f"{self.account}:{con_id}"
+
+  def stop(self):
+    for req_id in list(self.con_ids):
+      self.client.cancelPnLSingle(req_id)
+    self.req_ids.clear()
+    self.con_ids.clear()
+    if self.account_req_id is not None:
+      self.client.cancelPnL(self.account_req_id)
+      self.account_req_id = None
 
 # IBKR API App
-class IBKRApp(EWrapper, EClient):
-  def __init__(self):
-    EClient.__init__(self, self)
+class IBKRApp(IBConnection):
+  def __init__(self, account):
+    IBConnection.__init__(self)
+    self.account = account
+    self.pnl_subscriptions = PnLSubscriptions(self, account)
 
   def accountSummary(self, reqId: int, account: str, tag: str, value: str, currency: str):
-    global account_data
-    if account not in account_data:
-      account_data[account] = {}
-    account_data[account][tag] = (value, currency)
+    hub.set_account_value(account, tag, value, currency)
 
   def updatePortfolio(self, contract: Contract, position: float, marketPrice: float, marketValue: float,
                       averageCost: float, unrealizedPNL: float, realizedPNL: float, accountName: str):
-    global portfolio_data, total_unrealized_pnl
-    portfolio_data.append({
+    key = f"{accountName}:{contract.conId}"
+    self.pnl_subscriptions.on_position(contract.conId, position)
+    if position == 0:
+      hub.remove_position(key)
+      return
+    hub.set_position(key, {
       "symbol": contract.symbol,
       "secType": contract.secType,
       "position": position,
@@ -41,66 +274,133 @@ class IBKRApp(EWrapper, EClient):
       "realizedPNL": round(realizedPNL, 2),
       "accountName": accountName
     })
-    total_unrealized_pnl += unrealizedPNL
 
-  def dailyPnL(self, reqId: int, dailyPnL: float):
-    global total_daily_pnl
-    total_daily_pnl += dailyPnL
+  def accountDownloadEnd(self, accountName: str):
+    hub.download_end()
 
+  def pnl(self, reqId: int, dailyPnL: float, unrealizedPnL: float, realizedPnL: float):
+    hub.set_account_pnl(self.pnl_subscriptions.account, _pnl_value(dailyPnL),
+                        _pnl_value(unrealizedPnL), _pnl_value(realizedPnL))
 
-def run_loop(app):
-  app.run()
+  def pnlSingle(self, reqId: int, pos: float, dailyPnL: float, unrealizedPnL: float,
+                realizedPnL: float, value: float):
+    key = self.pnl_subscriptions.position_key(reqId)
+    if key is None:
+      return
+    fields = {"dailyPNL": _pnl_value(dailyPnL)}
+    # only overwrite the updatePortfolio figures with values TWS actually sent
+    for name, v in [("unrealizedPNL", unrealizedPnL), ("realizedPNL", realizedPnL), ("marketValue", value)]:
+      if _pnl_value(v) is not None:
+        fields[name] = _pnl_value(v)
+    hub.set_position(key, fields)
 
-# Start IBKR API connection
 
-def start_ibkr():
-  global app_ibkr
-  app_ibkr = IBKRApp()
-  app_ibkr.connect("127.0.0.1", 7496, clientId=1)
+def subscribe(app):
+  """
+  Called by the pool after every (re)connect. The subscriptions stay open:
+  TWS pushes every change to accountSummary / updatePortfolio as it happens.
+  """
+  if app.account == ACCOUNT_IDS[0]:
+    app.reqAccountSummary(9001, "All", ACCOUNT_SUMMARY_TAGS)
+  app.reqAccountUpdates(True, app.account)
+  # real-time daily/unrealized/realized PnL; per-position subscriptions follow updatePortfolio
+  app.pnl_subscriptions.reset()
+  app.pnl_subscriptions.start()
 
-  api_thread = threading.Thread(target=run_loop, args=(app_ibkr,))
-  api_thread.start()
+# Start IBKR API connections
+def start_ibkr(pool=None):
+  pool = pool or ConnectionPool()
+  for account in ACCOUNT_IDS:
+    pool.get(f"dashboard:{account}", lambda account=account: IBKRApp(account), on_connect=subscribe)
+  return pool
 
-  time.sleep(1)  # Allow connection to establish
+# Flask routes
+def _etag(route, snapshot):
+  return f'"{route}-{snapshot.event_id}"'
+
+def _not_modified(route, snapshot):
+  """304 if the client already has this route's body for this snapshot (If-None-Match)."""
+  etag = _etag(route, snapshot)
+  if etag.strip('"') in request.if_none_match:
+    return Response(status=304, headers={"ETag": etag})
+  return None
+
+@app.route("/")
+def home():
+  snapshot = hub.snapshot
+  not_modified = _not_modified("home", snapshot)
+  if not_modified:
+    return not_modified
+  response = Response(render_template("index.html", account_data=snapshot.account_data,
+                                      portfolio_data=snapshot.portfolio_data, refresh_count=snapshot.version,
+                                      total_unrealized_pnl=snapshot.total_unrealized_pnl,
+                                      total_daily_pnl=snapshot.total_daily_pnl))
+  response.headers["ETag"] = _etag("home", snapshot)
+  return response
 
-  while True:
-    global portfolio_data, account_data, refresh_count, total_unrealized_pnl, total_daily_pnl
+@app.route("/api/snapshot")
+def api_snapshot():
+  snapshot = hub.snapshot
+  return _not_modified("snapshot", snapshot) or Response(snapshot.json, mimetype="application/json",
+                                                         headers={"ETag": _etag("snapshot", snapshot)})
 
-    portfolio_data.clear()  # Clear previous portfolio data
-    total_unrealized_pnl = 0.0
-    total_daily_pnl = 0.0
+@app.route("/api/portfolio")
+def api_portfolio():
+  """
+  Accounts (summary tags + reqPnL figures), positions (updatePortfolio rows
+  with live reqPnLSingle PnL) and totals as JSON.
+  """
+  snapshot = hub.snapshot
+  return _not_modified("portfolio", snapshot) or Response(snapshot.portfolio_json, mimetype="application/json",
+                                                          headers={"ETag": _etag("portfolio", snapshot)})
 
-    app_ibkr.reqAccountSummary(9001, "All", "NetLiquidation,TotalCashValue,EquityWithLoanValue")
-    app_ibkr.reqAccountUpdates(True, "U19929135")
+@app.route("/refresh_count")
+def get_refresh_count():
+  return jsonify({"refresh_count": hub.snapshot.version})
 
-    time.sleep(5)  # Wait to gather data
+def _sse_raw(event, data_json, event_id):
+  return f"id: {event_id}\nevent: {event}\ndata: {data_json}\n\n"
 
-    app_ibkr.cancelAccountSummary(9001)
-    app_ibkr.reqAccountUpdates(False, "U19929135")
+def _sse(event, data, event_id):
+  return _sse_raw(event, json.dumps(data), event_id)
 
-    refresh_count += 1
-    print(f"Data updated successfully {refresh_count} times.")
-    time.sleep(30)  # Update every 30 seconds
+@app.route("/stream")
+def stream():
+  """
+  Server-Sent Events: a full snapshot first (or after falling behind), then
+  one event per changed account value / position row. Browsers reconnect with
+  Last-Event-ID ("<epoch>-<version>") and only receive what they missed.
+  """
+  last_id = request.headers.get("Last-Event-ID")
 
-# Flask routes
-@app.route("/")
-def home():
-  global account_data, portfolio_data, refresh_count, total_unrealized_pnl, total_daily_pnl
-  return render_template("index.html", account_data=account_data, portfolio_data=portfolio_data, 
-                         refresh_count=refresh_count, total_unrealized_pnl=round(total_unrealized_pnl, 2), 
-                         total_daily_pnl=round(total_daily_pnl, 2))
+  def events(since):
+    if since is None:
+      snapshot = hub.snapshot
+      since = snapshot.version
+      yield _sse_raw("snapshot", snapshot.json, hub.event_id(since))
+    while True:
+      version, changes = hub.wait_changes(since, KEEPALIVE_SECONDS)
+      if changes is None:
+        snapshot = hub.snapshot
+        version = snapshot.version
+        yield _sse_raw("snapshot", snapshot.json, hub.event_id(version))
+      elif not changes:
+        yield ": keepalive\n\n"
+      else:
+        for change_version, event, data in changes:
+          yield _sse(event, data, hub.event_id(change_version))
+      since = version
 
-@app.route("/refresh_count")
-def get_refresh_count():
-  global refresh_count
-  return jsonify({"refresh_count": refresh_count})
+  # an id from a previous process or from the future starts with a full snapshot
+  since = hub.parse_event_id(last_id)
+  return Response(events(since), mimetype="text/event-stream",
+                  headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Start Flask in a separate thread
 def start_flask():
-  app.run(debug=True, use_reloader=False, port=5001)
+  app.run(debug=True, use_reloader=False, port=5001, threaded=True)
 
 if __name__ == "__main__":
   # Start IBKR API and Flask app in separate threads
   threading.Thread(target=start_ibkr).start()
   threading.Thread(target=start_flask).start()
-
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Shared TWS / IB Gateway connections.
+#
+# Every tool used to connect with a hard-coded clientId=1 and `time.sleep(1)`,
+# so only one could run at a time and startup raced the API handshake. A
+# ConnectionPool hands out named connections, each with its own client ID:
+#   - connect() returns once TWS has sent nextValidId (the handshake is done),
+#     not after a fixed sleep
+#   - if TWS rejects a client ID as already in use (error 326) the next free
+#     ID is tried, so several processes can share one gateway
+#   - a dropped connection is re-established in the background with
+#     exponential backoff, keeping its client ID, and on_connect is called
+#     again so the owner can re-issue its subscriptions
+#
+# Usage:
+#   pool = ConnectionPool()
+#   app = pool.get("dashboard:U123", lambda: MyApp("U123"), on_connect=subscribe)
+#   ...
+#   pool.close()
+
+import itertools
+import os
+import threading
+import time
+
+from ibapi.client import EClient
+from ibapi.wrapper import EWrapper
+
+HOST = os.environ.get("IB_HOST", "127.0.0.1")
+PORT = int(os.environ.get("IB_PORT", "7496"))
+FIRST_CLIENT_ID = int(os.environ.get("IB_CLIENT_ID", "1"))
+CONNECT_TIMEOUT = 10
+MAX_CLIENT_ID_TRIES = 32
+BACKOFF_SECONDS = 1
+MAX_BACKOFF_SECONDS = 60
+
+CLIENT_ID_IN_USE = 326
+CONNECTIVITY_RESTORED_DATA_LOST = 1101
+
+class IBConnection(EWrapper, EClient):
+  """
+  EClient/EWrapper with connection bookkeeping; subclass it and add the
+  callbacks you need. `ready` is set by nextValidId and cleared when the
+  connection closes.
+  """
+  def __init__(self):
+    EClient.__init__(self, self)
+    self.ready = threading.Event()
+    self.client_id = None
+    self.accounts = []          # from managedAccounts
+    self.next_order_id = None
+    self.on_connect = None      # called with the connection after every (re)connect
+    self.on_disconnect = None   # set by the pool
+    self.established = False      # handshake completed, reconnect if it drops
+    self.client_id_rejected = False
+    self._handshake_over = threading.Event()  # nextValidId, rejection or close
+    self._order_id_lock = threading.Lock()
+
+  def nextValidId(self, orderId: int):
+    self.next_order_id = orderId
+    self.ready.set()
+    self._handshake_over.set()
+
+  def managedAccounts(self, accountsList: str):
+    self.accounts = [account for account in accountsList.split(",") if account]
+
+  def next_id(self):
+    """Next order ID (thread-safe)."""
+    with self._order_id_lock:
+      order_id = self.next_order_id
+      self.next_order_id += 1
+      return order_id
+
+  def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=""):
+    if errorCode == CLIENT_ID_IN_USE:
+      self.client_id_rejected = True
+      self._handshake_over.set()
+    elif errorCode == CONNECTIVITY_RESTORED_DATA_LOST and self.on_connect and self.ready.is_set():
+      # TWS <-> IB servers came back but subscriptions were lost
+      self.on_connect(self)
+    print(f"Error. ReqId: {reqId}, Code: {errorCode}, Msg: {errorString}")
+
+  def connectionClosed(self):
+    self.ready.clear()
+    self._handshake_over.set()
+    if self.on_disconnect:
+      self.on_disconnect(self)
+
+
+class ConnectionPool:
+  """
+  Named, pooled connections to one TWS / IB Gateway, with distinct client IDs.
+  """
+  def __init__(self, host=HOST, port=PORT, first_client_id=FIRST_CLIENT_ID):
+    self.host = host
+    self.port = port
+    self._client_ids = itertools.count(first_client_id)
+    self._lock = threading.Lock()
+    self._connections = {}
+    self._closed = False
+
+  def get(self, name, factory=IBConnection, on_connect=None, timeout=CONNECT_TIMEOUT):
+    """
+    The connection registered under `name`, created with factory() and
+    connected on first use. Raises ConnectionError if TWS does not answer.
+    """
+    with self._lock:
+      app = self._connections.get(name)
+      if app is not None:
+        return app
+      app = factory()
+      app.on_connect = on_connect
+      app.on_disconnect = self._on_disconnect
+      self._connect(app, name, timeout)
+      self._connections[name] = app
+      return app
+
+  def connections(self):
+    with self._lock:
+      return dict(self._connections)
+
+  def _connect(self, app, name, timeout):
+    app.established = False
+    for _ in range(MAX_CLIENT_ID_TRIES):
+      # keep the client ID on reconnect (TWS ties open orders to it)
+      client_id = app.client_id if app.client_id is not None else next(self._client_ids)
+      app.client_id_rejected = False
+      app.ready.clear()
+      app._handshake_over.clear()
+      app.connect(self.host, self.port, client_id)
+      if not app.isConnected():
+        raise ConnectionError(f"Cannot connect to TWS at {self.host}:{self.port}")
+      threading.Thread(target=app.run, name=f"ibapi-{name}", daemon=True).start()
+
+      app._handshake_over.wait(timeout)
+      if app.ready.is_set():
+        app.client_id = client_id
+        app.established = True
+        print(f"Connected '{name}' with clientId={client_id}")
+        if app.on_connect:
+          app.on_connect(app)
+        return
+
+      app.disconnect()
+      if not app.client_id_rejected:
+        raise ConnectionError(f"No nextValidId from TWS within {timeout}s (clientId={client_id})")
+      app.client_id = None  # taken by another process, try the next one
+    raise ConnectionError(f"No free client ID after {MAX_CLIENT_ID_TRIES} tries")
+
+  def _on_disconnect(self, app):
+    # only connections that completed the handshake are re-established
+    if self._closed or not app.established:
+      return
+    app.established = False
+    name = next((n for n, a in self.connections().items() if a is app), "?")
+    threading.Thread(target=self._reconnect, args=(app, name), daemon=True).start()
+
+  def _reconnect(self, app, name):
+    delay = BACKOFF_SECONDS
+    while not self._closed:
+      print(f"Connection '{name}' lost, reconnecting in {delay}s...")
+      time.sleep(delay)
+      try:
+        with self._lock:
+          if not self._closed:
+            self._connect(app, name, CONNECT_TIMEOUT)
+        return
+      except ConnectionError as e:
+        print(f"Reconnect '{name}' failed: {e}")
+        delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+
+  def close(self):
+    self._closed = True
+    for app in self.connections().values():
+      app.disconnect()
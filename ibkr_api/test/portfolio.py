@@ -3,17 +3,22 @@
 # it works
 # this code will display in termianl about your holding and account balance
 
-from ibapi.client import EClient
-from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
+import os
+import sys
 import threading
-import time
 
-class IBKRApp(EWrapper, EClient):
+from ibapi.contract import Contract
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from connection import ConnectionPool, IBConnection
+
+class IBKRApp(IBConnection):
     def __init__(self):
-        EClient.__init__(self, self)
+        IBConnection.__init__(self)
         self.account_data = {}
         self.portfolio_data = []
+        self.summary_done = threading.Event()
+        self.download_done = threading.Event()
 
     def accountSummary(self, reqId: int, account: str, tag: str, value: str, currency: str):
         if account not in self.account_data:
@@ -26,6 +31,7 @@ class IBKRApp(EWrapper, EClient):
             print(f"Account: {account}")
             for tag, (value, currency) in data.items():
                 print(f"  {tag}: {value} {currency}")
+        self.summary_done.set()
 
     def updatePortfolio(self, contract: Contract, position: float, marketPrice: float, marketValue: float,
                         averageCost: float, unrealizedPNL: float, realizedPNL: float, accountName: str):
@@ -45,39 +51,35 @@ class IBKRApp(EWrapper, EClient):
         print(f"Portfolio data for account {accountName}:")
         for item in self.portfolio_data:
             print(item)
-
-    def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=None):
-        print(f"Error. ReqId: {reqId}, Code: {errorCode}, Msg: {errorString}")
-        if advancedOrderRejectJson:
-            print(f"Advanced Order Reject JSON: {advancedOrderRejectJson}")
-
-def run_loop(app):
-    app.run()
+        self.download_done.set()
 
 if __name__ == "__main__":
-    app = IBKRApp()
-    app.connect("127.0.0.1", 7496, clientId=1)
-
-    api_thread = threading.Thread(target=run_loop, args=(app,))
-    api_thread.start()
-
-    time.sleep(1)  # Allow connection to establish
+    # Pooled connection: a free client ID is picked and connect returns once
+    # TWS has sent nextValidId, so this can run next to the dashboard.
+    pool = ConnectionPool()
+    app = pool.get("portfolio", IBKRApp)
+
+    # Account from the command line; without one, only a single managed account is unambiguous
+    if len(sys.argv) > 1:
+        account = sys.argv[1]
+    elif len(app.accounts) == 1:
+        account = app.accounts[0]
+    else:
+        print(f"Usage: python portfolio.py <account>  (TWS manages: {', '.join(app.accounts) or 'none'})")
+        pool.close()
+        sys.exit(1)
 
     # Request account summary for all accounts
     app.reqAccountSummary(9001, "All", "NetLiquidation,TotalCashValue,EquityWithLoanValue")
 
-    # Request portfolio updates for your account ID
-    app.reqAccountUpdates(True, "U19929135")
+    # Request portfolio updates for the account
+    app.reqAccountUpdates(True, account)
 
-    time.sleep(5)  # Allow data to be fetched
+    # Wait for both downloads to finish instead of sleeping
+    app.summary_done.wait(10)
+    app.download_done.wait(10)
 
-    # Stop account summary (if you no longer need updates)
     app.cancelAccountSummary(9001)
+    app.reqAccountUpdates(False, account)
 
-    # Keep portfolio updates running if needed (comment out the next line to keep it active)
-    # app.reqAccountUpdates(False, "U19929135")
-
-    time.sleep(1)  # Allow cancellations to complete
-
-    app.disconnect()
-
+    pool.close()